@@ -1,46 +1,277 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import firebase_admin
-from firebase_admin import credentials, db
 import os
 import sys
 import json
+import time
+import hashlib
+import io
+import threading
+import atexit
+import math
+import tempfile
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-import openai
-from pydantic import BaseModel
+from response_encoding import encode_payload
+from deck_formats import EXTENSIONS, FORMATS, MIMETYPES, RowError, guess_format, iter_export, iter_rows
+from cache import SingleFlight, SqliteCache, TTLCache
+from id_allocator import BlockAllocator
+from write_behind import WriteBehindBuffer
+from rate_limits import UserRateLimiter, client_address
+from jobs import Job, JobQueue, OpenAIRateLimiter, QueueFull, RateLimitTimeout, job_dict
+from text_processing import NearDuplicateFilter, allocate, count_tokens, deck_reference, split_text, spread
+from scheduler import MAX_GRADE, deck_key_range, parse_review_key, review_key, schedule
+import card_limits
+import cascade
+import change_log
+from search import index_updates, query_terms, rank, term_weights
+from logs import get_logger
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
 # from clerk_backend_api import Clerk
 # from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
 from prompt_templates import *
 
 load_dotenv()
-app = Flask(__name__)
-# app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
-# jwt = JWTManager(app)
-CORS(app)
+api = Blueprint('api', __name__)
+log = get_logger()
+
+# metrics, exposed at /metrics
+request_duration = REGISTRY.histogram(
+    'flashsmart_http_request_duration_seconds',
+    "Time to produce the response (streamed bodies excluded), by route, method and status.",
+    ('endpoint', 'method', 'status'))
+firebase_duration = REGISTRY.histogram(
+    'flashsmart_firebase_operation_duration_seconds',
+    "Firebase round trips by operation and top-level node.",
+    ('operation', 'node'))
+firebase_errors = REGISTRY.counter(
+    'flashsmart_firebase_errors',
+    "Failed Firebase round trips by operation and top-level node.",
+    ('operation', 'node'))
+openai_duration = REGISTRY.histogram(
+    'flashsmart_openai_request_duration_seconds',
+    "OpenAI completions by mode (parse or stream), from request to final token.",
+    ('mode',))
+openai_first_flashcard = REGISTRY.histogram(
+    'flashsmart_openai_first_flashcard_seconds',
+    "Time from a streamed OpenAI request to its first complete flashcard.")
+openai_tokens = REGISTRY.counter(
+    'flashsmart_openai_tokens',
+    "OpenAI tokens used, by kind (prompt or completion).",
+    ('kind',))
+openai_errors = REGISTRY.counter(
+    'flashsmart_openai_errors',
+    "Failed OpenAI requests by mode and exception type.",
+    ('mode', 'error'))
+generated_flashcards = REGISTRY.counter(
+    'flashsmart_generated_flashcards',
+    "Generated flashcards by outcome: accepted as written, repaired by a follow-up call, "
+    "or rejected for breaking the card limits.",
+    ('outcome',))
+openai_tokens_per_card = REGISTRY.histogram(
+    'flashsmart_openai_tokens_per_accepted_card',
+    "OpenAI tokens per kept flashcard for each generation, repair calls included.",
+    buckets=(25, 50, 75, 100, 150, 200, 300, 500, 1000, 2000))
+rate_limit_checks = REGISTRY.counter(
+    'flashsmart_rate_limit_checks',
+    "Per-user rate limit checks by route class and outcome (allowed or throttled).",
+    ('route_class', 'outcome'))
 
 # clerk
 # bearer_auth = os.getenv("CLERK_BEARER_TOKEN")
 # clerk = Clerk(bearer_auth=bearer_auth)
 
-# openai
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI()
-
-# firebase
-cred_path = os.path.join('config', os.getenv("FIREBASE_CRED_FN"))
-url = os.getenv("FIREBASE_URL")
-cred = credentials.Certificate(cred_path)
-firebase_admin.initialize_app(cred, {
-    'databaseURL': url
-})
+# openai, created on first use by openai_client()
+client = None
+GENERATION_MODEL = "gpt-4o-mini"
+# rough completion size used to reserve tokens before a call; corrected from usage afterwards
+OUTPUT_TOKENS_PER_CARD = 120
+openai_limiter = OpenAIRateLimiter(
+    requests_per_minute=int(os.getenv("OPENAI_RPM", 500)),
+    tokens_per_minute=int(os.getenv("OPENAI_TPM", 200000)),
+    max_wait=float(os.getenv("OPENAI_LIMIT_WAIT", 30)))
+# generated flashcards breaking the card limits are sent back for a rewrite, only those,
+# up to this many times before they are dropped
+GENERATION_REPAIR_ATTEMPTS = int(os.getenv("GENERATION_REPAIR_ATTEMPTS", 1))
+# largest n a single generation request may ask for
+MAX_GENERATED_FLASHCARDS = int(os.getenv("MAX_GENERATED_FLASHCARDS", 100))
+
+# firebase, initialized on first use by firebase_app()
+_firebase_app = None
+_client_lock = threading.Lock()
+
+# authorization cache: user -> deck IDs and deck -> owner. It is kept per process and only
+# the process that makes a change invalidates it, so other workers and instances may
+# allow access to a removed deck for up to AUTH_CACHE_TTL seconds
+auth_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", 30)))
+
+# generation results: per-process LRU in front of an optional SQLite file shared by all workers
+generation_cache = TTLCache(
+    maxsize=int(os.getenv("GENERATION_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("GENERATION_CACHE_TTL", 3600)))
+generation_disk_cache = SqliteCache(
+    os.getenv("GENERATION_CACHE_DB"),
+    ttl=float(os.getenv("GENERATION_CACHE_TTL", 3600))) if os.getenv("GENERATION_CACHE_DB") else None
+generation_flight = SingleFlight()
+
+# background generation jobs. Jobs run in the worker that accepted them, but their state is
+# kept at generation_jobs/{job} so any worker or instance can report or cancel them. /get-job
+# waits at most GENERATION_JOB_WAIT_LIMIT seconds for a job to finish, which ties up the
+# request's thread; records are dropped GENERATION_JOB_RETENTION seconds after their last update
+GENERATION_JOB_WAIT_LIMIT = float(os.getenv("GENERATION_JOB_WAIT_LIMIT", 2))
+GENERATION_JOB_RETENTION = float(os.getenv("GENERATION_JOB_RETENTION", 24 * 3600))
+generation_queue = JobQueue(
+    max_workers=int(os.getenv("GENERATION_JOB_WORKERS", 4)),
+    max_depth=int(os.getenv("GENERATION_QUEUE_DEPTH", 32)),
+    on_update=lambda job: save_generation_job(job))
+_generation_jobs_pruned = 0
+
+# deck IDs are reserved from deck_counter in blocks, so creating a deck rarely touches the
+# shared counter
+deck_id_allocator = BlockAllocator(
+    lambda count: reserve_deck_ids(count),
+    block_size=int(os.getenv("DECK_ID_BLOCK_SIZE", 50)))
+
+# write-behind for /edit-flashcard, off by default. Edits are merged per card in memory,
+# last write winning, and each deck's are written as one update EDIT_FLUSH_SECONDS after
+# its first pending edit or once EDIT_FLUSH_MAX cards are pending. Pending edits live in
+# the worker that took them: they are lost if it crashes, and only that worker's
+# /get-flashcards responses show them before they are written. They are flushed at exit.
+# A failed write is retried with backoff, and logged and dropped after EDIT_FLUSH_ATTEMPTS
+WRITE_BEHIND_EDITS = os.getenv("WRITE_BEHIND_EDITS") == "1"
+edit_buffer = WriteBehindBuffer(
+    lambda deck_id, edits: write_flashcard_edits(deck_id, edits),
+    window=float(os.getenv("EDIT_FLUSH_SECONDS", 0.5)),
+    max_pending=int(os.getenv("EDIT_FLUSH_MAX", 50)),
+    max_attempts=int(os.getenv("EDIT_FLUSH_ATTEMPTS", 5)),
+    on_drop=lambda deck_id, edits, error: log.exception(
+        'edits_dropped', deck_id=deck_id, flashcard_ids=sorted(edits)))
+atexit.register(edit_buffer.close)
+
+# per-user rate limits by route class, as requests per minute and burst. The buckets are
+# kept in RATE_LIMIT_DB, a SQLite file shared by every worker on the machine, or in each
+# worker's memory when it is set to "". RATE_LIMITS_ENABLED=0 turns limiting off
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "1") == "1"
+# requests without a user_id are limited per client address, read from X-Forwarded-For
+# behind RATE_LIMIT_PROXY_HOPS proxies. App Engine's front end adds two entries, the
+# client's address and its load balancer's; set it to 0 when nothing sits in front
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 2))
+rate_limiter = UserRateLimiter({
+    'generation': (int(os.getenv("RATE_LIMIT_GENERATION_PER_MINUTE", 10)),
+                   int(os.getenv("RATE_LIMIT_GENERATION_BURST", 5))),
+    'bulk_write': (int(os.getenv("RATE_LIMIT_BULK_WRITE_PER_MINUTE", 30)),
+                   int(os.getenv("RATE_LIMIT_BULK_WRITE_BURST", 10))),
+    'write': (int(os.getenv("RATE_LIMIT_WRITE_PER_MINUTE", 600)),
+              int(os.getenv("RATE_LIMIT_WRITE_BURST", 120))),
+    'read': (int(os.getenv("RATE_LIMIT_READ_PER_MINUTE", 1200)),
+             int(os.getenv("RATE_LIMIT_READ_BURST", 240)))},
+    path=os.getenv("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), 'flashsmart-rate-limits.db')))
+RATE_LIMIT_CLASSES = {
+    'generate_flashcards_endpoint': 'generation',
+    'submit_generation_job_endpoint': 'generation',
+    'add_flashcards_endpoint': 'bulk_write',
+    'import_flashcards_endpoint': 'bulk_write',
+    'add_user_endpoint': 'write',
+    'delete_user_endpoint': 'write',
+    'delete_deck_endpoint': 'write',
+    'get_deletion_job_endpoint': 'read',
+    'create_deck_endpoint': 'write',
+    'modify_deck_endpoint': 'write',
+    'add_deck_to_user_endpoint': 'write',
+    'remove_deck_from_user_endpoint': 'write',
+    'add_flashcard_endpoint': 'write',
+    'edit_flashcard_endpoint': 'write',
+    'delete_flashcard_endpoint': 'write',
+    'review_endpoint': 'write',
+    'cancel_job_endpoint': 'write',
+    'get_decks_endpoint': 'read',
+    'get_flashcards_endpoint': 'read',
+    'sync_deck_endpoint': 'read',
+    'export_deck_endpoint': 'read',
+    'search_endpoint': 'read',
+    'due_flashcards_endpoint': 'read',
+    'get_job_endpoint': 'read',
+}
+
+# flashcards imported from a file are written in batches of this size
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+
+# exports read the deck from Firebase one page of this many flashcards at a time
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 500))
+
+# /get-flashcards pages hold at most this many flashcards, whatever limit asks for
+FLASHCARDS_PAGE_LIMIT = int(os.getenv("FLASHCARDS_PAGE_LIMIT", 500))
+
+# /get-decks and /get-flashcards bodies smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+
+# bounded pool for fanning out independent Firebase reads
+firebase_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FIREBASE_FANOUT_WORKERS", 8)))
+
+# /generate-flashcards with a deck_id builds the reference from the deck itself: up to
+# REFERENCE_SAMPLE_SIZE cards read in REFERENCE_SAMPLE_WINDOWS runs spread over the deck,
+# cut to REFERENCE_TOKEN_BUDGET tokens. References are cached per deck version
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", 1500))
+REFERENCE_SAMPLE_SIZE = int(os.getenv("REFERENCE_SAMPLE_SIZE", 60))
+REFERENCE_SAMPLE_WINDOWS = int(os.getenv("REFERENCE_SAMPLE_WINDOWS", 6))
+reference_cache = TTLCache(
+    maxsize=int(os.getenv("REFERENCE_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("REFERENCE_CACHE_TTL", 3600)))
+
+# long source texts are split into chunks generated in parallel
+SOURCE_CHUNK_TOKENS = int(os.getenv("SOURCE_CHUNK_TOKENS", 3000))
+chunk_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("GENERATION_CHUNK_WORKERS", 4)))
+
+# /due-flashcards returns at most this many cards per request
+DUE_FLASHCARDS_LIMIT = int(os.getenv("DUE_FLASHCARDS_LIMIT", 100))
+
+# search reads at most this many postings per query term, best-weighted first, so query
+# cost does not grow with the number of cards; /search pages hold at most SEARCH_PAGE_LIMIT hits
+SEARCH_POSTINGS_LIMIT = int(os.getenv("SEARCH_POSTINGS_LIMIT", 1000))
+SEARCH_PAGE_LIMIT = int(os.getenv("SEARCH_PAGE_LIMIT", 50))
+
+# delta sync: every deck write is logged at deck_changes/{deck}/{revision}. The log keeps
+# about the last DECK_CHANGE_LOG_SIZE revisions; /sync-deck sends a full snapshot to clients
+# further behind, or when more than SYNC_MAX_CHANGES flashcards changed since their revision
+DECK_CHANGE_LOG_SIZE = int(os.getenv("DECK_CHANGE_LOG_SIZE", 500))
+DECK_CHANGE_COMPACT_EVERY = int(os.getenv("DECK_CHANGE_COMPACT_EVERY", 50))
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", 200))
+# a revision still missing this long after a later one was logged belongs to a failed write
+SYNC_SETTLE_MS = int(os.getenv("SYNC_SETTLE_MS", 60000))
+
+# users and decks are deleted by background jobs recorded at deletion_jobs/{job}, which
+# remove at most DELETION_BATCH_SIZE entries, and DELETION_MAX_PATHS paths, per write. A
+# job its worker has not advanced for DELETION_STALE_SECONDS is taken over by another
+# worker, at most DELETION_MAX_ATTEMPTS times. Finished jobs are kept for DELETION_JOB_RETENTION.
+# Workers look for stale jobs, and expired ones, DELETION_RESUME_BATCH jobs at a time
+DELETION_BATCH_SIZE = int(os.getenv("DELETION_BATCH_SIZE", 500))
+DELETION_MAX_PATHS = int(os.getenv("DELETION_MAX_PATHS", 5000))
+DELETION_STALE_SECONDS = float(os.getenv("DELETION_STALE_SECONDS", 120))
+DELETION_MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", 5))
+DELETION_JOB_RETENTION = float(os.getenv("DELETION_JOB_RETENTION", 7 * 24 * 3600))
+DELETION_RESUME_BATCH = int(os.getenv("DELETION_RESUME_BATCH", 50))
+deletion_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DELETION_WORKERS", 1)))
+
+SERVER_TIMESTAMP = {'.sv': 'timestamp'}
+
+
+def server_increment(delta):
+    return {'.sv': {'increment': delta}}
 
 
 class Flashcard:
-    TITLE_LENGTH_LIMIT = 50
-    FRONT_TEXT_LIMIT = 200
-    BACK_TEXT_LIMIT = 200
-    FRONT_IMAGE_TEXT_LIMIT = 100
-    BACK_IMAGE_TEXT_LIMIT = 100
+    TITLE_LENGTH_LIMIT = card_limits.TITLE_LENGTH_LIMIT
+    FRONT_TEXT_LIMIT = card_limits.FRONT_TEXT_LIMIT
+    BACK_TEXT_LIMIT = card_limits.BACK_TEXT_LIMIT
+    FRONT_IMAGE_TEXT_LIMIT = card_limits.FRONT_IMAGE_TEXT_LIMIT
+    BACK_IMAGE_TEXT_LIMIT = card_limits.BACK_IMAGE_TEXT_LIMIT
 
     def __init__(self, id=None, title=None, front=None, back=None,
                  front_image_url=None, back_image_url=None):
@@ -104,26 +335,118 @@ class Flashcard:
         return f"Flashcard\nID: {self.id}\nTitle: {self.title}\nFront: {self.front}\nBack: {self.back}\nFront Image: {self.front_image_url}\nBack Image:{self.back_image_url}"
 
 
-class FlashcardSchema(BaseModel):
-    id: int
-    title: str
-    front: str
-    back: str
-    front_image_url: str
-    back_image_url: str
+def create_app():
+    """
+    Builds the Flask app. Nothing here connects to Firebase or OpenAI: their clients,
+    and the libraries behind them, are loaded by the first request that needs them.
+    Under gunicorn --preload the master imports this module once and every forked
+    worker creates its own clients.
+    """
+    flask_app = Flask(__name__)
+    # flask_app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
+    # jwt = JWTManager(flask_app)
+    CORS(flask_app)
+    flask_app.register_blueprint(api)
+    return flask_app
+
+
+def openai_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                import openai
+                client = openai.OpenAI()
+    return client
+
+
+def firebase_app():
+    """
+    Returns the Firebase Admin app, reading the service account and initializing the SDK
+    on the first call.
+    """
+    global _firebase_app
+    if _firebase_app is None:
+        with _client_lock:
+            if _firebase_app is None:
+                import firebase_admin
+                from firebase_admin import credentials
+                cred = credentials.Certificate(os.path.join('config', os.getenv("FIREBASE_CRED_FN")))
+                _firebase_app = firebase_admin.initialize_app(cred, {
+                    'databaseURL': os.getenv("FIREBASE_URL")
+                })
+    return _firebase_app
+
+
+def warm_imports():
+    """
+    Imports the Firebase, OpenAI and pydantic libraries without creating any clients. Run
+    in the gunicorn master before forking (PRELOAD_CLIENT_LIBRARIES=1), so workers share
+    the loaded modules instead of each importing them on its first request.
+    """
+    import firebase_admin.db
+    import openai
+    import schemas
 
 
-class FlashcardCollection(BaseModel):
-    flashcards: list[FlashcardSchema]
+# ========= ENDPOINTS =========
+@api.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
 
 
-# ========= ENDPOINTS =========
-@app.route('/hello', methods=['POST'])
+@api.before_app_request
+def enforce_rate_limit():
+    route_class = RATE_LIMIT_CLASSES.get((request.endpoint or '').rpartition('.')[2])
+    if not RATE_LIMITS_ENABLED or route_class is None:
+        return None
+    data = request.get_json(silent=True) if request.is_json else None
+    user_id = request.args.get('user_id') or (data or {}).get('user_id') or 'client:' + str(
+        client_address(request.headers.get('X-Forwarded-For'), request.remote_addr,
+                       RATE_LIMIT_PROXY_HOPS))
+    retry_after = rate_limit(user_id, route_class)
+    if retry_after:
+        return jsonify({'error': 'Too many requests, try again later.'}), 429, \
+            {'Retry-After': str(retry_after)}
+    return None
+
+
+def rate_limit(user_id, route_class):
+    """
+    Checks the user's rate limit for route_class. Returns 0 if the request may proceed,
+    otherwise the whole seconds to wait, for Retry-After.
+    """
+    wait = rate_limiter.check(user_id, route_class)
+    if not wait:
+        rate_limit_checks.inc(route_class=route_class, outcome='allowed')
+        return 0
+    rate_limit_checks.inc(route_class=route_class, outcome='throttled')
+    log.info('rate_limited', user_id=user_id, route_class=route_class, retry_after=wait)
+    return max(1, math.ceil(wait))
+
+
+@api.after_app_request
+def record_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        request_duration.observe(
+            time.perf_counter() - start,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method, status=response.status_code)
+    return response
+
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE), 200
+
+
+@api.route('/hello', methods=['POST'])
 def hello():
     return jsonify({'hello': 'world'}), 200
 
 
-@app.route('/add-user', methods=['POST'])
+@api.route('/add-user', methods=['POST'])
 # @jwt_required()
 def add_user_endpoint():
     data = request.json
@@ -133,18 +456,18 @@ def add_user_endpoint():
     return jsonify({'user_id': new_user_id}), 200
 
 
-@app.route('/delete-user', methods=['POST'])
+@api.route('/delete-user', methods=['POST'])
 # @jwt_required()
 def delete_user_endpoint():
     data = request.json
     clerk_user_id = data.get('user_id')
     if not verify_user_exists(clerk_user_id):
         return jsonify({'error': 'Invalid user credentials.'}), 401
-    deleted_user_id = delete_user(clerk_user_id)
-    return jsonify({'user_id': deleted_user_id}), 200
+    job_id = delete_user(clerk_user_id)
+    return jsonify({'user_id': clerk_user_id, 'job_id': job_id}), 202
 
 
-@app.route('/create-deck', methods=['POST'])
+@api.route('/create-deck', methods=['POST'])
 # @jwt_required()
 def create_deck_endpoint():
     data = request.json
@@ -158,7 +481,7 @@ def create_deck_endpoint():
     return jsonify({'deck_id': new_deck_id}), 200
 
 
-@app.route('/modify-deck', methods=['POST'])
+@api.route('/modify-deck', methods=['POST'])
 # @jwt_required()
 def modify_deck_endpoint():
     data = request.json
@@ -175,7 +498,35 @@ def modify_deck_endpoint():
     return jsonify({'deck_id': updated_deck_id}), 200
 
 
-@app.route('/add-deck-to-user', methods=['POST'])
+@api.route('/delete-deck', methods=['POST'])
+# @jwt_required()
+def delete_deck_endpoint():
+    data = request.json
+    clerk_user_id = data.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    deck_id = data.get('deck_id')
+    if not verify_user_has_deck(clerk_user_id, deck_id):
+        return jsonify(
+            {'error': 'User does not have access to this deck.'}), 403
+    job_id = delete_deck(deck_id)
+    return jsonify({'deck_id': deck_id, 'job_id': job_id}), 202
+
+
+@api.route('/get-deletion-job', methods=['GET'])
+# @jwt_required()
+def get_deletion_job_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    job_id = request.args.get('job_id') or ''
+    job = ref(f'deletion_jobs/{job_id}').get() if job_id.isalnum() else None
+    if not job or job.get('user_id') != clerk_user_id:
+        return jsonify({'error': 'Job does not exist.'}), 404
+    if resume_deletion_job(job_id, job):
+        job = ref(f'deletion_jobs/{job_id}').get() or job
+    return jsonify(deletion_job_dict(job_id, job)), 200
+
+
+@api.route('/add-deck-to-user', methods=['POST'])
 # @jwt_required()
 def add_deck_to_user_endpoint():
     data = request.json
@@ -187,7 +538,7 @@ def add_deck_to_user_endpoint():
     return jsonify({'deck_id': added_deck_id}), 200
 
 
-@app.route('/remove-deck-from-user', methods=['POST'])
+@api.route('/remove-deck-from-user', methods=['POST'])
 # @jwt_required()
 def remove_deck_from_user_endpoint():
     data = request.json
@@ -199,26 +550,69 @@ def remove_deck_from_user_endpoint():
     return jsonify({'deck_id': removed_deck_id}), 200
 
 
-@app.route('/get-decks', methods=['GET'])
+@api.route('/get-decks', methods=['GET'])
 # @jwt_required()
 def get_decks_endpoint():
     clerk_user_id = request.args.get('user_id')
     if not verify_user_exists(clerk_user_id):
         return jsonify({'error': 'Invalid user credentials.'}), 401
     decks = get_decks(clerk_user_id)
-    return jsonify({'decks': decks}), 200
+    return negotiated_response({'decks': decks}), 200
 
 
-@app.route('/get-flashcards', methods=['GET'])
+@api.route('/get-flashcards', methods=['GET'])
 def get_flashcards_endpoint():
-    deck_id = request.args.get('deck_id')
-    flashcards = get_flashcards(deck_id)
-    if not flashcards:
+    deck_id = deck_id_arg()
+    limit = request.args.get('limit')
+    if limit is not None:
+        limit = positive_int(limit)
+        if limit is None:
+            return jsonify({'error': 'limit must be a positive integer.'}), 400
+        limit = min(limit, FLASHCARDS_PAGE_LIMIT)
+    after = request.args.get('after')
+    etag = get_deck_etag(deck_id)
+    pending = edit_buffer.pending(str(deck_id)) if WRITE_BEHIND_EDITS else {}
+    if pending:
+        # the deck revision does not cover edits that are not written yet
+        etag = None
+    # the tag names the deck revision, not one encoding of it, so it is weak
+    if etag and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    if limit:
+        page = get_flashcards_page(deck_id, limit, after)
+        if page is None:
+            return jsonify({'error': 'Deck does not exist.'}), 404
+        flashcards, next_after = page
+        flashcards = overlay_pending_edits(flashcards, pending)
+        response = negotiated_response({'flashcards': flashcards, 'next_after': next_after})
+    else:
+        flashcards = get_flashcards(deck_id)
+        if not flashcards:
+            return jsonify({'error': 'Deck does not exist.'}), 404
+        if pending:
+            flashcards = dict(flashcards, flashcards=overlay_pending_edits(
+                flashcards.get('flashcards'), pending))
+        response = negotiated_response({'flashcards': flashcards})
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response, 200
+
+
+@api.route('/sync-deck', methods=['GET'])
+# @jwt_required()
+def sync_deck_endpoint():
+    deck_id = deck_id_arg()
+    since = request.args.get('since', type=int)
+    changes = sync_deck(deck_id, since)
+    if changes is None:
         return jsonify({'error': 'Deck does not exist.'}), 404
-    return jsonify({'flashcards': flashcards}), 200
+    return negotiated_response(changes), 200
 
 
-@app.route('/add-flashcard', methods=['POST'])
+@api.route('/add-flashcard', methods=['POST'])
 # @jwt_required()
 def add_flashcard_endpoint():
     data = request.json
@@ -234,7 +628,7 @@ def add_flashcard_endpoint():
     return jsonify({'flashcard_id': new_flashcard_id}), 200
 
 
-@app.route('/add-flashcards', methods=['POST'])
+@api.route('/add-flashcards', methods=['POST'])
 # @jwt_required()
 def add_flashcards_endpoint():
     data = request.json
@@ -245,15 +639,83 @@ def add_flashcards_endpoint():
     if not verify_user_has_deck(clerk_user_id, deck_id):
         return jsonify(
             {'error': 'User does not have access to this deck.'}), 403
-    flashcards_json = data.get('flashcards')
-    new_flashcard_ids = []
-    for flashcard_json in flashcards_json:
-        new_flashcard_id = add_flashcard(deck_id, flashcard_json)
-        new_flashcard_ids.append(new_flashcard_id)
+    flashcards_json = data.get('flashcards') or []
+    new_flashcard_ids = add_flashcards(deck_id, flashcards_json)
     return jsonify({'flashcard_ids': new_flashcard_ids}), 200
 
 
-@app.route('/edit-flashcard', methods=['POST'])
+@api.route('/import-flashcards', methods=['POST'])
+# @jwt_required()
+def import_flashcards_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    deck_id = deck_id_arg()
+    if not verify_user_has_deck(clerk_user_id, deck_id):
+        return jsonify(
+            {'error': 'User does not have access to this deck.'}), 403
+    upload = request.files.get('file')
+    if upload is not None:
+        # the request closes its uploaded files when the view returns, before the
+        # response below is streamed, so take ownership of the spooled upload
+        stream = upload.stream
+        upload.stream = io.BytesIO()
+        fmt = request.args.get('format') or guess_format(upload.filename, upload.mimetype)
+    else:
+        stream = io.BufferedReader(request.stream)
+        fmt = request.args.get('format') or guess_format(
+            request.args.get('filename'), request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify(
+            {'error': f"Unknown import format, expected one of {', '.join(FORMATS)}."}), 400
+
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+    def generate():
+        try:
+            for event in import_flashcards(deck_id, iter_rows(lines, fmt)):
+                yield json.dumps(event) + "\n"
+        finally:
+            lines.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@api.route('/export-deck', methods=['GET'])
+# @jwt_required()
+def export_deck_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    deck_id = deck_id_arg()
+    if not verify_user_has_deck(clerk_user_id, deck_id):
+        return jsonify(
+            {'error': 'User does not have access to this deck.'}), 403
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify(
+            {'error': f"Unknown export format, expected one of {', '.join(FORMATS)}."}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    filename = f"deck-{deck_id}.{EXTENSIONS[fmt]}"
+    body = (chunk.encode() for chunk in iter_export(iter_deck_pages(deck_id), fmt))
+    if compress:
+        filename += '.gz'
+        body = gzip_stream(body)
+    return Response(stream_with_context(body),
+                    mimetype='application/gzip' if compress else MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+def gzip_stream(chunks):
+    # each chunk is flushed, or zlib would hold back up to its window of output
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+@api.route('/edit-flashcard', methods=['POST'])
 # @jwt_required()
 def edit_flashcard_endpoint():
     data = request.json
@@ -266,11 +728,14 @@ def edit_flashcard_endpoint():
             {'error': 'User does not have access to this deck.'}), 403
     flashcard_id = data.get('flashcard_id')
     flashcard_json = data.get('flashcard')
-    edited_flashcard_id = edit_flashcard(deck_id, flashcard_id, flashcard_json)
+    if WRITE_BEHIND_EDITS:
+        edited_flashcard_id = buffer_flashcard_edit(deck_id, flashcard_id, flashcard_json)
+    else:
+        edited_flashcard_id = edit_flashcard(deck_id, flashcard_id, flashcard_json)
     return jsonify({'flashcard_id': edited_flashcard_id}), 200
 
 
-@app.route('/delete-flashcard', methods=['POST'])
+@api.route('/delete-flashcard', methods=['POST'])
 # @jwt_required()
 def delete_flashcard_endpoint():
     data = request.json
@@ -287,291 +752,1596 @@ def delete_flashcard_endpoint():
     return jsonify({'flashcard_id': deleted_flashcard_id}), 200
 
 
-@app.route('/generate-flashcards', methods=['POST'])
+@api.route('/review', methods=['POST'])
+# @jwt_required()
+def review_endpoint():
+    data = request.json
+    clerk_user_id = data.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    deck_id = data.get('deck_id')
+    if not verify_user_has_deck(clerk_user_id, deck_id):
+        return jsonify(
+            {'error': 'User does not have access to this deck.'}), 403
+    grade = data.get('grade')
+    if isinstance(grade, bool) or not isinstance(grade, int) or not 0 <= grade <= MAX_GRADE:
+        return jsonify({'error': f'Grade must be an integer from 0 to {MAX_GRADE}.'}), 400
+    flashcard_id = data.get('flashcard_id')
+    state = review_flashcard(clerk_user_id, deck_id, flashcard_id, grade)
+    if state is None:
+        return jsonify({'error': 'Flashcard does not exist.'}), 404
+    return jsonify({'flashcard_id': flashcard_id, 'review': state}), 200
+
+
+@api.route('/search', methods=['GET'])
+# @jwt_required()
+def search_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), SEARCH_PAGE_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    hits, next_offset = search_flashcards(clerk_user_id, query, limit, offset)
+    return jsonify({'hits': hits, 'next_offset': next_offset}), 200
+
+
+@api.route('/due-flashcards', methods=['GET'])
+# @jwt_required()
+def due_flashcards_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    limit = min(max(request.args.get('limit', 20, type=int), 1), DUE_FLASHCARDS_LIMIT)
+    return jsonify({'flashcards': get_due_flashcards(clerk_user_id, limit)}), 200
+
+
+@api.route('/generate-flashcards', methods=['POST'])
 def generate_flashcards_endpoint():
     data = request.json
     clerk_user_id = data.get('user_id')
     if not verify_user_exists(clerk_user_id):
         return jsonify({'error': 'Invalid user credentials.'}), 401
-    n = data.get('n')
+    n = positive_int(data.get('n'))
+    if n is None:
+        return jsonify({'error': 'n must be a positive integer.'}), 400
+    if n > MAX_GENERATED_FLASHCARDS:
+        return jsonify({'error': f'n must be at most {MAX_GENERATED_FLASHCARDS}.'}), 400
     topic = data.get('topic')
     reference = data.get('reference')
-    flashcards = generate_flashcards(n, topic, reference)
+    text = data.get('text')
+    fresh = bool(data.get('fresh'))
+    if data.get('deck_id') is not None and not reference:
+        if not verify_user_has_deck(clerk_user_id, data.get('deck_id')):
+            return jsonify(
+                {'error': 'User does not have access to this deck.'}), 403
+        reference = build_deck_reference(data.get('deck_id'))
+        if reference is None:
+            return jsonify({'error': 'Deck does not exist.'}), 404
+    if request.args.get('stream') in ('1', 'true'):
+        return stream_flashcards_response(
+            stream_flashcards_cached(n, topic, reference, text, fresh))
+    try:
+        flashcards = generate_flashcards_cached(n, topic, reference, text, fresh)
+    except RateLimitTimeout:
+        return jsonify({'error': 'Generation capacity exceeded, try again later.'}), 429
     flashcards = [flashcard.model_dump() for flashcard in flashcards]
     return jsonify({'flashcards': flashcards}), 200
 
 
+@api.route('/submit-generation-job', methods=['POST'])
+def submit_generation_job_endpoint():
+    data = request.json
+    clerk_user_id = data.get('user_id')
+    if not verify_user_exists(clerk_user_id):
+        return jsonify({'error': 'Invalid user credentials.'}), 401
+    n = positive_int(data.get('n'))
+    if n is None:
+        return jsonify({'error': 'n must be a positive integer.'}), 400
+    if n > MAX_GENERATED_FLASHCARDS:
+        return jsonify({'error': f'n must be at most {MAX_GENERATED_FLASHCARDS}.'}), 400
+    reference = data.get('reference')
+    if data.get('deck_id') is not None and not reference:
+        if not verify_user_has_deck(clerk_user_id, data.get('deck_id')):
+            return jsonify(
+                {'error': 'User does not have access to this deck.'}), 403
+        reference = build_deck_reference(data.get('deck_id'))
+        if reference is None:
+            return jsonify({'error': 'Deck does not exist.'}), 404
+    try:
+        job = generation_queue.submit(
+            clerk_user_id, 'generate-flashcards', run_generation_job,
+            n, data.get('topic'), reference,
+            data.get('text'), bool(data.get('fresh')))
+    except QueueFull:
+        return jsonify({'error': 'Too many generation jobs queued, try again later.'}), 429, \
+            {'Retry-After': '5'}
+    prune_generation_jobs()
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+
+@api.route('/get-job', methods=['GET'])
+def get_job_endpoint():
+    clerk_user_id = request.args.get('user_id')
+    job_id = request.args.get('job_id') or ''
+    wait = min(request.args.get('wait', 0, type=float), GENERATION_JOB_WAIT_LIMIT)
+    if wait > 0:
+        # only a job running in this worker can be waited on
+        generation_queue.wait(job_id, wait)
+    record = ref(f'generation_jobs/{job_id}').get() if job_id.isalnum() else None
+    if not record or record.get('owner') != clerk_user_id:
+        return jsonify({'error': 'Job does not exist.'}), 404
+    return jsonify(job_dict(job_id, record)), 200
+
+
+@api.route('/cancel-job', methods=['POST'])
+def cancel_job_endpoint():
+    data = request.json
+    clerk_user_id = data.get('user_id')
+    job_id = str(data.get('job_id') or '')
+
+    def cancel(current):
+        if not current or current.get('owner') != clerk_user_id or \
+                current['status'] not in (Job.QUEUED, Job.RUNNING):
+            return current
+        current['status'] = Job.CANCELLED
+        current['finished_at'] = time.time()
+        current['updated_at'] = now_ms()
+        return current
+
+    record = ref(f'generation_jobs/{job_id}').transaction(cancel) if job_id.isalnum() else None
+    if not record or record.get('owner') != clerk_user_id:
+        return jsonify({'error': 'Job does not exist.'}), 404
+    # a job running in another worker sees the cancellation when it starts or finishes
+    generation_queue.cancel(job_id)
+    return jsonify(job_dict(job_id, record)), 200
+
+
+def stream_flashcards_response(flashcards):
+    """
+    Streams the flashcards yielded by a generator one per message as NDJSON, or as Server-Sent Events
+    when the client asks for text/event-stream. The last message is either
+    {"done": true, "count": ...} or {"error": ...}.
+    """
+    sse = request.accept_mimetypes.best_match(
+        ['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+
+    def encode(message):
+        if sse:
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    def generate():
+        count = 0
+        try:
+            for flashcard in flashcards:
+                count += 1
+                yield encode({'flashcard': flashcard.model_dump()})
+        except Exception:
+            log.exception('flashcard_stream_failed', flashcards_sent=count)
+            yield encode({'error': 'Flashcard generation failed.'})
+            return
+        yield encode({'done': True, 'count': count})
+
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/cache-stats', methods=['GET'])
+def cache_stats_endpoint():
+    generation_stats = generation_cache.stats()
+    generation_stats['merged_requests'] = generation_flight.merged
+    if generation_disk_cache is not None:
+        generation_stats['disk'] = generation_disk_cache.stats()
+    return jsonify({'auth_cache': auth_cache.stats(),
+                    'generation_cache': generation_stats,
+                    'generation_queue': generation_queue.stats(),
+                    'edit_buffer': edit_buffer.stats(),
+                    'rate_limiter_errors': rate_limiter.errors}), 200
+
+
+def negotiated_response(payload):
+    """
+    Returns payload as JSON, or as MessagePack if the client prefers it, compressed with
+    brotli or gzip per Accept-Encoding once the body reaches COMPRESSION_MIN_BYTES.
+    """
+    body, mimetype, content_encoding = encode_payload(
+        payload, request.headers.get('Accept'), request.headers.get('Accept-Encoding'),
+        COMPRESSION_MIN_BYTES)
+    response = Response(body, mimetype=mimetype)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def deck_id_arg(name='deck_id'):
+    """
+    Reads a deck ID from the query string. Deck IDs are integers, so numeric strings are converted.
+    """
+    deck_id = request.args.get(name)
+    return int(deck_id) if deck_id and deck_id.isdigit() else deck_id
+
+
+def positive_int(value):
+    """
+    Returns value, a number or numeric string from a request, as a positive int, or
+    None if it is not one.
+    """
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        return None
+    return value
+
+
 # ========= FIREBASE =========
+def observe_firebase(operation, path, seconds, failed=False):
+    node = str(path or '').strip('/').split('/', 1)[0] or 'root'
+    firebase_duration.observe(seconds, operation=operation, node=node)
+    if failed:
+        firebase_errors.inc(operation=operation, node=node)
+
+
+class TimedReference:
+    """
+    Wraps a firebase_admin Reference or Query so each round trip is recorded in the
+    Firebase metrics. Queries built from a reference are wrapped as well.
+    """
+    OPERATIONS = ('get', 'set', 'update', 'delete', 'push', 'transaction')
+    QUERY_METHODS = ('order_by_key', 'order_by_value', 'order_by_child', 'start_at', 'end_at',
+                     'equal_to', 'limit_to_first', 'limit_to_last')
+
+    def __init__(self, target, path, query=False):
+        self._target = target
+        self._path = path
+        self._query = query
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in TimedReference.QUERY_METHODS:
+            return lambda *args, **kwargs: TimedReference(
+                attribute(*args, **kwargs), self._path, query=True)
+        if name == 'child':
+            return lambda path: TimedReference(attribute(path), f'{self._path}/{path}')
+        if name not in TimedReference.OPERATIONS:
+            return attribute
+        operation = 'query' if self._query else name
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception:
+                observe_firebase(operation, self._path, time.perf_counter() - start, failed=True)
+                raise
+            observe_firebase(operation, self._path, time.perf_counter() - start)
+            return result
+        return timed
+
+
+def ref(path='/'):
+    """
+    Returns db.reference(path) wrapped so that its round trips are recorded in the metrics.
+    """
+    firebase_app()
+    from firebase_admin import db
+    return TimedReference(db.reference(path), path)
+
+
 def add_user(clerk_user_id, name):
     name = name[:30]
-    user_ref = db.reference(f'users/{clerk_user_id}')
+    user_ref = ref(f'users/{clerk_user_id}')
     user_ref.set({
         'name': name,
         'decks': [],
     })
-    print(
-        f"New user {name} added with Clerk ID {clerk_user_id}. User initialized with empty flashcard collection.")
+    auth_cache.invalidate(('user', clerk_user_id))
+    log.info('user_added', user_id=clerk_user_id)
     return clerk_user_id
 
 
+def get_user_decks(user_id):
+    """
+    Returns the deck IDs associated with the user, or None if the user does not exist.
+    Only existing users are cached so that a freshly added user is never rejected.
+    """
+    key = ('user', user_id)
+    decks = auth_cache.get(key)
+    if decks is None:
+        user_data = ref(f'users/{user_id}').get()
+        if not user_data:
+            return None
+        decks = frozenset(user_data.get('decks') or [])
+        auth_cache.set(key, decks)
+    return decks
+
+
+def get_deck_owner(deck_id):
+    """
+    Returns the owner of the deck, or None if the deck does not exist. Reads only the owner field.
+    """
+    # deck IDs arrive as ints in JSON bodies and as strings in query strings
+    key = ('owner', str(deck_id))
+    owner = auth_cache.get(key)
+    if owner is None:
+        owner = ref(f'decks/{deck_id}/owner').get()
+        if owner is None:
+            return None
+        auth_cache.set(key, owner)
+    return owner
+
+
 def verify_user_exists(user_id):
-    user_ref = db.reference(f'users/{user_id}')
-    user_data = user_ref.get()
-    if user_data:
+    if get_user_decks(user_id) is not None:
         return True
     else:
-        print(f"User {user_id} does not exist.")
+        log.info('user_not_found', user_id=user_id)
         return False
 
 
 def delete_user(user_id):
-    user_ref = db.reference(f'users/{user_id}')
-    user_data = user_ref.get()
-    if user_data:
-        user_ref.delete()
-        print(
-            f"User {user_id} and all associated flashcards have been deleted.")
-        return user_id
-    else:
-        print(f"User {user_id} does not exist.")
+    """
+    Removes the user at once and starts a background job deleting the decks they own and
+    their reviews, due index and search index. Returns the job ID, or None if the user
+    does not exist.
+    """
+    user_data = ref(f'users/{user_id}').get()
+    if not user_data:
+        log.info('user_not_found', user_id=user_id)
         return None
-
-
-def create_deck(user_id, deck_name, description=""):
+    # decks the user removed from their list are only found through deck_meta, and
+    # decks that predate deck_meta only through the list
+    indexed = firebase_executor.submit(
+        lambda: ref('deck_meta').order_by_child('owner').equal_to(user_id).get())
+    deck_ids = list(user_data.get('decks') or [])
+    owners = firebase_executor.map(get_deck_owner, deck_ids)
+    owned = {int(deck_id) for deck_id, owner in zip(deck_ids, owners) if owner == user_id}
+    owned.update(int(deck_id) for deck_id in indexed.result() or {})
+    owned = sorted(owned)
+    for deck_id in owned:
+        edit_buffer.discard(str(deck_id))
+    job_id = start_deletion({'kind': 'user', 'user_id': user_id, 'decks': owned},
+                            {f'users/{user_id}': None})
+    auth_cache.invalidate(('user', user_id))
+    log.info('user_deleted', user_id=user_id, job_id=job_id, decks=len(owned))
+    return job_id
+
+
+def reserve_deck_ids(count):
+    """
+    Atomically reserves count consecutive deck IDs and returns the first one. deck_counter
+    holds the highest ID handed out so far.
+    """
     def increment_counter(current_value):
         if current_value is None:
-            return 1
+            return count
         else:
-            return current_value + 1
+            return current_value + count
 
-    counter_ref = db.reference('deck_counter')
-    new_deck_id = counter_ref.transaction(increment_counter)
+    counter_ref = ref('deck_counter')
+    new_counter = counter_ref.transaction(increment_counter)
+    return new_counter - count + 1
+
+
+def create_deck(user_id, deck_name, description=""):
+    new_deck_id = deck_id_allocator.next_id()
     deck_name = deck_name[:60]
 
-    deck_ref = db.reference(f'decks/{new_deck_id}')
-    deck_ref.set({
-        'owner': user_id,
-        'name': deck_name,
-        'description': description,
-        'flashcards': {},
-        'card_counter': 0
+    ref().update({
+        f'decks/{new_deck_id}': {
+            'owner': user_id,
+            'name': deck_name,
+            'description': description,
+            'flashcards': {},
+            'card_counter': 0,
+            'revision': 0,
+            'version': 0
+        },
+        f'deck_meta/{new_deck_id}': {
+            'owner': user_id,
+            'name': deck_name,
+            'description': description,
+            'card_count': 0,
+            'last_modified': SERVER_TIMESTAMP
+        }
     })
-    print(
-        f"New deck {deck_name} added with ID {new_deck_id}. Deck initialized with empty flashcard collection.")
+    auth_cache.set(('owner', str(new_deck_id)), user_id)
+    log.info('deck_created', deck_id=new_deck_id, user_id=user_id)
     return new_deck_id
 
 
 def modify_deck(deck_id, deck_name, description):
-    deck_ref = db.reference(f'decks/{deck_id}')
-    deck_data = deck_ref.get()
-    if deck_data:
-        deck_ref.update({
-            'name': deck_name,
-            'description': description
-        })
-        print(f"Deck {deck_id} has been updated.")
+    if get_deck_owner(deck_id) is not None:
+        updates = {
+            f'decks/{deck_id}/name': deck_name,
+            f'decks/{deck_id}/description': description,
+            f'deck_meta/{deck_id}/name': deck_name,
+            f'deck_meta/{deck_id}/description': description,
+            f'deck_meta/{deck_id}/last_modified': SERVER_TIMESTAMP
+        }
+        updates.update(deck_change_updates(
+            deck_id, reserve_revision(deck_id),
+            deck={'name': deck_name, 'description': description}))
+        ref().update(updates)
+        log.info('deck_updated', deck_id=deck_id)
         return deck_id
     else:
-        print(f"Deck {deck_id} does not exist.")
+        log.info('deck_not_found', deck_id=deck_id)
         return None
 
 
 def delete_deck(deck_id):
-    deck_ref = db.reference(f'decks/{deck_id}')
-    deck_data = deck_ref.get()
-    if deck_data:
-        deck_ref.delete()
-        print(
-            f"Deck {deck_id} and all associated flashcards have been deleted.")
-        return deck_id
-    else:
-        print(f"Deck {deck_id} does not exist.")
+    """
+    Removes the deck from its owner's decks at once and starts a background job deleting
+    its flashcards, change log and the owner's index entries for them. Returns the job
+    ID, or None if the deck does not exist.
+    """
+    owner = get_deck_owner(deck_id)
+    if owner is None:
+        log.info('deck_not_found', deck_id=deck_id)
         return None
+    decks = [d for d in ref(f'users/{owner}/decks').get() or [] if d != deck_id]
+    edit_buffer.discard(str(deck_id))
+    job_id = start_deletion({'kind': 'deck', 'user_id': owner, 'deck_id': deck_id},
+                            {f'users/{owner}/decks': decks or None})
+    auth_cache.invalidate(('user', owner))
+    auth_cache.invalidate(('owner', str(deck_id)))
+    log.info('deck_deleted', deck_id=deck_id, job_id=job_id)
+    return job_id
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def start_deletion(job, updates):
+    """
+    Records a deletion job, applying updates in the same write, and runs it on the
+    deletion worker. Returns the job ID.
+    """
+    job_id = uuid.uuid4().hex
+    now = now_ms()
+    job.update({'status': cascade.QUEUED, 'step': 0, 'steps': len(cascade.plan(job)),
+                'deleted': 0, 'attempts': 1, 'created_at': now, 'updated_at': now})
+    ref().update({**updates, f'deletion_jobs/{job_id}': job})
+    deletion_executor.submit(run_deletion_job, job_id)
+    return job_id
+
+
+def run_deletion_job(job_id):
+    """
+    Runs a deletion job from the step it has reached. Every step can be repeated, so a
+    job cut off mid-step is finished by running it again.
+    """
+    path = f'deletion_jobs/{job_id}'
+    job = ref(path).get()
+    if not job or job['status'] in (cascade.SUCCEEDED, cascade.FAILED):
+        return
+    steps = cascade.plan(job)
+    try:
+        ref(path).update({'status': cascade.RUNNING, 'updated_at': now_ms()})
+        for index in range(job.get('step', 0), len(steps)):
+            run_deletion_step(steps[index], job_id)
+            ref(path).update({'status': cascade.RUNNING, 'step': index + 1,
+                              'updated_at': now_ms()})
+    except Exception as e:
+        # left running: the job is retried once it has gone stale
+        ref(path).update({'error': str(e) or e.__class__.__name__})
+        log.exception('deletion_job_failed', job_id=job_id)
+        return
+    ref(path).update({'status': cascade.SUCCEEDED, 'error': None, 'updated_at': now_ms(),
+                      'finished_at': now_ms()})
+    log.info('deletion_job_finished', job_id=job_id, kind=job['kind'], steps=len(steps))
+
+
+def run_deletion_step(step, job_id=None):
+    """
+    Deletes what a step covers, a batch per write, and counts the deleted entries in the
+    job's progress. Returns the number of entries deleted.
+    """
+    progress = {}
+    if job_id is not None:
+        progress = {f'deletion_jobs/{job_id}/updated_at': now_ms()}
+    if 'remove' in step:
+        ref().update({**{path: None for path in step['remove']}, **progress})
+        return 0
+    total = 0
+    while True:
+        query = ref(step['drain']).order_by_key()
+        if 'start' in step:
+            query = query.start_at(step['start']).end_at(step['end'])
+        batch = cascade.entries(query.limit_to_first(DELETION_BATCH_SIZE).get())
+        if not batch:
+            return total
+        updates, deleted = cascade.batch_updates(step, batch, DELETION_MAX_PATHS)
+        if job_id is not None:
+            updates[f'deletion_jobs/{job_id}/deleted'] = server_increment(deleted)
+            updates[f'deletion_jobs/{job_id}/updated_at'] = now_ms()
+        ref().update(updates)
+        total += deleted
+
+
+def resume_deletion_job(job_id, job):
+    """
+    Takes over an unfinished job whose worker has not advanced it for
+    DELETION_STALE_SECONDS, e.g. because the worker was restarted, and runs it here.
+    Returns True if this worker took it over.
+    """
+    if job['status'] in (cascade.SUCCEEDED, cascade.FAILED) or \
+            now_ms() - job.get('updated_at', 0) < DELETION_STALE_SECONDS * 1000:
+        return False
+    claimed = []
+
+    def claim(current):
+        claimed.clear()
+        if not current or current['status'] in (cascade.SUCCEEDED, cascade.FAILED) or \
+                now_ms() - current.get('updated_at', 0) < DELETION_STALE_SECONDS * 1000:
+            return current
+        current['attempts'] = current.get('attempts', 1) + 1
+        current['updated_at'] = now_ms()
+        if current['attempts'] > DELETION_MAX_ATTEMPTS:
+            current['status'] = cascade.FAILED
+            current['finished_at'] = now_ms()
+        else:
+            claimed.append(job_id)
+        return current
+
+    ref(f'deletion_jobs/{job_id}').transaction(claim)
+    if not claimed:
+        return False
+    log.info('deletion_job_resumed', job_id=job_id)
+    deletion_executor.submit(run_deletion_job, job_id)
+    return True
+
+
+def resume_deletion_jobs():
+    """
+    Resumes stale deletion jobs and drops finished ones older than DELETION_JOB_RETENTION,
+    reading only unfinished jobs and a batch of expired ones rather than every job kept.
+    Safe to run in every worker: each job is taken over by one.
+    """
+    jobs = ref('deletion_jobs')
+    for status in (cascade.QUEUED, cascade.RUNNING):
+        unfinished = jobs.order_by_child('status').equal_to(status) \
+            .limit_to_first(DELETION_RESUME_BATCH).get() or {}
+        for job_id, job in unfinished.items():
+            resume_deletion_job(job_id, job)
+    cutoff = now_ms() - DELETION_JOB_RETENTION * 1000
+    expired = jobs.order_by_child('finished_at').start_at(1).end_at(cutoff) \
+        .limit_to_first(DELETION_RESUME_BATCH).get() or {}
+    if expired:
+        ref().update({f'deletion_jobs/{job_id}': None for job_id in expired})
+
+
+def save_generation_job(job):
+    """
+    Records a generation job's state at generation_jobs/{job}. A job cancelled through
+    another worker stays cancelled, and is cancelled here too.
+    """
+    path = f'generation_jobs/{job.id}'
+    record = {**job.to_record(), 'updated_at': now_ms()}
+    if job.status == Job.QUEUED:
+        ref(path).set(record)
+        return
+
+    def save(current):
+        if current and current['status'] == Job.CANCELLED:
+            return current
+        return record
+
+    if ref(path).transaction(save)['status'] == Job.CANCELLED:
+        generation_queue.cancel(job.id)
+
+
+def prune_generation_jobs():
+    """
+    Drops a batch of generation job records not updated for GENERATION_JOB_RETENTION,
+    at most once a minute per worker.
+    """
+    global _generation_jobs_pruned
+    if time.monotonic() - _generation_jobs_pruned < 60:
+        return
+    _generation_jobs_pruned = time.monotonic()
+    cutoff = now_ms() - GENERATION_JOB_RETENTION * 1000
+    expired = ref('generation_jobs').order_by_child('updated_at').end_at(cutoff) \
+        .limit_to_first(100).get() or {}
+    if expired:
+        ref().update({f'generation_jobs/{job_id}': None for job_id in expired})
+
+
+def deletion_job_dict(job_id, job):
+    return {
+        'job_id': job_id,
+        'kind': job['kind'],
+        'status': job['status'],
+        'step': job.get('step', 0),
+        'steps': job.get('steps', 0),
+        'deleted': job.get('deleted', 0),
+        'error': job.get('error'),
+        'created_at': job.get('created_at'),
+        'updated_at': job.get('updated_at'),
+        'finished_at': job.get('finished_at')
+    }
 
 
 def add_deck_to_user(user_id, deck_id):
-    user_ref = db.reference(f'users/{user_id}')
+    user_ref = ref(f'users/{user_id}')
     user_data = user_ref.get()
     if user_data:
         decks = user_data.get('decks', [])
         decks.append(deck_id)
         user_ref.update({'decks': decks})
-        print(f"Deck {deck_id} added to user {user_id}.")
+        auth_cache.invalidate(('user', user_id))
+        log.info('deck_added_to_user', deck_id=deck_id, user_id=user_id)
         return deck_id
     else:
-        print(f"User {user_id} does not exist.")
+        log.info('user_not_found', user_id=user_id)
         return None
 
 
 def verify_user_has_deck(user_id, deck_id):
-    user_ref = db.reference(f'users/{user_id}')
-    user_data = user_ref.get()
-    if user_data:
-        decks = user_data.get('decks', [])
+    decks = get_user_decks(user_id)
+    if decks is not None:
         if deck_id in decks:
-            if check_deck_exists(deck_id):
-                deck = db.reference(f'decks/{deck_id}').get()
-                if deck['owner'] == user_id:
-                    return True
+            return get_deck_owner(deck_id) == user_id
         else:
-            print(f"User {user_id} does not have deck {deck_id}.")
+            log.info('deck_access_denied', deck_id=deck_id, user_id=user_id)
             return False
     else:
-        print(f"User {user_id} does not exist.")
+        log.info('user_not_found', user_id=user_id)
         return False
 
 
 def remove_deck_from_user(user_id, deck_id):
-    user_ref = db.reference(f'users/{user_id}')
+    user_ref = ref(f'users/{user_id}')
     user_data = user_ref.get()
     if user_data:
         decks = user_data.get('decks', [])
         if deck_id in decks:
             decks.remove(deck_id)
             user_ref.update({'decks': decks})
-            print(f"Deck {deck_id} removed from user {user_id}.")
+            auth_cache.invalidate(('user', user_id))
+            log.info('deck_removed_from_user', deck_id=deck_id, user_id=user_id)
             return deck_id
         else:
-            print(f"Deck {deck_id} is not associated with user {user_id}.")
+            log.info('deck_not_associated', deck_id=deck_id, user_id=user_id)
     else:
-        print(f"User {user_id} does not exist.")
+        log.info('user_not_found', user_id=user_id)
         return None
 
 
 def get_decks(user_id):
-    user_ref = db.reference(f'users/{user_id}')
+    user_ref = ref(f'users/{user_id}')
     user_data = user_ref.get()
     if user_data:
-        decks = user_data.get('decks', [])
+        decks = user_data.get('decks') or []
+        metas = firebase_executor.map(get_deck_meta, decks)
         named_decks = {}
-        for deck_id in decks:
-            deck_owner, deck_name, deck_description = check_deck_exists(
-                deck_id)
-            if not deck_name and not deck_description:
-                decks.remove(deck_id)
-            else:
-                named_decks[deck_id] = {
-                    "deck_owner": deck_owner,
-                    "deck_name": deck_name,
-                    "deck_description": deck_description}
-        user_ref.update({'decks': decks})
-        print(f"User {user_id} has the following decks: {named_decks}")
+        live_decks = []
+        for deck_id, meta in zip(decks, metas):
+            if meta is None:
+                continue
+            live_decks.append(deck_id)
+            named_decks[deck_id] = {
+                "deck_owner": meta.get('owner'),
+                "deck_name": meta.get('name'),
+                "deck_description": meta.get('description'),
+                "card_count": meta.get('card_count', 0),
+                "last_modified": meta.get('last_modified')}
+        if len(live_decks) != len(decks):
+            user_ref.update({'decks': live_decks})
+            auth_cache.invalidate(('user', user_id))
+        log.debug('decks_listed', user_id=user_id, decks=len(named_decks))
         return named_decks
     else:
-        print(f"User {user_id} does not exist.")
+        log.info('user_not_found', user_id=user_id)
         return None
 
 
-def add_flashcard(deck_id, flashcard_dict):
-    flashcard = Flashcard.from_dict(flashcard_dict)
-
-    deck_ref = db.reference(f'decks/{deck_id}')
-    deck_data = deck_ref.get()
-    if deck_data:
-        card_counter = deck_data.get('card_counter', 0)
-        flashcard.id = card_counter
-        flashcards_ref = deck_ref.child('flashcards')
-        flashcards_ref.update({
-            card_counter: flashcard.to_dict()
-        })
-        deck_ref.update({'card_counter': card_counter + 1})
-        print(f"Added new flashcard with ID {card_counter} to deck {deck_id}.")
-        return card_counter
-    else:
-        print(f"Deck {deck_id} does not exist.")
+def reserve_card_ids(deck_id, count):
+    """
+    Atomically reserves count consecutive flashcard IDs for the deck and returns the first one.
+    Only the card_counter leaf is read and written.
+    """
+    def increment_counter(current_value):
+        if current_value is None:
+            return count
+        else:
+            return current_value + count
+
+    counter_ref = ref(f'decks/{deck_id}/card_counter')
+    new_counter = counter_ref.transaction(increment_counter)
+    return new_counter - count
+
+
+def reserve_revision(deck_id):
+    """
+    Atomically claims the deck's next revision and returns it. The write it belongs to
+    records its change log entry under this revision. The transaction creates the
+    revision node if it is missing, so callers check that the deck exists first.
+    """
+    def increment_revision(current_value):
+        return (current_value or 0) + 1
+
+    return ref(f'decks/{deck_id}/revision').transaction(increment_revision)
+
+
+def release_revision(deck_id, revision):
+    """
+    Logs an empty entry for a reserved revision whose write did not happen, so clients
+    syncing across it do not wait for it to settle. The deck itself did not change, so
+    its version, and with it entity tags and cached references, stays as it is.
+    """
+    ref().update(change_log.entry_updates(
+        deck_id, revision, log_size=DECK_CHANGE_LOG_SIZE,
+        compact_every=DECK_CHANGE_COMPACT_EVERY))
+
+
+def deck_change_updates(deck_id, revision, upserts=None, deletes=(), deck=None):
+    """
+    Returns the change log entry for a deck write, to go in the same update as the write.
+    It also bumps decks/{deck}/version, which unlike the revision only moves once the
+    write has landed, so it is what entity tags and caches of the deck are keyed on.
+    """
+    updates = change_log.entry_updates(
+        deck_id, revision, upserts, deletes, deck, max_cards=SYNC_MAX_CHANGES,
+        log_size=DECK_CHANGE_LOG_SIZE, compact_every=DECK_CHANGE_COMPACT_EVERY)
+    updates[f'decks/{deck_id}/version'] = server_increment(1)
+    return updates
+
+
+def add_flashcards(deck_id, flashcard_dicts):
+    flashcards = [Flashcard.from_dict(flashcard_dict)
+                  for flashcard_dict in flashcard_dicts]
+    owner = get_deck_owner(deck_id)
+    if owner is None:
+        log.info('deck_not_found', deck_id=deck_id)
         return None
+    if not flashcards:
+        return []
+
+    revision = firebase_executor.submit(reserve_revision, deck_id)
+    first_id = reserve_card_ids(deck_id, len(flashcards))
+    updates = {}
+    for offset, flashcard in enumerate(flashcards):
+        flashcard.id = first_id + offset
+        updates[f'decks/{deck_id}/flashcards/{flashcard.id}'] = flashcard.to_dict()
+        key = review_key(deck_id, flashcard.id)
+        # new cards are due for their first review straight away
+        updates[f'due_index/{owner}/{key}'] = SERVER_TIMESTAMP
+        updates.update(index_updates(owner, key, {}, term_weights(flashcard.to_dict())))
+    updates.update(deck_change_updates(
+        deck_id, revision.result(),
+        upserts={flashcard.id: flashcard.to_dict() for flashcard in flashcards}))
+    updates[f'deck_meta/{deck_id}/card_count'] = server_increment(len(flashcards))
+    updates[f'deck_meta/{deck_id}/last_modified'] = SERVER_TIMESTAMP
+    ref().update(updates)
+    last_id = first_id + len(flashcards) - 1
+    log.info('flashcards_added', deck_id=deck_id, first_id=first_id, last_id=last_id)
+    return [flashcard.id for flashcard in flashcards]
+
+
+def add_flashcard(deck_id, flashcard_dict):
+    new_flashcard_ids = add_flashcards(deck_id, [flashcard_dict])
+    return new_flashcard_ids[0] if new_flashcard_ids else None
+
+
+def import_flashcards(deck_id, rows):
+    """
+    Adds flashcards from (row_number, card_or_RowError) pairs in batches of IMPORT_BATCH_SIZE,
+    yielding a progress event after each batch, an event for each rejected row and a final
+    summary. Only one batch is held in memory at a time.
+    """
+    imported = 0
+    failed = 0
+    batch = []
+    try:
+        for row_number, card in rows:
+            if isinstance(card, RowError):
+                failed += 1
+                yield {'row': row_number, 'error': str(card)}
+                continue
+            batch.append(card)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                add_flashcards(deck_id, batch)
+                imported += len(batch)
+                batch = []
+                yield {'imported': imported, 'failed': failed}
+        if batch:
+            add_flashcards(deck_id, batch)
+            imported += len(batch)
+    except Exception:
+        log.exception('import_failed', deck_id=deck_id, imported=imported, failed=failed)
+        yield {'error': 'Import stopped early.', 'imported': imported, 'failed': failed}
+        return
+    log.info('import_finished', deck_id=deck_id, imported=imported, failed=failed)
+    yield {'done': True, 'imported': imported, 'failed': failed}
 
 
 def edit_flashcard(deck_id, flashcard_id, flashcard_json):
-    flashcard_ref = db.reference(f'decks/{deck_id}/flashcards/{flashcard_id}')
-    flashcard_data = flashcard_ref.get()
-    if flashcard_data:
-        updated_flashcard = Flashcard.from_json(flashcard_json)
-        updated_flashcard.id = flashcard_id
-        flashcard_ref.set(updated_flashcard.to_dict())
-        print(
-            f"Flashcard ID {flashcard_id} for deck {deck_id} has been updated.")
+    updated_flashcard = Flashcard.from_json(flashcard_json)
+    updated_flashcard.id = flashcard_id
+    if write_flashcard_edits(deck_id, {flashcard_id: updated_flashcard.to_dict()}):
         return flashcard_id
-    else:
-        print(
-            f"Flashcard ID {flashcard_id} for deck {deck_id} does not exist or has already been deleted.")
-        return None
+    return None
+
+
+def buffer_flashcard_edit(deck_id, flashcard_id, flashcard_json):
+    """
+    Queues an edit in the write-behind buffer and returns flashcard_id. Whether the
+    flashcard still exists is only checked when the edit is written.
+    """
+    updated_flashcard = Flashcard.from_json(flashcard_json)
+    updated_flashcard.id = flashcard_id
+    edit_buffer.put(str(deck_id), str(flashcard_id), updated_flashcard.to_dict())
+    return flashcard_id
+
+
+def write_flashcard_edits(deck_id, edits):
+    """
+    Writes {flashcard_id: flashcard dict} to existing flashcards of the deck as one
+    multi-path update under one revision, and returns the IDs written. Edits to
+    flashcards that do not exist (any more) are dropped.
+    """
+    owner = get_deck_owner(deck_id)
+    if owner is None:
+        # no revision is reserved, as that would write to the missing deck
+        log.info('deck_not_found', deck_id=deck_id)
+        return []
+    revision = firebase_executor.submit(reserve_revision, deck_id)
+    flashcard_ids = list(edits)
+    current = firebase_executor.map(
+        lambda flashcard_id: ref(f'decks/{deck_id}/flashcards/{flashcard_id}').get(),
+        flashcard_ids)
+    updates = {}
+    written = {}
+    for flashcard_id, flashcard_data in zip(flashcard_ids, current):
+        if not flashcard_data:
+            log.info('flashcard_not_found', deck_id=deck_id, flashcard_id=flashcard_id)
+            continue
+        flashcard = edits[flashcard_id]
+        updates[f'decks/{deck_id}/flashcards/{flashcard_id}'] = flashcard
+        updates.update(index_updates(owner, review_key(deck_id, flashcard_id),
+                                     term_weights(flashcard_data), term_weights(flashcard)))
+        written[flashcard_id] = flashcard
+    if not written:
+        release_revision(deck_id, revision.result())
+        return []
+    updates.update(deck_change_updates(deck_id, revision.result(), upserts=written))
+    updates[f'deck_meta/{deck_id}/last_modified'] = SERVER_TIMESTAMP
+    ref().update(updates)
+    for flashcard_id in written:
+        log.info('flashcard_updated', deck_id=deck_id, flashcard_id=flashcard_id)
+    return list(written)
+
+
+def overlay_pending_edits(flashcards, pending):
+    """
+    Returns flashcards, a list or dict as Firebase returned it, with the pending edits of
+    the flashcards it holds applied.
+    """
+    if not pending or not flashcards:
+        return flashcards
+    if isinstance(flashcards, list):
+        flashcards = list(flashcards)
+        for flashcard_id, flashcard in pending.items():
+            index = int(flashcard_id) if flashcard_id.isdigit() else -1
+            if 0 <= index < len(flashcards) and flashcards[index] is not None:
+                flashcards[index] = flashcard
+        return flashcards
+    return {flashcard_id: pending.get(str(flashcard_id), flashcard)
+            for flashcard_id, flashcard in flashcards.items()}
 
 
 def delete_flashcard(deck_id, flashcard_id):
-    flashcard_ref = db.reference(f'decks/{deck_id}/flashcards/{flashcard_id}')
+    owner = get_deck_owner(deck_id)
+    if owner is None:
+        log.info('deck_not_found', deck_id=deck_id)
+        return None
+    flashcard_ref = ref(f'decks/{deck_id}/flashcards/{flashcard_id}')
+    revision = firebase_executor.submit(reserve_revision, deck_id)
     flashcard_data = flashcard_ref.get()
     if flashcard_data:
-        flashcard_ref.delete()
-        print(
-            f"Flashcard ID {flashcard_id} for deck {deck_id} has been deleted.")
+        key = review_key(deck_id, flashcard_id)
+        updates = {
+            f'decks/{deck_id}/flashcards/{flashcard_id}': None,
+            f'deck_meta/{deck_id}/card_count': server_increment(-1),
+            f'deck_meta/{deck_id}/last_modified': SERVER_TIMESTAMP,
+            f'due_index/{owner}/{key}': None,
+            f'reviews/{owner}/{key}': None
+        }
+        updates.update(deck_change_updates(deck_id, revision.result(), deletes=[flashcard_id]))
+        updates.update(index_updates(owner, key, term_weights(flashcard_data), {}))
+        ref().update(updates)
+        log.info('flashcard_deleted', deck_id=deck_id, flashcard_id=flashcard_id)
         return flashcard_id
     else:
-        print(
-            f"Flashcard ID {flashcard_id} for deck {deck_id} does not exist or has already been deleted.")
+        release_revision(deck_id, revision.result())
+        log.info('flashcard_not_found', deck_id=deck_id, flashcard_id=flashcard_id)
         return None
 
 
-def check_deck_exists(deck_id):
-    deck_ref = db.reference(f'decks/{deck_id}')
-    deck_data = deck_ref.get()
-    if deck_data is not None:
-        deck_owner = deck_data.get('owner')
-        deck_name = deck_data.get('name')
-        deck_description = deck_data.get('description')
-    else:
-        deck_owner = None
-        deck_name = None
-        deck_description = None
-    return deck_owner, deck_name, deck_description
+def get_deck_meta(deck_id):
+    """
+    Returns the deck summary (owner, name, description, card_count, last_modified) from the
+    deck_meta index, building the entry from the full deck if it predates the index.
+    """
+    meta = ref(f'deck_meta/{deck_id}').get()
+    if meta and 'owner' in meta:
+        return meta
+    return rebuild_deck_meta(deck_id)
+
+
+def rebuild_deck_meta(deck_id):
+    deck_data = ref(f'decks/{deck_id}').get()
+    if not deck_data:
+        return None
+    flashcards = flashcard_items(deck_data.get('flashcards'))
+    meta = {
+        'owner': deck_data.get('owner'),
+        'name': deck_data.get('name'),
+        'description': deck_data.get('description'),
+        'card_count': len(flashcards),
+        'last_modified': int(time.time() * 1000)
+    }
+    ref(f'deck_meta/{deck_id}').set(meta)
+    log.info('deck_meta_rebuilt', deck_id=deck_id)
+    return meta
 
 
 def get_flashcards(deck_id):
-    deck_ref = db.reference(f'decks/{deck_id}')
+    deck_ref = ref(f'decks/{deck_id}')
     deck_data = deck_ref.get()
     if deck_data:
-        flashcards = deck_data.get('flashcards', {})
-        print(f"Deck {deck_id} has the following flashcards: {flashcards}")
         return deck_data
     else:
-        print(f"Deck {deck_id} does not exist.")
+        log.info('deck_not_found', deck_id=deck_id)
         return None
 
 
+def flashcard_items(flashcards):
+    """
+    Returns (flashcard_id, flashcard) pairs in key order. Firebase returns objects with
+    mostly sequential integer keys as lists, so both shapes are accepted.
+    """
+    if isinstance(flashcards, list):
+        return [(str(flashcard_id), flashcard)
+                for flashcard_id, flashcard in enumerate(flashcards)
+                if flashcard is not None]
+    return [(str(flashcard_id), flashcard)
+            for flashcard_id, flashcard in (flashcards or {}).items()
+            if flashcard is not None]
+
+
+def get_flashcards_page(deck_id, limit, after=None):
+    """
+    Returns up to limit flashcards with keys after the cursor, and the cursor for the
+    next page (None on the last page). Only the requested page is read from Firebase.
+    """
+    if get_deck_owner(deck_id) is None:
+        log.info('deck_not_found', deck_id=deck_id)
+        return None
+    query = ref(f'decks/{deck_id}/flashcards').order_by_key()
+    if after is not None:
+        query = query.start_at(str(after)).limit_to_first(limit + 2)
+    else:
+        query = query.limit_to_first(limit + 1)
+    items = [(flashcard_id, flashcard)
+             for flashcard_id, flashcard in flashcard_items(query.get())
+             if flashcard_id != str(after)]
+    next_after = items[limit - 1][0] if len(items) > limit else None
+    return dict(items[:limit]), next_after
+
+
+def iter_deck_pages(deck_id, page_size=None):
+    """
+    Yields the deck's cards one page of (flashcard_id, flashcard) pairs at a time, reading
+    each page when it is asked for.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    after = None
+    while True:
+        page = get_flashcards_page(deck_id, page_size, after)
+        if page is None:
+            return
+        flashcards, after = page
+        yield list(flashcards.items())
+        if after is None:
+            return
+
+
+def get_deck_etag(deck_id):
+    """
+    Returns the entity tag for the deck's current version, or None if the deck has no
+    version yet. The version is bumped in the same update as every flashcard and deck
+    write; the revision is not used because it is reserved before its write lands.
+    """
+    version = ref(f'decks/{deck_id}/version').get()
+    if version is None:
+        return None
+    return f'{deck_id}.{version}'
+
+
+def sync_deck(deck_id, since=None):
+    """
+    Returns what changed in the deck after revision since: {'snapshot': False, 'revision',
+    'upserts', 'deletes', 'deck'} built from the change log, or {'snapshot': True,
+    'revision', 'flashcards'} with the whole deck when the log cannot answer. None if the
+    deck does not exist.
+    """
+    if get_deck_owner(deck_id) is None:
+        log.info('deck_not_found', deck_id=deck_id)
+        return None
+    if since is not None and since >= 0:
+        # the entry of since itself is read too, to tell a compacted log from a gap
+        query = ref(f'deck_changes/{deck_id}').order_by_key().start_at(
+            change_log.revision_key(since))
+        entries = query.limit_to_first(SYNC_MAX_CHANGES + 2).get() or {}
+        if len(entries) <= SYNC_MAX_CHANGES + 1:
+            if any(int(key) > since for key in entries):
+                delta = change_log.merge(entries.items(), since, int(time.time() * 1000),
+                                         SYNC_SETTLE_MS, SYNC_MAX_CHANGES)
+            elif entries or (ref(f'decks/{deck_id}/revision').get() or 0) <= since:
+                delta = {'revision': since, 'upserts': {}, 'deletes': [], 'deck': {}}
+            else:
+                delta = None
+            if delta is not None:
+                log.debug('deck_synced', deck_id=deck_id, since=since, revision=delta['revision'],
+                          changes=len(delta['upserts']) + len(delta['deletes']))
+                return dict(delta, snapshot=False)
+    return deck_snapshot(deck_id)
+
+
+def deck_snapshot(deck_id):
+    """
+    Returns the whole deck with the revision a client should sync from next. The revision
+    is read before the deck, so the snapshot reflects at least every write up to it.
+    """
+    tail = ref(f'deck_changes/{deck_id}').order_by_key().limit_to_last(8).get() or {}
+    revision = change_log.head(tail.items(), int(time.time() * 1000), SYNC_SETTLE_MS)
+    if revision is None:
+        revision = ref(f'decks/{deck_id}/revision').get() or 0
+    deck_data = get_flashcards(deck_id)
+    if deck_data is None:
+        return None
+    log.info('deck_snapshot_sent', deck_id=deck_id, revision=revision)
+    return {'snapshot': True, 'revision': revision, 'flashcards': deck_data}
+
+
+def deck_review_keys(user_id, deck_id):
+    """
+    Returns the user's due index keys for the deck's flashcards, with one key range query.
+    """
+    start, end = deck_key_range(deck_id)
+    entries = ref(f'due_index/{user_id}').order_by_key().start_at(start).end_at(end).get()
+    return list(entries or {})
+
+
+def review_flashcard(user_id, deck_id, flashcard_id, grade):
+    """
+    Records a review grade (0-5) for the flashcard, reschedules it with SM-2 and moves
+    it in the user's due index. Returns the new review state, or None if the flashcard
+    does not exist.
+    """
+    key = review_key(deck_id, flashcard_id)
+    state = ref(f'reviews/{user_id}/{key}').get()
+    if state is None and not ref(f'decks/{deck_id}/flashcards/{flashcard_id}').get(shallow=True):
+        log.info('flashcard_not_found', deck_id=deck_id, flashcard_id=flashcard_id)
+        return None
+    state = schedule(state, grade, int(time.time() * 1000))
+    ref().update({
+        f'reviews/{user_id}/{key}': state,
+        f'due_index/{user_id}/{key}': state['due']
+    })
+    log.debug('flashcard_reviewed', user_id=user_id, deck_id=deck_id,
+              flashcard_id=flashcard_id, grade=grade, interval=state['interval'])
+    return state
+
+
+def get_due_flashcards(user_id, limit, now=None):
+    """
+    Returns up to limit of the user's flashcards that are due at time now (ms since the
+    epoch), most overdue first, across all of the user's decks. The due index is ordered
+    by due time, so this is one range read plus one read per returned card; index entries
+    whose flashcard no longer exists are removed.
+
+    Needs ".indexOn": ".value" on due_index/$user_id in the database rules.
+    """
+    now = now if now is not None else int(time.time() * 1000)
+    entries = ref(f'due_index/{user_id}').order_by_value().end_at(now).limit_to_first(limit).get()
+    entries = list((entries or {}).items())
+
+    def load(entry):
+        deck_id, flashcard_id = parse_review_key(entry[0])
+        return ref(f'decks/{deck_id}/flashcards/{flashcard_id}').get()
+
+    due_flashcards = []
+    stale = {}
+    for (key, due), flashcard in zip(entries, firebase_executor.map(load, entries)):
+        if flashcard is None:
+            stale[f'due_index/{user_id}/{key}'] = None
+            stale[f'reviews/{user_id}/{key}'] = None
+            continue
+        deck_id, flashcard_id = parse_review_key(key)
+        due_flashcards.append({'deck_id': deck_id, 'flashcard_id': flashcard_id,
+                               'due': due, 'flashcard': flashcard})
+    if stale:
+        ref().update(stale)
+    return due_flashcards
+
+
+def deck_search_docs(user_id, deck_id):
+    """
+    Returns {key: term_weights} for the deck's flashcards in the user's search index.
+    """
+    start, end = deck_key_range(deck_id)
+    docs = ref(f'search_docs/{user_id}').order_by_key().start_at(start).end_at(end).get()
+    return dict(docs or {})
+
+
+def search_flashcards(user_id, query, limit, offset=0):
+    """
+    Searches the title, front and back of the user's flashcards. Returns (hits, next_offset)
+    where each hit has the deck and flashcard IDs, score and flashcard, best match first;
+    next_offset is None on the last page.
+
+    One read per query term fetches its SEARCH_POSTINGS_LIMIT best postings, and one read
+    per returned hit fetches the flashcard. Needs ".indexOn": ".value" on
+    search_index/$user_id/$term in the database rules.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+
+    def postings(term):
+        return ref(f'search_index/{user_id}/{term}').order_by_value() \
+            .limit_to_last(SEARCH_POSTINGS_LIMIT).get() or {}
+
+    ranked = rank(dict(zip(terms, firebase_executor.map(postings, terms))))
+    page = ranked[offset:offset + limit]
+
+    def load(hit):
+        deck_id, flashcard_id = parse_review_key(hit[0])
+        return ref(f'decks/{deck_id}/flashcards/{flashcard_id}').get()
+
+    hits = []
+    for (key, score), flashcard in zip(page, firebase_executor.map(load, page)):
+        if flashcard is None:
+            continue
+        deck_id, flashcard_id = parse_review_key(key)
+        hits.append({'deck_id': deck_id, 'flashcard_id': flashcard_id, 'score': score,
+                     'flashcard': flashcard})
+    next_offset = offset + limit if len(ranked) > offset + limit else None
+    return hits, next_offset
+
+
 # ========= GEN AI =========
-def generate_flashcards(n, topic=None, reference=None, text=None):
+def build_flashcard_prompt(n, topic=None, reference=None, text=None):
     if topic:
-        prompt = FLASHCARD_PROMPT_TOPIC.format(n=n, topic=topic)
+        return FLASHCARD_PROMPT_TOPIC.format(n=n, topic=topic)
     elif reference:
-        prompt = FLASHCARD_PROMPT_REFERENCE.format(n=n, reference=reference)
+        return FLASHCARD_PROMPT_REFERENCE.format(n=n, reference=reference)
     elif text:
-        prompt = FLASHCARD_PROMPT_FROM_TEXT.format(n=n, text=text)
+        return FLASHCARD_PROMPT_FROM_TEXT.format(n=n, text=text)
     else:
         raise ValueError(
             "You must provide a topic, reference, or text to generate flashcards.")
 
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": prompt}
-        ],
-        response_format=FlashcardCollection,
-    )
+
+def reference_windows(card_counter):
+    """
+    Returns (start ID, length) of the runs of flashcard IDs sampled for a deck reference,
+    spread over the IDs handed out so far. Runs starting at a deleted card simply read
+    the next cards.
+    """
+    if card_counter <= REFERENCE_SAMPLE_SIZE:
+        return [(0, REFERENCE_SAMPLE_SIZE)]
+    length = -(-REFERENCE_SAMPLE_SIZE // REFERENCE_SAMPLE_WINDOWS)
+    return [(start, length) for start in spread(card_counter, REFERENCE_SAMPLE_WINDOWS)]
+
+
+def sampled_reference(meta, flashcards):
+    """
+    Builds the reference from the sampled {flashcard_id: flashcard}, in deck order.
+    """
+    ordered = [flashcards[key] for key in sorted(flashcards, key=int)]
+    return deck_reference(meta.get('name'), meta.get('description'), ordered,
+                          meta.get('card_count', len(ordered)), REFERENCE_TOKEN_BUDGET)
+
+
+def build_deck_reference(deck_id):
+    """
+    Returns the reference text for generating more flashcards like the deck's, or None
+    if the deck does not exist. Only the deck version is read when the reference for it
+    is cached; otherwise the deck's metadata and a fixed-size sample of its cards, so the
+    cost and the prompt do not grow with the deck. Decks written before versions existed
+    are at version 0 until their next write.
+    """
+    key = (deck_id, ref(f'decks/{deck_id}/version').get() or 0)
+    reference = reference_cache.get(key)
+    if reference is None:
+        meta = firebase_executor.submit(lambda: ref(f'deck_meta/{deck_id}').get())
+        windows = reference_windows(ref(f'decks/{deck_id}/card_counter').get() or 0)
+        pages = firebase_executor.map(
+            lambda window: ref(f'decks/{deck_id}/flashcards').order_by_key()
+            .start_at(str(window[0])).limit_to_first(window[1]).get(), windows)
+        flashcards = {}
+        for page in pages:
+            flashcards.update(flashcard_items(page))
+        if not meta.result():
+            return None
+        reference = sampled_reference(meta.result(), flashcards)
+        reference_cache.set(key, reference)
+    return reference
+
+
+def estimate_generation_tokens(prompt, n):
+    return count_tokens(prompt) + int(n or 1) * OUTPUT_TOKENS_PER_CARD
+
+
+def record_openai_usage(estimated_tokens, usage):
+    if usage:
+        openai_limiter.record_usage(estimated_tokens, usage.total_tokens)
+        openai_tokens.inc(usage.prompt_tokens, kind='prompt')
+        openai_tokens.inc(usage.completion_tokens, kind='completion')
+
+
+def usage_tokens(usage):
+    return usage.total_tokens if usage else 0
+
+
+def parse_flashcards(prompt, n, mode='parse'):
+    """
+    Runs one structured-output completion for prompt and returns (flashcards, tokens
+    used).
+    """
+    from schemas import FlashcardCollection
+    estimated_tokens = estimate_generation_tokens(prompt, n)
+    openai_limiter.acquire(estimated_tokens)
+
+    start = time.perf_counter()
+    try:
+        completion = openai_client().beta.chat.completions.parse(
+            model=GENERATION_MODEL,
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            response_format=FlashcardCollection,
+        )
+    except Exception as e:
+        openai_errors.inc(mode=mode, error=type(e).__name__)
+        raise
+    openai_duration.observe(time.perf_counter() - start, mode=mode)
+    record_openai_usage(estimated_tokens, completion.usage)
 
     flashcards = completion.choices[0].message.parsed
-    return flashcards.flashcards
+    return flashcards.flashcards, usage_tokens(completion.usage)
+
+
+def check_flashcards(flashcards):
+    """
+    Splits generated flashcards into those within the card limits and (flashcard,
+    problems) pairs for the rest.
+    """
+    accepted = []
+    failing = []
+    for flashcard in flashcards:
+        problems = card_limits.problems(flashcard.model_dump())
+        if problems:
+            failing.append((flashcard, problems))
+        else:
+            accepted.append(flashcard)
+    return accepted, failing
+
+
+def build_repair_prompt(failing):
+    cards = "\n".join(f"{json.dumps(flashcard.model_dump())}\nProblems: {'; '.join(problems)}"
+                      for flashcard, problems in failing)
+    return FLASHCARD_PROMPT_REPAIR.format(
+        n=len(failing), title=card_limits.TITLE_LENGTH_LIMIT, front=card_limits.FRONT_TEXT_LIMIT,
+        back=card_limits.BACK_TEXT_LIMIT, image=card_limits.FRONT_IMAGE_TEXT_LIMIT, flashcards=cards)
+
+
+def merge_repairs(failing, rewritten):
+    """
+    Matches rewritten flashcards to the failing ones by id and returns (repaired,
+    still failing). A card the model left out stays failing with its old problems.
+    """
+    by_id = {flashcard.id: flashcard for flashcard in rewritten}
+    repaired = []
+    still_failing = []
+    for flashcard, problems in failing:
+        rewrite = by_id.pop(flashcard.id, None)
+        if rewrite is None:
+            still_failing.append((flashcard, problems))
+            continue
+        accepted, failed = check_flashcards([rewrite])
+        repaired.extend(accepted)
+        still_failing.extend(failed)
+    return repaired, still_failing
+
+
+def repair_flashcards(failing):
+    """
+    Asks the model to rewrite only the failing flashcards, in one small call per attempt,
+    and returns (repaired flashcards, tokens used). Cards still failing after
+    GENERATION_REPAIR_ATTEMPTS are left out.
+    """
+    repaired = []
+    tokens = 0
+    for _ in range(GENERATION_REPAIR_ATTEMPTS):
+        if not failing:
+            break
+        rewritten, used = parse_flashcards(build_repair_prompt(failing), len(failing), mode='repair')
+        tokens += used
+        fixed, failing = merge_repairs(failing, rewritten)
+        repaired.extend(fixed)
+    return repaired, tokens
+
+
+def record_generation(accepted, repaired, rejected, tokens):
+    generated_flashcards.inc(accepted, outcome='accepted')
+    generated_flashcards.inc(repaired, outcome='repaired')
+    generated_flashcards.inc(rejected, outcome='rejected')
+    if tokens and accepted + repaired:
+        openai_tokens_per_card.observe(tokens / (accepted + repaired))
+
+
+def generate_flashcards(n, topic=None, reference=None, text=None):
+    prompt = build_flashcard_prompt(n, topic, reference, text)
+    flashcards, tokens = parse_flashcards(prompt, n)
+    accepted, failing = check_flashcards(flashcards)
+    repaired, repair_tokens = repair_flashcards(failing)
+    record_generation(len(accepted), len(repaired), len(failing) - len(repaired),
+                      tokens + repair_tokens)
+    order = {flashcard.id: position for position, flashcard in enumerate(flashcards)}
+    return sorted(accepted + repaired, key=lambda flashcard: order.get(flashcard.id, 0))
+
+
+def stream_flashcards(n, topic=None, reference=None, text=None):
+    """
+    Yields each FlashcardSchema as soon as the model has finished writing it.
+
+    The streamed content is parsed incrementally by the SDK; an element of the partial
+    flashcards list is complete once the model has started on the next one, and the
+    last element is taken from the final parsed completion. Cards breaking the card
+    limits are held back and yielded after the stream once repaired.
+    """
+    from schemas import FlashcardCollection, FlashcardSchema
+    prompt = build_flashcard_prompt(n, topic, reference, text)
+    estimated_tokens = estimate_generation_tokens(prompt, n)
+    openai_limiter.acquire(estimated_tokens)
+
+    start = time.perf_counter()
+    try:
+        with openai_client().beta.chat.completions.stream(
+            model=GENERATION_MODEL,
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            response_format=FlashcardCollection,
+            stream_options={"include_usage": True},
+        ) as stream:
+            emitted = 0
+            kept = 0
+            first = True
+            failing = []
+            for event in stream:
+                if event.type != 'content.delta' or not isinstance(event.parsed, dict):
+                    continue
+                partial = event.parsed.get('flashcards') or []
+                while emitted < len(partial) - 1:
+                    accepted, failed = check_flashcards(
+                        [FlashcardSchema.model_validate(partial[emitted])])
+                    emitted += 1
+                    failing.extend(failed)
+                    for flashcard in accepted:
+                        if first:
+                            openai_first_flashcard.observe(time.perf_counter() - start)
+                            first = False
+                        kept += 1
+                        yield flashcard
+            completion = stream.get_final_completion()
+    except Exception as e:
+        openai_errors.inc(mode='stream', error=type(e).__name__)
+        raise
+    openai_duration.observe(time.perf_counter() - start, mode='stream')
+    record_openai_usage(estimated_tokens, completion.usage)
+    flashcards = completion.choices[0].message.parsed
+    accepted, failed = check_flashcards(flashcards.flashcards[emitted:])
+    failing.extend(failed)
+    if first and accepted:
+        openai_first_flashcard.observe(time.perf_counter() - start)
+    for flashcard in accepted:
+        kept += 1
+        yield flashcard
+    repaired, repair_tokens = repair_flashcards(failing)
+    record_generation(kept, len(repaired), len(failing) - len(repaired),
+                      usage_tokens(completion.usage) + repair_tokens)
+    for flashcard in repaired:
+        yield flashcard
+
+
+def iter_flashcards_from_text(n, text):
+    """
+    Splits long source text into token-bounded chunks, generates each chunk's share of the
+    n flashcards concurrently and yields cards as their chunk completes, skipping
+    near-duplicates and renumbering the rest.
+    """
+    chunks = split_text(text, SOURCE_CHUNK_TOKENS)
+    counts = allocate(n, [count_tokens(chunk) for chunk in chunks])
+    futures = {chunk_executor.submit(generate_flashcards, count, text=chunk): count
+               for chunk, count in zip(chunks, counts) if count}
+    duplicates = NearDuplicateFilter()
+    next_id = 0
+    try:
+        for future in as_completed(futures):
+            for flashcard in future.result()[:futures[future]]:
+                if duplicates.add(flashcard.front, flashcard.back):
+                    flashcard.id = next_id
+                    next_id += 1
+                    yield flashcard
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def generate_flashcards_from_text(n, text):
+    return list(iter_flashcards_from_text(n, text))
+
+
+def generation_cache_key(n, topic=None, reference=None, text=None):
+    if topic:
+        source = 'topic:' + ' '.join(topic.lower().split())
+    elif reference:
+        source = 'reference:' + hashlib.sha256(reference.encode()).hexdigest()
+    elif text:
+        source = 'text:' + hashlib.sha256(text.encode()).hexdigest()
+    else:
+        raise ValueError(
+            "You must provide a topic, reference, or text to generate flashcards.")
+    return hashlib.sha256(f"{GENERATION_MODEL}|{n}|{source}".encode()).hexdigest()
+
+
+def get_cached_flashcards(key):
+    from schemas import FlashcardSchema
+    cached = generation_cache.get(key)
+    if cached is None and generation_disk_cache is not None:
+        cached = generation_disk_cache.get(key)
+        if cached is not None:
+            generation_cache.set(key, cached)
+    if cached is None:
+        return None
+    return [FlashcardSchema.model_validate(flashcard) for flashcard in cached]
+
+
+def cache_flashcards(key, flashcards):
+    dumped = [flashcard.model_dump() for flashcard in flashcards]
+    generation_cache.set(key, dumped)
+    if generation_disk_cache is not None:
+        generation_disk_cache.set(key, dumped)
+    return dumped
+
+
+def generate_flashcards_cached(n, topic=None, reference=None, text=None, fresh=False):
+    """
+    Returns generated flashcards from the generation cache when possible. Concurrent
+    identical requests in this process share a single upstream call. fresh skips the
+    cache lookup (the new result still replaces the cached one).
+    """
+    from schemas import FlashcardSchema
+    key = generation_cache_key(n, topic, reference, text)
+    if not fresh:
+        cached = get_cached_flashcards(key)
+        if cached is not None:
+            return cached
+
+    def load():
+        if text and not topic and not reference:
+            flashcards = generate_flashcards_from_text(n, text)
+        else:
+            flashcards = generate_flashcards(n, topic, reference)
+        return cache_flashcards(key, flashcards)
+
+    flashcards = generation_flight.do(key, load)
+    return [FlashcardSchema.model_validate(flashcard) for flashcard in flashcards]
+
+
+def run_generation_job(n, topic=None, reference=None, text=None, fresh=False):
+    flashcards = generate_flashcards_cached(n, topic, reference, text, fresh)
+    return [flashcard.model_dump() for flashcard in flashcards]
+
+
+def stream_flashcards_cached(n, topic=None, reference=None, text=None, fresh=False):
+    """
+    Streaming counterpart of generate_flashcards_cached: replays a cached result, or
+    streams a live generation and caches it once it has completed.
+    """
+    key = generation_cache_key(n, topic, reference, text)
+    if not fresh:
+        cached = get_cached_flashcards(key)
+        if cached is not None:
+            yield from cached
+            return
+
+    if text and not topic and not reference:
+        source = iter_flashcards_from_text(n, text)
+    else:
+        source = stream_flashcards(n, topic, reference)
+    flashcards = []
+    for flashcard in source:
+        flashcards.append(flashcard)
+        yield flashcard
+    cache_flashcards(key, flashcards)
 
 
 # ========= UTILS =========
 def clear_all_decks():
-    db.reference('decks').delete()
-    db.reference('deck_counter').set(0)
-    print("All decks have been deleted.")
+    """
+    Deletes every deck and every user's reviews and indexes in bounded batches, taking
+    the same steps as the deletion jobs.
+    """
+    steps = []
+    for deck_id in cascade.entries(ref('decks').get(shallow=True)):
+        steps.extend(cascade.deck_steps(deck_id))
+    user_ids = set()
+    for node in ('due_index', 'reviews', 'search_docs', 'search_index'):
+        user_ids.update(cascade.entries(ref(node).get(shallow=True)))
+    for user_id in sorted(user_ids):
+        steps.extend(cascade.user_index_steps(user_id))
+    for step in steps:
+        run_deletion_step(step)
+    ref().update({'decks': None, 'deck_meta': None, 'deck_changes': None, 'deck_counter': 0})
+    deck_id_allocator.reset()
+    log.warning('all_decks_deleted')
+
+
+def backfill_due_index():
+    """
+    Adds flashcards created before the due index existed to their deck owner's index,
+    due immediately. Flashcards that are already indexed are left as they are.
+    """
+    for deck_id in ref('decks').get(shallow=True) or {}:
+        owner = get_deck_owner(deck_id)
+        flashcard_ids = ref(f'decks/{deck_id}/flashcards').get(shallow=True) or {}
+        if owner is None or not flashcard_ids:
+            continue
+        if isinstance(flashcard_ids, list):
+            flashcard_ids = [i for i, present in enumerate(flashcard_ids) if present]
+        indexed = set(deck_review_keys(owner, deck_id))
+        updates = {f'due_index/{owner}/{review_key(deck_id, flashcard_id)}': SERVER_TIMESTAMP
+                   for flashcard_id in flashcard_ids
+                   if review_key(deck_id, flashcard_id) not in indexed}
+        if updates:
+            ref().update(updates)
+            log.info('due_index_backfilled', deck_id=deck_id, flashcards=len(updates))
+
+
+def backfill_search_index():
+    """
+    Indexes flashcards created before the search index existed, one deck at a time.
+    """
+    for deck_id in ref('decks').get(shallow=True) or {}:
+        owner = get_deck_owner(deck_id)
+        if owner is None:
+            continue
+        indexed = deck_search_docs(owner, deck_id)
+        flashcards = flashcard_items(ref(f'decks/{deck_id}/flashcards').get())
+        updates = {}
+        for flashcard_id, flashcard in flashcards:
+            key = review_key(deck_id, flashcard_id)
+            if key not in indexed:
+                updates.update(index_updates(owner, key, {}, term_weights(flashcard)))
+        if updates:
+            ref().update(updates)
+            log.info('search_index_backfilled', deck_id=deck_id)
 
 
 def clear_all_users():
-    db.reference('users').delete()
-    print("All users have been deleted.")
+    ref('users').delete()
+    log.warning('all_users_deleted')
 
 
 # ========= TESTS =========
@@ -590,7 +2360,7 @@ def test_firebase_and_gen():
     # test adding decks
     new_deck_id_1 = create_deck(0, "Python Programming")
     # test get deck
-    deck_ref = db.reference(f'decks/{new_deck_id_1}')
+    deck_ref = ref(f'decks/{new_deck_id_1}')
     deck_data = deck_ref.get()
     print(deck_data)
     new_deck_id_2 = create_deck(1, "Data Science")
@@ -619,4 +2389,4 @@ def test_firebase_and_gen():
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
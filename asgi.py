@@ -0,0 +1,540 @@
+"""
+ASGI entry point. The read and generation routes, where requests spend nearly all their
+time waiting on Firebase and OpenAI, are served by async handlers sharing one pooled
+RTDB client and one AsyncOpenAI client. Every other route falls through to the Flask app.
+
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flashsmart
+from async_rtdb import AsyncDatabase
+from jobs import RateLimitTimeout
+from response_encoding import encode_payload
+from schemas import FlashcardCollection, FlashcardSchema
+from text_processing import NearDuplicateFilter, allocate, count_tokens, split_text
+
+FIREBASE_CONCURRENCY = int(os.getenv("FIREBASE_FANOUT_WORKERS", 8))
+CHUNK_CONCURRENCY = int(os.getenv("GENERATION_CHUNK_WORKERS", 4))
+# calls that may wait on a local SQLite file, the rate limits and the generation disk cache,
+# run here rather than on the event loop or the default executor
+sqlite_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_SQLITE_WORKERS", 4)))
+
+rtdb = None
+aclient = None
+_inflight_generations = {}
+
+
+@contextlib.asynccontextmanager
+async def lifespan(starlette_app):
+    global rtdb, aclient
+    firebase_app = flashsmart.firebase_app()
+    rtdb = AsyncDatabase(firebase_app.options.get('databaseURL'), firebase_app.credential,
+                         max_connections=int(os.getenv("FIREBASE_MAX_CONNECTIONS", 100)),
+                         observer=flashsmart.observe_firebase)
+    aclient = openai.AsyncOpenAI()
+    yield
+    await rtdb.aclose()
+    await aclient.close()
+
+
+async def run_sqlite(uses_sqlite, function, *args):
+    """
+    Calls function on sqlite_executor if uses_sqlite, otherwise right away, as the
+    in-memory variants do not block.
+    """
+    if not uses_sqlite:
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(
+        sqlite_executor, functools.partial(function, *args))
+
+
+# ========= FIREBASE =========
+async def get_user_decks(user_id):
+    key = ('user', user_id)
+    decks = flashsmart.auth_cache.get(key)
+    if decks is None:
+        user_data = await rtdb.get(f'users/{user_id}')
+        if not user_data:
+            return None
+        decks = frozenset(user_data.get('decks') or [])
+        flashsmart.auth_cache.set(key, decks)
+    return decks
+
+
+async def get_deck_owner(deck_id):
+    key = ('owner', str(deck_id))
+    owner = flashsmart.auth_cache.get(key)
+    if owner is None:
+        owner = await rtdb.get(f'decks/{deck_id}/owner')
+        if owner is None:
+            return None
+        flashsmart.auth_cache.set(key, owner)
+    return owner
+
+
+async def verify_user_exists(user_id):
+    return await get_user_decks(user_id) is not None
+
+
+async def verify_user_has_deck(user_id, deck_id):
+    decks, owner = await asyncio.gather(get_user_decks(user_id), get_deck_owner(deck_id))
+    return decks is not None and deck_id in decks and owner == user_id
+
+
+async def get_deck_meta(deck_id, semaphore):
+    async with semaphore:
+        meta = await rtdb.get(f'deck_meta/{deck_id}')
+    if meta and 'owner' in meta:
+        return meta
+    return await asyncio.to_thread(flashsmart.rebuild_deck_meta, deck_id)
+
+
+async def get_decks(user_id):
+    user_data = await rtdb.get(f'users/{user_id}')
+    if not user_data:
+        return None
+    decks = user_data.get('decks') or []
+    semaphore = asyncio.Semaphore(FIREBASE_CONCURRENCY)
+    metas = await asyncio.gather(*(get_deck_meta(deck_id, semaphore) for deck_id in decks))
+    named_decks = {}
+    live_decks = []
+    for deck_id, meta in zip(decks, metas):
+        if meta is None:
+            continue
+        live_decks.append(deck_id)
+        named_decks[str(deck_id)] = {
+            "deck_owner": meta.get('owner'),
+            "deck_name": meta.get('name'),
+            "deck_description": meta.get('description'),
+            "card_count": meta.get('card_count', 0),
+            "last_modified": meta.get('last_modified')}
+    if len(live_decks) != len(decks):
+        await rtdb.update(f'users/{user_id}', {'decks': live_decks})
+        flashsmart.auth_cache.invalidate(('user', user_id))
+    return named_decks
+
+
+async def get_deck_etag(deck_id):
+    version = await rtdb.get(f'decks/{deck_id}/version')
+    if version is None:
+        return None
+    return f'{deck_id}.{version}'
+
+
+async def get_flashcards_page(deck_id, limit, after=None):
+    if await get_deck_owner(deck_id) is None:
+        return None
+    if after is not None:
+        page = await rtdb.query_by_key(f'decks/{deck_id}/flashcards',
+                                       start_at=after, limit_to_first=limit + 2)
+    else:
+        page = await rtdb.query_by_key(f'decks/{deck_id}/flashcards',
+                                       limit_to_first=limit + 1)
+    items = [(flashcard_id, flashcard)
+             for flashcard_id, flashcard in flashsmart.flashcard_items(page)
+             if flashcard_id != str(after)]
+    next_after = items[limit - 1][0] if len(items) > limit else None
+    return dict(items[:limit]), next_after
+
+
+# ========= GEN AI =========
+async def build_deck_reference(deck_id):
+    key = (deck_id, await rtdb.get(f'decks/{deck_id}/version') or 0)
+    reference = flashsmart.reference_cache.get(key)
+    if reference is None:
+        meta, card_counter = await asyncio.gather(
+            rtdb.get(f'deck_meta/{deck_id}'), rtdb.get(f'decks/{deck_id}/card_counter'))
+        pages = await asyncio.gather(*(
+            rtdb.query_by_key(f'decks/{deck_id}/flashcards', start_at=start,
+                              limit_to_first=length)
+            for start, length in flashsmart.reference_windows(card_counter or 0)))
+        flashcards = {}
+        for page in pages:
+            flashcards.update(flashsmart.flashcard_items(page))
+        if not meta:
+            return None
+        reference = flashsmart.sampled_reference(meta, flashcards)
+        flashsmart.reference_cache.set(key, reference)
+    return reference
+
+
+async def parse_flashcards(prompt, n, mode='parse'):
+    estimated_tokens = flashsmart.estimate_generation_tokens(prompt, n)
+    await flashsmart.openai_limiter.acquire_async(estimated_tokens)
+
+    start = time.perf_counter()
+    try:
+        completion = await aclient.beta.chat.completions.parse(
+            model=flashsmart.GENERATION_MODEL,
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            response_format=FlashcardCollection,
+        )
+    except Exception as e:
+        flashsmart.openai_errors.inc(mode=mode, error=type(e).__name__)
+        raise
+    flashsmart.openai_duration.observe(time.perf_counter() - start, mode=mode)
+    flashsmart.record_openai_usage(estimated_tokens, completion.usage)
+
+    flashcards = completion.choices[0].message.parsed
+    return flashcards.flashcards, flashsmart.usage_tokens(completion.usage)
+
+
+async def repair_flashcards(failing):
+    repaired = []
+    tokens = 0
+    for _ in range(flashsmart.GENERATION_REPAIR_ATTEMPTS):
+        if not failing:
+            break
+        rewritten, used = await parse_flashcards(
+            flashsmart.build_repair_prompt(failing), len(failing), mode='repair')
+        tokens += used
+        fixed, failing = flashsmart.merge_repairs(failing, rewritten)
+        repaired.extend(fixed)
+    return repaired, tokens
+
+
+async def generate_flashcards(n, topic=None, reference=None, text=None):
+    prompt = flashsmart.build_flashcard_prompt(n, topic, reference, text)
+    flashcards, tokens = await parse_flashcards(prompt, n)
+    accepted, failing = flashsmart.check_flashcards(flashcards)
+    repaired, repair_tokens = await repair_flashcards(failing)
+    flashsmart.record_generation(len(accepted), len(repaired), len(failing) - len(repaired),
+                                 tokens + repair_tokens)
+    order = {flashcard.id: position for position, flashcard in enumerate(flashcards)}
+    return sorted(accepted + repaired, key=lambda flashcard: order.get(flashcard.id, 0))
+
+
+async def stream_flashcards(n, topic=None, reference=None, text=None):
+    prompt = flashsmart.build_flashcard_prompt(n, topic, reference, text)
+    estimated_tokens = flashsmart.estimate_generation_tokens(prompt, n)
+    await flashsmart.openai_limiter.acquire_async(estimated_tokens)
+
+    start = time.perf_counter()
+    try:
+        async with aclient.beta.chat.completions.stream(
+            model=flashsmart.GENERATION_MODEL,
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            response_format=FlashcardCollection,
+            stream_options={"include_usage": True},
+        ) as stream:
+            emitted = 0
+            kept = 0
+            first = True
+            failing = []
+            async for event in stream:
+                if event.type != 'content.delta' or not isinstance(event.parsed, dict):
+                    continue
+                partial = event.parsed.get('flashcards') or []
+                while emitted < len(partial) - 1:
+                    accepted, failed = flashsmart.check_flashcards(
+                        [FlashcardSchema.model_validate(partial[emitted])])
+                    emitted += 1
+                    failing.extend(failed)
+                    for flashcard in accepted:
+                        if first:
+                            flashsmart.openai_first_flashcard.observe(time.perf_counter() - start)
+                            first = False
+                        kept += 1
+                        yield flashcard
+            completion = await stream.get_final_completion()
+    except Exception as e:
+        flashsmart.openai_errors.inc(mode='stream', error=type(e).__name__)
+        raise
+    flashsmart.openai_duration.observe(time.perf_counter() - start, mode='stream')
+    flashsmart.record_openai_usage(estimated_tokens, completion.usage)
+    flashcards = completion.choices[0].message.parsed
+    accepted, failed = flashsmart.check_flashcards(flashcards.flashcards[emitted:])
+    failing.extend(failed)
+    if first and accepted:
+        flashsmart.openai_first_flashcard.observe(time.perf_counter() - start)
+    for flashcard in accepted:
+        kept += 1
+        yield flashcard
+    repaired, repair_tokens = await repair_flashcards(failing)
+    flashsmart.record_generation(kept, len(repaired), len(failing) - len(repaired),
+                                 flashsmart.usage_tokens(completion.usage) + repair_tokens)
+    for flashcard in repaired:
+        yield flashcard
+
+
+async def iter_flashcards_from_text(n, text):
+    chunks = split_text(text, flashsmart.SOURCE_CHUNK_TOKENS)
+    counts = allocate(n, [count_tokens(chunk) for chunk in chunks])
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def generate_chunk(chunk, count):
+        async with semaphore:
+            return (await generate_flashcards(count, text=chunk))[:count]
+
+    tasks = [asyncio.ensure_future(generate_chunk(chunk, count))
+             for chunk, count in zip(chunks, counts) if count]
+    duplicates = NearDuplicateFilter()
+    next_id = 0
+    try:
+        for task in asyncio.as_completed(tasks):
+            for flashcard in await task:
+                if duplicates.add(flashcard.front, flashcard.back):
+                    flashcard.id = next_id
+                    next_id += 1
+                    yield flashcard
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def generate_flashcards_cached(n, topic=None, reference=None, text=None, fresh=False):
+    key = flashsmart.generation_cache_key(n, topic, reference, text)
+    if not fresh:
+        cached = await run_sqlite(flashsmart.generation_disk_cache is not None,
+                                  flashsmart.get_cached_flashcards, key)
+        if cached is not None:
+            return cached
+
+    async def load():
+        if text and not topic and not reference:
+            flashcards = [flashcard async for flashcard in iter_flashcards_from_text(n, text)]
+        else:
+            flashcards = await generate_flashcards(n, topic, reference)
+        return await run_sqlite(flashsmart.generation_disk_cache is not None,
+                                flashsmart.cache_flashcards, key, flashcards)
+
+    task = _inflight_generations.get(key)
+    if task is None:
+        task = _inflight_generations[key] = asyncio.ensure_future(load())
+        task.add_done_callback(lambda _: _inflight_generations.pop(key, None))
+    flashcards = await asyncio.shield(task)
+    return [FlashcardSchema.model_validate(flashcard) for flashcard in flashcards]
+
+
+async def stream_flashcards_cached(n, topic=None, reference=None, text=None, fresh=False):
+    key = flashsmart.generation_cache_key(n, topic, reference, text)
+    if not fresh:
+        cached = await run_sqlite(flashsmart.generation_disk_cache is not None,
+                                  flashsmart.get_cached_flashcards, key)
+        if cached is not None:
+            for flashcard in cached:
+                yield flashcard
+            return
+
+    if text and not topic and not reference:
+        source = iter_flashcards_from_text(n, text)
+    else:
+        source = stream_flashcards(n, topic, reference)
+    flashcards = []
+    async for flashcard in source:
+        flashcards.append(flashcard)
+        yield flashcard
+    await run_sqlite(flashsmart.generation_disk_cache is not None,
+                     flashsmart.cache_flashcards, key, flashcards)
+
+
+# ========= ENDPOINTS =========
+def timed(endpoint, handler):
+    """
+    Records the handler's response time in the same request metrics as the Flask routes.
+    """
+    async def timed_handler(request):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status_code
+            return response
+        finally:
+            flashsmart.request_duration.observe(
+                time.perf_counter() - start, endpoint=endpoint, method=request.method,
+                status=status)
+    return timed_handler
+
+
+def limited(route_class, handler):
+    """
+    Applies the per-user rate limit of route_class before the handler, like the Flask
+    routes' before-request hook.
+    """
+    async def limited_handler(request):
+        if flashsmart.RATE_LIMITS_ENABLED:
+            user_id = request.query_params.get('user_id')
+            if user_id is None and request.method == 'POST':
+                try:
+                    data = await request.json()
+                except ValueError:
+                    data = None
+                user_id = data.get('user_id') if isinstance(data, dict) else None
+            if user_id is None:
+                user_id = 'client:' + str(flashsmart.client_address(
+                    request.headers.get('x-forwarded-for'),
+                    request.client.host if request.client is not None else None,
+                    flashsmart.RATE_LIMIT_PROXY_HOPS))
+            retry_after = await run_sqlite(bool(flashsmart.rate_limiter.path),
+                                           flashsmart.rate_limit, user_id, route_class)
+            if retry_after:
+                return JSONResponse({'error': 'Too many requests, try again later.'},
+                                    status_code=429, headers={'Retry-After': str(retry_after)})
+        return await handler(request)
+    return limited_handler
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def negotiated_response(request, payload, headers=None):
+    body, mimetype, content_encoding = encode_payload(
+        payload, request.headers.get('accept'), request.headers.get('accept-encoding'),
+        flashsmart.COMPRESSION_MIN_BYTES)
+    headers = dict(headers or {}, Vary='Accept, Accept-Encoding')
+    if content_encoding:
+        headers['Content-Encoding'] = content_encoding
+    return Response(body, media_type=mimetype, headers=headers)
+
+
+async def hello(request):
+    return JSONResponse({'hello': 'world'})
+
+
+async def get_decks_endpoint(request):
+    clerk_user_id = request.query_params.get('user_id')
+    if not await verify_user_exists(clerk_user_id):
+        return JSONResponse({'error': 'Invalid user credentials.'}, status_code=401)
+    decks = await get_decks(clerk_user_id)
+    return negotiated_response(request, {'decks': decks})
+
+
+async def get_flashcards_endpoint(request):
+    deck_id = request.query_params.get('deck_id')
+    after = request.query_params.get('after')
+    limit = request.query_params.get('limit')
+    if limit is not None:
+        limit = flashsmart.positive_int(limit)
+        if limit is None:
+            return JSONResponse({'error': 'limit must be a positive integer.'}, status_code=400)
+        limit = min(limit, flashsmart.FLASHCARDS_PAGE_LIMIT)
+    etag = await get_deck_etag(deck_id)
+    pending = flashsmart.edit_buffer.pending(str(deck_id)) if flashsmart.WRITE_BEHIND_EDITS else {}
+    if pending:
+        # the deck revision does not cover edits that are not written yet
+        etag = None
+    headers = {'ETag': f'W/"{etag}"'} if etag else None
+    if etag and etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    if limit:
+        page = await get_flashcards_page(deck_id, limit, after)
+        if page is None:
+            return JSONResponse({'error': 'Deck does not exist.'}, status_code=404)
+        flashcards, next_after = page
+        flashcards = flashsmart.overlay_pending_edits(flashcards, pending)
+        return negotiated_response(
+            request, {'flashcards': flashcards, 'next_after': next_after}, headers)
+    flashcards = await rtdb.get(f'decks/{deck_id}')
+    if not flashcards:
+        return JSONResponse({'error': 'Deck does not exist.'}, status_code=404)
+    if pending:
+        flashcards = dict(flashcards, flashcards=flashsmart.overlay_pending_edits(
+            flashcards.get('flashcards'), pending))
+    return negotiated_response(request, {'flashcards': flashcards}, headers)
+
+
+async def generate_flashcards_endpoint(request):
+    data = await request.json()
+    clerk_user_id = data.get('user_id')
+    if not await verify_user_exists(clerk_user_id):
+        return JSONResponse({'error': 'Invalid user credentials.'}, status_code=401)
+    n = flashsmart.positive_int(data.get('n'))
+    if n is None:
+        return JSONResponse({'error': 'n must be a positive integer.'}, status_code=400)
+    if n > flashsmart.MAX_GENERATED_FLASHCARDS:
+        return JSONResponse(
+            {'error': f'n must be at most {flashsmart.MAX_GENERATED_FLASHCARDS}.'}, status_code=400)
+    topic = data.get('topic')
+    reference = data.get('reference')
+    text = data.get('text')
+    fresh = bool(data.get('fresh'))
+    if data.get('deck_id') is not None and not reference:
+        if not await verify_user_has_deck(clerk_user_id, data.get('deck_id')):
+            return JSONResponse(
+                {'error': 'User does not have access to this deck.'}, status_code=403)
+        reference = await build_deck_reference(data.get('deck_id'))
+        if reference is None:
+            return JSONResponse({'error': 'Deck does not exist.'}, status_code=404)
+    if request.query_params.get('stream') in ('1', 'true'):
+        sse = 'text/event-stream' in request.headers.get('accept', '')
+        return StreamingResponse(
+            stream_flashcards_body(
+                stream_flashcards_cached(n, topic, reference, text, fresh), sse),
+            media_type='text/event-stream' if sse else 'application/x-ndjson',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    try:
+        flashcards = await generate_flashcards_cached(n, topic, reference, text, fresh)
+    except RateLimitTimeout:
+        return JSONResponse(
+            {'error': 'Generation capacity exceeded, try again later.'}, status_code=429)
+    return JSONResponse({'flashcards': [flashcard.model_dump() for flashcard in flashcards]})
+
+
+async def stream_flashcards_body(flashcards, sse):
+    def encode(message):
+        if sse:
+            return f"data: {json.dumps(message)}\n\n"
+        return json.dumps(message) + "\n"
+
+    count = 0
+    try:
+        async for flashcard in flashcards:
+            count += 1
+            yield encode({'flashcard': flashcard.model_dump()})
+    except Exception:
+        flashsmart.log.exception('flashcard_stream_failed', flashcards_sent=count)
+        yield encode({'error': 'Flashcard generation failed.'})
+        return
+    yield encode({'done': True, 'count': count})
+
+
+app = Starlette(
+    routes=[
+        Route('/hello', timed('/hello', hello), methods=['POST']),
+        Route('/get-decks', timed('/get-decks', limited('read', get_decks_endpoint)),
+              methods=['GET']),
+        Route('/get-flashcards', timed('/get-flashcards', limited('read', get_flashcards_endpoint)),
+              methods=['GET']),
+        Route('/generate-flashcards',
+              timed('/generate-flashcards', limited('generation', generate_flashcards_endpoint)),
+              methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flashsmart.create_app())),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'],
+                   allow_headers=['*'], expose_headers=['ETag', 'Retry-After']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,97 @@
+import asyncio
+import calendar
+import json
+import time
+from collections import OrderedDict
+
+import httpx
+
+
+def _key_order(key):
+    """
+    Realtime Database key ordering: keys that parse as 32-bit integers come first in
+    numeric order, followed by the remaining keys in lexicographic order.
+    """
+    try:
+        number = int(key)
+        if str(number) == key and -2 ** 31 <= number < 2 ** 31:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0, key)
+
+
+class AsyncDatabase:
+    """
+    asyncio client for the Realtime Database REST API. One pooled HTTP client is shared
+    by every request, and the service account access token is refreshed off the event loop.
+    """
+
+    def __init__(self, database_url, credential, max_connections=100, timeout=10, observer=None):
+        self.database_url = database_url.rstrip('/')
+        self._credential = credential
+        # called as observer(operation, path, seconds, failed) after every round trip
+        self._observer = observer
+        self._token = None
+        self._token_expiry = 0
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=timeout)
+
+    async def _headers(self):
+        if self._token is None or time.time() > self._token_expiry - 60:
+            token = await asyncio.to_thread(self._credential.get_access_token)
+            self._token = token.access_token
+            self._token_expiry = (calendar.timegm(token.expiry.utctimetuple())
+                                  if token.expiry else time.time() + 3000)
+        return {'Authorization': f'Bearer {self._token}'}
+
+    async def _request(self, operation, method, path, params=None, value=None):
+        url = f"{self.database_url}/{str(path).strip('/')}.json"
+        kwargs = {'params': params, 'headers': await self._headers()}
+        if value is not None:
+            kwargs['content'] = json.dumps(value)
+        start = time.perf_counter()
+        try:
+            response = await self._client.request(method, url, **kwargs)
+            response.raise_for_status()
+        except Exception:
+            if self._observer:
+                self._observer(operation, path, time.perf_counter() - start, True)
+            raise
+        if self._observer:
+            self._observer(operation, path, time.perf_counter() - start, False)
+        return response.json() if response.content else None
+
+    async def get(self, path, shallow=False):
+        return await self._request('get', 'GET', path,
+                                   params={'shallow': 'true'} if shallow else None)
+
+    async def query_by_key(self, path, start_at=None, end_at=None, limit_to_first=None):
+        """
+        Runs an orderBy="$key" query and returns the children in key order.
+        """
+        params = {'orderBy': '"$key"'}
+        if start_at is not None:
+            params['startAt'] = json.dumps(str(start_at))
+        if end_at is not None:
+            params['endAt'] = json.dumps(str(end_at))
+        if limit_to_first is not None:
+            params['limitToFirst'] = limit_to_first
+        result = await self._request('query', 'GET', path, params=params)
+        if isinstance(result, list):
+            return result
+        return OrderedDict(sorted((result or {}).items(), key=lambda item: _key_order(item[0])))
+
+    async def set(self, path, value):
+        await self._request('set', 'PUT', path, params={'print': 'silent'}, value=value)
+
+    async def update(self, path, value):
+        await self._request('update', 'PATCH', path, params={'print': 'silent'}, value=value)
+
+    async def delete(self, path):
+        await self._request('delete', 'DELETE', path)
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,101 @@
+"""
+Cascading user deletion.
+
+Seeds one user owning --cards flashcards spread over --decks decks, with due index,
+review state and search index entries for every card, then deletes the user. Reports
+how long the /delete-user request took, how long the background job took, how many
+writes it made, and the largest single write in paths and bytes. The request and the
+largest write should stay flat as the number of cards grows. Job times at 100000 cards
+are dominated by the in-memory fake, which sorts a node's children on every query.
+
+    python -m bench.bench_cascade [--cards 1000 10000] [--decks 10] [--latency-ms 5]
+"""
+import argparse
+import json
+import time
+
+from bench.fake_firebase import FakeDatabase
+from bench.harness import flask_app, load_app
+from bench.run_benchmarks import flashcard
+
+USER_ID = 'bench-user'
+
+
+class WriteSizeDatabase(FakeDatabase):
+    """
+    Records the largest multi-path update, in paths and in bytes.
+    """
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.largest_paths = 0
+        self.largest_bytes = 0
+
+    def _count(self, kind, payload):
+        super()._count(kind, payload)
+        if kind == 'write' and isinstance(payload, dict):
+            self.largest_paths = max(self.largest_paths, len(payload))
+            self.largest_bytes = max(self.largest_bytes, len(json.dumps(payload, default=str)))
+
+
+def seed(app, database, cards, decks):
+    database.root = {}
+    app.auth_cache.clear()
+    app.deck_id_allocator.reset()
+    app.add_user(USER_ID, "Bench")
+    per_deck = max(1, cards // decks)
+    for _ in range(decks):
+        deck_id = app.create_deck(USER_ID, "Deck", "Benchmark deck")
+        app.add_deck_to_user(USER_ID, deck_id)
+        for start in range(0, per_deck, 1000):
+            app.add_flashcards(deck_id, [flashcard(i) for i in
+                                         range(start, min(per_deck, start + 1000))])
+        app.ref().update({f'reviews/{USER_ID}/{app.review_key(deck_id, i)}': {'interval': 1}
+                          for i in range(per_deck)})
+
+
+def run(app, client, database, cards, decks, latency):
+    database.latency = 0
+    seed(app, database, cards, decks)
+    database.latency = latency
+    database.reset_stats()
+    start = time.perf_counter()
+    response = client.post('/delete-user', json={'user_id': USER_ID})
+    request_ms = (time.perf_counter() - start) * 1000
+    app.deletion_executor.submit(lambda: None).result()
+    job_seconds = time.perf_counter() - start
+    job = app.ref(f"deletion_jobs/{response.get_json()['job_id']}").get()
+    left = [node for node in ('users', 'decks', 'deck_meta', 'due_index', 'reviews',
+                              'search_index', 'search_docs') if database.root.get(node)]
+    return {
+        'request_ms': request_ms,
+        'job_seconds': job_seconds,
+        'status': job['status'],
+        'deleted': job['deleted'],
+        'writes': database.stats['writes'],
+        'largest_paths': database.largest_paths,
+        'largest_kb': database.largest_bytes / 1024,
+        'left': ','.join(left) or '-',
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--decks', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    args = parser.parse_args(argv)
+
+    app, database, _ = load_app(WriteSizeDatabase())
+    client = flask_app(app).test_client()
+    print(f"{'cards':>7} {'request ms':>11} {'job s':>7} {'status':>10} {'deleted':>8} "
+          f"{'writes':>7} {'max paths':>10} {'max KB':>7} {'left':>5}")
+    for cards in args.cards:
+        result = run(app, client, database, cards, args.decks, args.latency_ms / 1000.0)
+        print(f"{cards:>7} {result['request_ms']:>11.1f} {result['job_seconds']:>7.2f} "
+              f"{result['status']:>10} {result['deleted']:>8} {result['writes']:>7} "
+              f"{result['largest_paths']:>10} {result['largest_kb']:>7.1f} {result['left']:>5}")
+
+
+if __name__ == '__main__':
+    main()
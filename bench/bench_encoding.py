@@ -0,0 +1,63 @@
+"""
+Deck payload encodings.
+
+Encodes the /get-flashcards body of a deck with each response encoding and reports
+the bytes on the wire and the median encode time, serialization plus compression,
+at several deck sizes. Cards are the benchmark fixtures, whose image URLs are empty
+as they are for most real cards. brotli rows are skipped when brotli is not installed.
+
+    python -m bench.bench_encoding [--cards 10 500 5000] [--runs 15]
+"""
+import argparse
+import statistics
+import time
+
+import response_encoding
+from bench.run_benchmarks import flashcard
+
+ENCODINGS = (
+    ('json', 'application/json', None),
+    ('json+gzip', 'application/json', 'gzip'),
+    ('json+br', 'application/json', 'br'),
+    ('msgpack', 'application/msgpack', None),
+    ('msgpack+gzip', 'application/msgpack', 'gzip'),
+    ('msgpack+br', 'application/msgpack', 'br'),
+)
+
+
+def available(mimetype, encoding):
+    if mimetype == response_encoding.MSGPACK_MIMETYPE and response_encoding.msgpack is None:
+        return False
+    return encoding != 'br' or response_encoding.brotli is not None
+
+
+def measure(payload, mimetype, encoding, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        body, _, _ = response_encoding.encode_payload(payload, mimetype, encoding, min_size=0)
+        times.append(time.perf_counter() - start)
+    return len(body), statistics.median(times) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, nargs='+', default=[10, 500, 5000])
+    parser.add_argument('--runs', type=int, default=15)
+    args = parser.parse_args(argv)
+
+    print(f"{'cards':>6} {'encoding':>13} {'bytes':>10} {'vs json':>8} {'encode ms':>10}")
+    for cards in args.cards:
+        payload = {'flashcards': {str(i): flashcard(i) for i in range(cards)}}
+        json_bytes = None
+        for name, mimetype, encoding in ENCODINGS:
+            if not available(mimetype, encoding):
+                print(f"{cards:>6} {name:>13} {'not installed':>30}")
+                continue
+            size, encode_ms = measure(payload, mimetype, encoding, args.runs)
+            json_bytes = json_bytes or size
+            print(f"{cards:>6} {name:>13} {size:>10} {size / json_bytes:>8.2f} {encode_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Per-user rate limit checks.
+
+Times UserRateLimiter.check with buckets in process memory and in a shared SQLite file,
+from one process and from several processes at once, standing in for gunicorn workers
+hammering the same user. Reports the p50/p99 cost of allowed checks (which write the
+bucket) and throttled ones, and how many requests all processes together were allowed
+against what the limit permits.
+
+    python -m bench.bench_rate_limit [--processes 1 4 8] [--checks 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from rate_limits import UserRateLimiter
+
+USER_ID = 'bench-user'
+# tight enough that every run has both allowed and throttled checks
+LIMITS = {'write': (60000, 500)}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def worker(path, checks, start, results):
+    limiter = UserRateLimiter(LIMITS, path=path)
+    while time.time() < start:
+        time.sleep(0.001)
+    allowed = []
+    throttled = []
+    for _ in range(checks):
+        begin = time.perf_counter()
+        wait = limiter.check(USER_ID, 'write')
+        (throttled if wait else allowed).append(time.perf_counter() - begin)
+    results.put((allowed, throttled, time.time() - start, limiter.errors))
+
+
+def run(path, processes, checks):
+    results = multiprocessing.Queue()
+    start = time.time() + 0.5
+    workers = [multiprocessing.Process(target=worker, args=(path, checks, start, results))
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    collected = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    allowed = [timing for result in collected for timing in result[0]]
+    throttled = [timing for result in collected for timing in result[1]] or [0.0]
+    elapsed = max(result[2] for result in collected)
+    per_minute, burst = LIMITS['write']
+    return {
+        'allowed_p50_us': percentile(allowed, 0.5) * 1e6,
+        'allowed_p99_us': percentile(allowed, 0.99) * 1e6,
+        'throttled_p50_us': percentile(throttled, 0.5) * 1e6,
+        'throttled_p99_us': percentile(throttled, 0.99) * 1e6,
+        'allowed': len(allowed),
+        'permitted': int(burst + elapsed * per_minute / 60),
+        'errors': sum(result[3] for result in collected),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--checks', type=int, default=2000, help="checks per process")
+    args = parser.parse_args(argv)
+
+    print(f"{'backend':>8} {'procs':>6} {'allowed p50/p99 us':>19} "
+          f"{'throttled p50/p99 us':>21} {'allowed':>8} {'permitted':>10} {'errors':>7}")
+    print_result('memory', 1, run(None, 1, args.checks))
+    with tempfile.TemporaryDirectory() as directory:
+        for processes in args.processes:
+            path = os.path.join(directory, f'limits-{processes}.db')
+            # created before the workers start, as under gunicorn --preload
+            UserRateLimiter(LIMITS, path=path)
+            print_result('sqlite', processes, run(path, processes, args.checks))
+
+
+def print_result(backend, processes, result):
+    allowed = f"{result['allowed_p50_us']:.1f}/{result['allowed_p99_us']:.1f}"
+    throttled = f"{result['throttled_p50_us']:.1f}/{result['throttled_p99_us']:.1f}"
+    print(f"{backend:>8} {processes:>6} {allowed:>19} {throttled:>21} {result['allowed']:>8} "
+          f"{result['permitted']:>10} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
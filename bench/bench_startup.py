@@ -0,0 +1,117 @@
+"""
+Cold start cost.
+
+Each run starts a fresh interpreter and measures, from the start of `import app`:
+- the import
+- building the app and answering POST /hello
+- the first Firebase-backed request (GET /get-decks)
+- the first generation (POST /generate-flashcards)
+It also lists which heavy client libraries were already loaded when /hello answered.
+Firebase and OpenAI are the in-memory fakes, so only local startup work is timed. With
+--rev the same probe also runs against that git revision of the tree, for comparison.
+
+    python -m bench.bench_startup [--runs 7] [--rev HEAD~1]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_firebase import FakeDatabase
+from bench.fake_openai import FakeOpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, 'bench')
+USER_ID = 'bench-user'
+HEAVY_MODULES = ('openai', 'firebase_admin', 'firebase_admin.db', 'pydantic', 'tiktoken')
+STAGES = ('import', 'hello', 'first_firebase', 'first_generation')
+
+
+def probe():
+    from bench.harness import flask_app, load_app
+
+    database = FakeDatabase()
+    database.root = {'users': {USER_ID: {'name': 'Bench'}}}
+    openai_fake = FakeOpenAI(first_token_ms=1, per_card_ms=0)
+
+    start = time.perf_counter()
+    app_module, _, _ = load_app(database, openai_fake)
+    imported = time.perf_counter()
+    client = flask_app(app_module).test_client()
+    client.post('/hello')
+    hello = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    client.get(f'/get-decks?user_id={USER_ID}')
+    first_firebase = time.perf_counter()
+    response = client.post('/generate-flashcards',
+                           json={'user_id': USER_ID, 'n': 3, 'topic': 'Startup'})
+    first_generation = time.perf_counter()
+    if response.status_code != 200:
+        raise RuntimeError(f"/generate-flashcards returned {response.status_code}")
+    print(json.dumps({
+        'import': (imported - start) * 1000,
+        'hello': (hello - start) * 1000,
+        'first_firebase': (first_firebase - start) * 1000,
+        'first_generation': (first_generation - start) * 1000,
+        'loaded_at_hello': loaded,
+    }))
+
+
+def run_tree(path, runs):
+    env = dict(os.environ, LOG_LEVEL='WARNING', FIREBASE_CRED_FN='bench.json',
+               FIREBASE_URL='https://bench.firebaseio.com', OPENAI_API_KEY='sk-bench')
+    results = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, '-m', 'bench.bench_startup', '--probe'],
+                                   cwd=path, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Probe failed in {path}:\n{completed.stderr}")
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    summary = {stage: statistics.median(result[stage] for result in results)
+               for stage in STAGES}
+    summary['loaded_at_hello'] = results[-1]['loaded_at_hello']
+    return summary
+
+
+def checkout(rev, directory):
+    """
+    Extracts the tree at rev into directory, with the current benchmark code.
+    """
+    archive = subprocess.run(['git', 'archive', rev], cwd=ROOT, capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', directory], input=archive.stdout, check=True)
+    shutil.copytree(BENCH_DIR, os.path.join(directory, 'bench'), dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns('__pycache__'))
+
+
+def print_summary(label, summary):
+    stages = ' '.join(f"{summary[stage]:>16.1f}" for stage in STAGES)
+    print(f"{label:>12} {stages}   {', '.join(summary['loaded_at_hello']) or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--rev', help="also measure this git revision, e.g. HEAD~1")
+    parser.add_argument('--probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.probe:
+        probe()
+        return
+
+    print(f"median ms over {args.runs} runs, cumulative from the start of `import app`")
+    print(f"{'tree':>12} " + ' '.join(f"{stage:>16}" for stage in STAGES) +
+          "   loaded at /hello")
+    print_summary('current', run_tree(ROOT, args.runs))
+    if args.rev:
+        with tempfile.TemporaryDirectory() as directory:
+            checkout(args.rev, directory)
+            print_summary(args.rev, run_tree(directory, args.runs))
+
+
+if __name__ == '__main__':
+    main()
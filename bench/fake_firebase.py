@@ -0,0 +1,328 @@
+"""
+In-memory stand-in for firebase_admin.db used by the benchmarks.
+
+It mimics the parts of the Realtime Database REST semantics the app relies on:
+string keys, integer-keyed objects coming back as arrays, multi-path updates,
+server values, etag transactions and ordered key/value queries. Every
+operation is counted and can be delayed to model network round trips.
+"""
+import copy
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class TransactionAbortedError(Exception):
+    pass
+
+
+def _split(path):
+    return [segment for segment in str(path).split('/') if segment]
+
+
+def _is_int_key(key):
+    try:
+        return str(int(key)) == key and -2 ** 31 <= int(key) < 2 ** 31
+    except (TypeError, ValueError):
+        return False
+
+
+def _key_sort(key):
+    if _is_int_key(key):
+        return (0, int(key), '')
+    return (1, 0, key)
+
+
+def _value_sort(value):
+    if value is None:
+        return (0, 0, '')
+    if isinstance(value, bool):
+        return (1, int(value), '')
+    if isinstance(value, (int, float)):
+        return (2, value, '')
+    if isinstance(value, str):
+        return (3, 0, value)
+    return (4, 0, '')
+
+
+def _normalize(value):
+    """Converts a client value into the stored form (string keys, no empties)."""
+    if isinstance(value, (list, tuple)):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        stored = {}
+        for key, child in value.items():
+            child = _normalize(child)
+            if child is not None:
+                stored[str(key)] = child
+        return stored or None
+    return value
+
+
+def _export(value):
+    """Converts a stored value into what the REST API would return."""
+    if not isinstance(value, dict):
+        return copy.deepcopy(value)
+    exported = {key: _export(child) for key, child in value.items()}
+    keys = list(exported)
+    if keys and all(_is_int_key(k) and int(k) >= 0 for k in keys):
+        largest = max(int(k) for k in keys)
+        if len(keys) * 2 > largest + 1:
+            array = [None] * (largest + 1)
+            for key, child in exported.items():
+                array[int(key)] = child
+            return array
+    return exported
+
+
+class FakeDatabase:
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.root = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.RLock()
+        self.random = random.Random(seed)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'reads': 0, 'writes': 0, 'bytes_read': 0,
+                      'bytes_written': 0, 'transaction_retries': 0}
+
+    def _round_trip(self):
+        if self.latency or self.jitter:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            time.sleep(delay)
+
+    def _count(self, kind, payload):
+        size = len(json.dumps(payload, default=str)) if payload is not None else 4
+        with self.lock:
+            if kind == 'read':
+                self.stats['reads'] += 1
+                self.stats['bytes_read'] += size
+            else:
+                self.stats['writes'] += 1
+                self.stats['bytes_written'] += size
+
+    def _resolve(self, segments):
+        node = self.root
+        for segment in segments:
+            if not isinstance(node, dict) or segment not in node:
+                return None
+            node = node[segment]
+        return node
+
+    def _server_value(self, segments, value):
+        if isinstance(value, dict) and '.sv' in value:
+            sv = value['.sv']
+            if sv == 'timestamp':
+                return int(time.time() * 1000)
+            if isinstance(sv, dict) and 'increment' in sv:
+                current = self._resolve(segments)
+                current = current if isinstance(current, (int, float)) else 0
+                return current + sv['increment']
+        if isinstance(value, dict):
+            return {k: self._server_value(segments + [str(k)], v)
+                    for k, v in value.items()}
+        return value
+
+    def _write(self, segments, value):
+        value = _normalize(self._server_value(segments, value))
+        if not segments:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        parents = []
+        for segment in segments[:-1]:
+            if not isinstance(node.get(segment), dict):
+                if value is None:
+                    return
+                node[segment] = {}
+            parents.append((node, segment))
+            node = node[segment]
+        if value is None:
+            node.pop(segments[-1], None)
+        else:
+            node[segments[-1]] = value
+        for parent, segment in reversed(parents):
+            if not parent[segment]:
+                del parent[segment]
+
+    def reference(self, path='/', app=None, url=None):
+        return FakeReference(self, _split(path))
+
+
+class FakeReference:
+
+    def __init__(self, database, segments):
+        self._db = database
+        self._segments = segments
+
+    @property
+    def key(self):
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self):
+        return '/' + '/'.join(self._segments)
+
+    @property
+    def parent(self):
+        if not self._segments:
+            return None
+        return FakeReference(self._db, self._segments[:-1])
+
+    def child(self, path):
+        return FakeReference(self._db, self._segments + _split(path))
+
+    def _etag(self, value):
+        return str(hash(json.dumps(value, sort_keys=True, default=str)))
+
+    def get(self, etag=False, shallow=False):
+        self._db._round_trip()
+        with self._db.lock:
+            value = self._db._resolve(self._segments)
+            if shallow and isinstance(value, dict):
+                value = {key: True for key in value}
+            else:
+                value = _export(value)
+            tag = self._etag(value)
+        self._db._count('read', value)
+        return (value, tag) if etag else value
+
+    def get_if_changed(self, etag):
+        value, tag = self.get(etag=True)
+        if tag == etag:
+            return False, None, None
+        return True, value, tag
+
+    def set(self, value):
+        self._db._round_trip()
+        self._db._count('write', value)
+        with self._db.lock:
+            self._db._write(self._segments, value)
+
+    def set_if_unchanged(self, expected_etag, value):
+        self._db._round_trip()
+        self._db._count('write', value)
+        with self._db.lock:
+            current = _export(self._db._resolve(self._segments))
+            if self._etag(current) != expected_etag:
+                return False, current, self._etag(current)
+            self._db._write(self._segments, value)
+        return True, value, self._etag(value)
+
+    def push(self, value=''):
+        key = '-' + ''.join(self._db.random.choice('abcdefghijklmnop')
+                            for _ in range(19))
+        ref = self.child(key)
+        ref.set(value)
+        return ref
+
+    def update(self, value):
+        if not value or not isinstance(value, dict):
+            raise ValueError('Value argument must be a non-empty dictionary.')
+        self._db._round_trip()
+        self._db._count('write', value)
+        with self._db.lock:
+            for key, child in value.items():
+                self._db._write(self._segments + _split(key), child)
+
+    def delete(self):
+        self._db._round_trip()
+        self._db._count('write', None)
+        with self._db.lock:
+            self._db._write(self._segments, None)
+
+    def transaction(self, transaction_update):
+        for _ in range(25):
+            value, tag = self.get(etag=True)
+            new_value = transaction_update(copy.deepcopy(value))
+            success, value, tag = self.set_if_unchanged(tag, new_value)
+            if success:
+                return new_value
+            with self._db.lock:
+                self._db.stats['transaction_retries'] += 1
+        raise TransactionAbortedError('Transaction aborted after failed retries.')
+
+    def order_by_key(self):
+        return FakeQuery(self, 'key')
+
+    def order_by_value(self):
+        return FakeQuery(self, 'value')
+
+    def order_by_child(self, path):
+        return FakeQuery(self, path)
+
+
+class FakeQuery:
+
+    def __init__(self, reference, order_by):
+        self._ref = reference
+        self._order_by = order_by
+        self._start = None
+        self._end = None
+        self._equal = None
+        self._first = None
+        self._last = None
+
+    def _sort_key(self, key, value):
+        if self._order_by == 'key':
+            return _key_sort(key)
+        if self._order_by == 'value':
+            return _value_sort(value) + _key_sort(key)
+        child = value
+        for segment in _split(self._order_by):
+            child = child.get(segment) if isinstance(child, dict) else None
+        return _value_sort(child) + _key_sort(key)
+
+    def _bound(self, bound):
+        if self._order_by == 'key':
+            return _key_sort(str(bound))
+        return _value_sort(bound)
+
+    def start_at(self, start):
+        self._start = start
+        return self
+
+    def end_at(self, end):
+        self._end = end
+        return self
+
+    def equal_to(self, value):
+        self._equal = value
+        return self
+
+    def limit_to_first(self, limit):
+        self._first = limit
+        return self
+
+    def limit_to_last(self, limit):
+        self._last = limit
+        return self
+
+    def get(self):
+        database = self._ref._db
+        database._round_trip()
+        with database.lock:
+            value = database._resolve(self._ref._segments)
+            items = list(value.items()) if isinstance(value, dict) else []
+            items.sort(key=lambda item: self._sort_key(*item))
+            if self._start is not None:
+                bound = self._bound(self._start)
+                items = [i for i in items if self._sort_key(*i)[:3] >= bound]
+            if self._end is not None:
+                bound = self._bound(self._end)
+                items = [i for i in items if self._sort_key(*i)[:3] <= bound]
+            if self._equal is not None:
+                bound = self._bound(self._equal)
+                items = [i for i in items if self._sort_key(*i)[:3] == bound]
+            if self._first is not None:
+                items = items[:self._first]
+            if self._last is not None:
+                items = items[-self._last:] if self._last else []
+            result = OrderedDict((k, _export(v)) for k, v in items)
+        database._count('read', result)
+        return result
@@ -0,0 +1,118 @@
+"""
+OpenAI stand-in for the benchmarks: a real openai.OpenAI client whose HTTP transport
+is replaced by a handler that fabricates flashcard completions. Latency follows a
+log-normal time to first token plus a per-card generation time, which is close to the
+shape of gpt-4o-mini latencies; streamed responses are paced accordingly. With
+overlong_every set, every such card of a generation breaks the front text limit;
+rewrite requests always come back within the limits.
+"""
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+
+_REQUESTED = re.compile(r'Generate (\d+)')
+_REWRITE = re.compile(r'^Rewrite (\d+)')
+_CARD_ID = re.compile(r'"id": (\d+)')
+
+
+class FakeOpenAI:
+
+    def __init__(self, first_token_ms=300, per_card_ms=60, sigma=0.35, seed=0,
+                 overlong_every=0):
+        self.first_token_ms = first_token_ms
+        self.overlong_every = overlong_every
+        self.per_card_ms = per_card_ms
+        self.sigma = sigma
+        self.calls = 0
+        self.prompt_chars = 0
+        self._random = random.Random(seed)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _latency(self, cards):
+        with self._lock:
+            first_token = self._random.lognormvariate(
+                math.log(self.first_token_ms / 1000.0), self.sigma)
+        return first_token, cards * self.per_card_ms / 1000.0
+
+    def _content(self, prompt):
+        serial = next(self._counter)
+        if _REWRITE.match(prompt):
+            ids = [int(card_id) for card_id in _CARD_ID.findall(prompt)]
+            overlong_every = 0
+        else:
+            match = _REQUESTED.search(prompt)
+            ids = range(int(match.group(1)) if match else 5)
+            overlong_every = self.overlong_every
+        flashcards = [{
+            'id': i,
+            'title': f"Card {serial}-{i}",
+            'front': f"Question {serial}-{i} about the requested material?" + (
+                " Explain it at length." * 12 if overlong_every and i % overlong_every == 0 else ""),
+            'back': f"Answer {serial}-{i}.",
+            'front_image_url': '',
+            'back_image_url': ''
+        } for i in ids]
+        return len(flashcards), json.dumps({'flashcards': flashcards})
+
+    def handle(self, request):
+        import httpx
+        body = json.loads(request.content)
+        prompt = body['messages'][0]['content']
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+        n, content = self._content(prompt)
+        first_token, generation = self._latency(n)
+        usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                 'total_tokens': len(prompt) // 4 + len(content) // 4}
+        if not body.get('stream'):
+            time.sleep(first_token + generation)
+            return httpx.Response(200, json={
+                'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': 0,
+                'model': body['model'], 'usage': usage,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}]})
+
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        delay = generation / max(len(pieces), 1)
+
+        def events():
+            time.sleep(first_token)
+            for piece in pieces:
+                time.sleep(delay)
+                yield self._chunk(body['model'], {'content': piece}, None)
+            yield self._chunk(body['model'], {}, 'stop', usage)
+            yield b"data: [DONE]\n\n"
+
+        return httpx.Response(200, headers={'content-type': 'text/event-stream'},
+                              content=events())
+
+    @staticmethod
+    def _chunk(model, delta, finish_reason, usage=None):
+        chunk = {'id': 'chatcmpl-bench', 'object': 'chat.completion.chunk', 'created': 0,
+                 'model': model,
+                 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+        if usage:
+            chunk['usage'] = usage
+        return f"data: {json.dumps(chunk)}\n\n".encode()
+
+    def client_factory(self, openai_class):
+        """
+        Returns a replacement for openai.OpenAI that builds clients served by this fake.
+        """
+        import httpx
+
+        def create(*args, **kwargs):
+            return openai_class(
+                api_key='sk-bench', max_retries=0,
+                http_client=httpx.Client(transport=httpx.MockTransport(self.handle)))
+        return create
+
+    def client(self):
+        import openai
+        return self.client_factory(openai.OpenAI)()
@@ -0,0 +1,118 @@
+"""
+Imports app.py with Firebase and OpenAI replaced by the in-memory stand-ins, so the
+benchmarks run offline and without credentials.
+
+The libraries are patched by an import hook when they are first imported rather than
+imported here up front, so the app loads them exactly when it would in production.
+"""
+import importlib.abc
+import os
+import sys
+import types
+
+from bench.fake_firebase import FakeDatabase
+from bench.fake_openai import FakeOpenAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _PatchingLoader(importlib.abc.Loader):
+
+    def __init__(self, loader, patch):
+        self._loader = loader
+        self._patch = patch
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._loader.exec_module(module)
+        self._patch(module)
+
+
+class _PatchingFinder(importlib.abc.MetaPathFinder):
+    """
+    Applies patches[name](module) right after the named module is executed.
+    """
+
+    def __init__(self, patches):
+        self.patches = patches
+
+    def find_spec(self, fullname, path, target=None):
+        patch = self.patches.get(fullname)
+        if patch is None:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                spec.loader = _PatchingLoader(spec.loader, patch)
+                return spec
+        return None
+
+
+def install_fakes(database, openai_fake):
+    """
+    Arranges for firebase_admin and openai to use the fakes, whenever they are imported.
+    """
+    firebase_app = types.SimpleNamespace(
+        name='[DEFAULT]', credential=None,
+        options={'databaseURL': os.environ.get('FIREBASE_URL')})
+
+    def patch_firebase_admin(module):
+        module.initialize_app = lambda *args, **kwargs: firebase_app
+        module.get_app = lambda *args, **kwargs: firebase_app
+
+    def patch_credentials(module):
+        module.Certificate = lambda *args, **kwargs: None
+
+    def patch_db(module):
+        module.reference = database.reference
+
+    def patch_openai(module):
+        module.OpenAI = openai_fake.client_factory(module.OpenAI)
+
+    patches = {
+        'firebase_admin': patch_firebase_admin,
+        'firebase_admin.credentials': patch_credentials,
+        'firebase_admin.db': patch_db,
+        'openai': patch_openai,
+    }
+    for name, patch in patches.items():
+        if name in sys.modules:
+            patch(sys.modules[name])
+    # a later call replaces the hook, so loading the app again uses the new fakes
+    sys.meta_path[:] = [finder for finder in sys.meta_path
+                        if not isinstance(finder, _PatchingFinder)]
+    sys.meta_path.insert(0, _PatchingFinder(patches))
+
+
+def load_app(database=None, openai_fake=None):
+    """
+    Returns (app_module, database, openai_fake) with the fakes installed.
+    """
+    database = database or FakeDatabase()
+    openai_fake = openai_fake or FakeOpenAI()
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('FIREBASE_CRED_FN', 'bench.json')
+    os.environ.setdefault('FIREBASE_URL', 'https://bench.firebaseio.com')
+    os.environ.setdefault('OPENAI_API_KEY', 'sk-bench')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # the benchmarks drive one user far past its rate limits; bench_rate_limit measures them
+    os.environ.setdefault('RATE_LIMITS_ENABLED', '0')
+    install_fakes(database, openai_fake)
+
+    import app
+    return app, database, openai_fake
+
+
+def flask_app(app_module):
+    """
+    Returns the Flask app of app_module, from its create_app() factory or, in trees that
+    predate the factory, its module-level app.
+    """
+    if hasattr(app_module, 'create_app'):
+        return app_module.create_app()
+    return app_module.app
@@ -0,0 +1,508 @@
+"""
+Offline endpoint benchmarks.
+
+Drives every route through the Flask test client against the in-memory Firebase and
+OpenAI stand-ins, at several user/deck sizes, and reports per endpoint the p50/p99
+latency, Firebase reads and writes per request and bytes moved. Results are compared
+with bench/baseline.json; the run fails if an endpoint makes more Firebase round trips
+than the baseline, or if its p50 is beyond the tolerance, the baseline's own p99 and
+--min-delta-ms. Latency depends on the machine and its load, so a case that looks slower
+is run again and judged by the median p50 of --repeats runs.
+
+    python -m bench.run_benchmarks                    # compare with the baseline
+    python -m bench.run_benchmarks --update-baseline  # record a new baseline
+    python -m bench.run_benchmarks --ignore-latency   # only compare Firebase round trips
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from bench.fake_firebase import FakeDatabase
+from bench.fake_openai import FakeOpenAI
+from bench.harness import flask_app, load_app
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+USER_ID = 'bench-user'
+SIZES = {
+    'small': {'decks': 1, 'cards': 10},
+    'medium': {'decks': 10, 'cards': 500},
+    'large': {'decks': 50, 'cards': 5000},
+}
+SOURCE_TEXT = "\n\n".join(
+    f"Section {i}. Photosynthesis converts light energy into chemical energy. " * 12
+    for i in range(40))
+
+
+def flashcard(i):
+    return {'title': f"Card {i}", 'front': f"What is fact number {i}?",
+            'back': f"Fact {i} is a benchmark fixture.", 'front_image_url': '',
+            'back_image_url': ''}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class Bench:
+
+    def __init__(self, app, database, openai_fake):
+        self.app = app
+        self.database = database
+        self.openai_fake = openai_fake
+        self.client = flask_app(app).test_client()
+        self.serial = 0
+        self.initial_metrics = app.REGISTRY.snapshot()
+
+    def next_id(self):
+        self.serial += 1
+        return self.serial
+
+    def seed(self, decks, cards):
+        """
+        Creates the benchmark user with `decks` decks; the first deck holds `cards` cards.
+        """
+        self.settle()
+        self.database.root = {}
+        self.app.auth_cache.clear()
+        self.app.deck_id_allocator.reset()
+        self.app.add_user(USER_ID, "Bench")
+        deck_ids = []
+        for i in range(decks):
+            deck_id = self.app.create_deck(USER_ID, f"Deck {i}", "Benchmark deck")
+            self.app.add_deck_to_user(USER_ID, deck_id)
+            deck_ids.append(deck_id)
+        for start in range(0, cards, 1000):
+            self.app.add_flashcards(deck_ids[0], [flashcard(i) for i in
+                                                  range(start, min(cards, start + 1000))])
+        for deck_id in deck_ids[1:]:
+            self.app.add_flashcards(deck_id, [flashcard(i) for i in range(10)])
+        self.deck_id = deck_ids[0]
+
+    def settle(self):
+        """
+        Finishes background work left by earlier requests, so it is not counted against
+        the next one.
+        """
+        self.app.edit_buffer.flush()
+        self.app.deletion_executor.submit(lambda: None).result()
+
+    def request(self, method, path, **kwargs):
+        response = self.client.open(path, method=method, **kwargs)
+        body = response.get_data()
+        return response, body
+
+    # each case returns a callable that performs one measured request; anything done
+    # before returning it is setup and is not measured
+    def case_hello(self):
+        return lambda: self.request('POST', '/hello')
+
+    def case_add_user(self):
+        user_id = f"user-{self.next_id()}"
+        return lambda: self.request('POST', '/add-user', json={'user_id': user_id, 'name': 'U'})
+
+    def case_delete_user(self):
+        self.settle()
+        user_id = f"user-{self.next_id()}"
+        self.app.add_user(user_id, 'U')
+        deck_id = self.app.create_deck(user_id, 'Deck', 'd')
+        self.app.add_deck_to_user(user_id, deck_id)
+        self.app.add_flashcards(deck_id, [flashcard(i) for i in range(10)])
+        return lambda: self.request('POST', '/delete-user', json={'user_id': user_id})
+
+    def case_create_deck(self):
+        return lambda: self.request('POST', '/create-deck', json={
+            'user_id': USER_ID, 'deck_name': 'New deck', 'description': 'd'})
+
+    def case_modify_deck(self):
+        return lambda: self.request('POST', '/modify-deck', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id, 'deck_name': 'Renamed',
+            'description': 'd'})
+
+    def case_delete_deck(self):
+        self.settle()
+        deck_id = self.app.create_deck(USER_ID, 'Doomed', 'd')
+        self.app.add_deck_to_user(USER_ID, deck_id)
+        self.app.add_flashcards(deck_id, [flashcard(i) for i in range(10)])
+        return lambda: self.request('POST', '/delete-deck', json={
+            'user_id': USER_ID, 'deck_id': deck_id})
+
+    def case_get_deletion_job(self):
+        self.settle()
+        deck_id = self.app.create_deck(USER_ID, 'Doomed', 'd')
+        self.app.add_deck_to_user(USER_ID, deck_id)
+        job_id = self.app.delete_deck(deck_id)
+        self.settle()
+        return lambda: self.request('GET', f'/get-deletion-job?user_id={USER_ID}&job_id={job_id}')
+
+    def case_add_deck_to_user(self):
+        user_id = f"user-{self.next_id()}"
+        self.app.add_user(user_id, 'U')
+        return lambda: self.request('POST', '/add-deck-to-user', json={
+            'user_id': user_id, 'deck_id': self.deck_id})
+
+    def case_remove_deck_from_user(self):
+        user_id = f"user-{self.next_id()}"
+        self.app.add_user(user_id, 'U')
+        self.app.add_deck_to_user(user_id, self.deck_id)
+        return lambda: self.request('POST', '/remove-deck-from-user', json={
+            'user_id': user_id, 'deck_id': self.deck_id})
+
+    def case_get_decks(self):
+        return lambda: self.request('GET', f'/get-decks?user_id={USER_ID}')
+
+    def case_get_flashcards(self):
+        return lambda: self.request('GET', f'/get-flashcards?deck_id={self.deck_id}')
+
+    def case_get_flashcards_page(self):
+        return lambda: self.request('GET', f'/get-flashcards?deck_id={self.deck_id}&limit=50')
+
+    def case_get_flashcards_gzip(self):
+        return lambda: self.request('GET', f'/get-flashcards?deck_id={self.deck_id}',
+                                    headers={'Accept-Encoding': 'gzip'})
+
+    def case_get_flashcards_msgpack(self):
+        return lambda: self.request('GET', f'/get-flashcards?deck_id={self.deck_id}',
+                                    headers={'Accept': 'application/msgpack',
+                                             'Accept-Encoding': 'gzip'})
+
+    def case_get_flashcards_not_modified(self):
+        etag = self.client.get(f'/get-flashcards?deck_id={self.deck_id}&limit=1').headers['ETag']
+        return lambda: self.request('GET', f'/get-flashcards?deck_id={self.deck_id}',
+                                    headers={'If-None-Match': etag})
+
+    def case_sync_deck(self):
+        revision = self.app.sync_deck(self.deck_id)['revision']
+        self.app.edit_flashcard(self.deck_id, 0, json.dumps(flashcard(1)))
+        return lambda: self.request('GET', f'/sync-deck?deck_id={self.deck_id}&since={revision}')
+
+    def case_add_flashcard(self):
+        return lambda: self.request('POST', '/add-flashcard', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id, 'flashcard': flashcard(0)})
+
+    def case_add_flashcards(self):
+        return lambda: self.request('POST', '/add-flashcards', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id,
+            'flashcards': [flashcard(i) for i in range(50)]})
+
+    def case_edit_flashcard(self):
+        return lambda: self.request('POST', '/edit-flashcard', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id, 'flashcard_id': 0,
+            'flashcard': json.dumps(flashcard(1))})
+
+    def case_edit_flashcard_buffered(self):
+        def edit():
+            self.app.WRITE_BEHIND_EDITS = True
+            try:
+                return self.request('POST', '/edit-flashcard', json={
+                    'user_id': USER_ID, 'deck_id': self.deck_id, 'flashcard_id': 0,
+                    'flashcard': json.dumps(flashcard(1))})
+            finally:
+                self.app.WRITE_BEHIND_EDITS = False
+        return edit
+
+    def case_delete_flashcard(self):
+        flashcard_id = self.app.add_flashcard(self.deck_id, flashcard(0))
+        return lambda: self.request('POST', '/delete-flashcard', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id, 'flashcard_id': flashcard_id})
+
+    def case_review(self):
+        return lambda: self.request('POST', '/review', json={
+            'user_id': USER_ID, 'deck_id': self.deck_id, 'flashcard_id': 0, 'grade': 4})
+
+    def case_due_flashcards(self):
+        return lambda: self.request('GET', f'/due-flashcards?user_id={USER_ID}&limit=20')
+
+    def case_search(self):
+        return lambda: self.request('GET', f'/search?user_id={USER_ID}&q=fact+fixture&limit=20')
+
+    def case_import_flashcards(self):
+        body = "title,front,back\n" + "".join(f"t{i},front {i},back {i}\n" for i in range(200))
+        return lambda: self.request(
+            'POST', f'/import-flashcards?user_id={USER_ID}&deck_id={self.deck_id}&format=csv',
+            data=body.encode())
+
+    def case_export_deck(self):
+        return lambda: self.request(
+            'GET', f'/export-deck?user_id={USER_ID}&deck_id={self.deck_id}&format=csv')
+
+    def case_generate_flashcards(self):
+        return lambda: self.request('POST', '/generate-flashcards', json={
+            'user_id': USER_ID, 'n': 5, 'topic': 'Photosynthesis', 'fresh': True})
+
+    def case_generate_flashcards_repair(self):
+        def generate():
+            # every other card comes back too long and is rewritten by a follow-up call
+            self.openai_fake.overlong_every = 2
+            try:
+                return self.request('POST', '/generate-flashcards', json={
+                    'user_id': USER_ID, 'n': 5, 'topic': 'Photosynthesis', 'fresh': True})
+            finally:
+                self.openai_fake.overlong_every = 0
+        return generate
+
+    def case_generate_flashcards_deck(self):
+        return lambda: self.request('POST', '/generate-flashcards', json={
+            'user_id': USER_ID, 'n': 5, 'deck_id': self.deck_id, 'fresh': True})
+
+    def case_generate_flashcards_cached(self):
+        self.app.generate_flashcards_cached(5, topic='Cached topic')
+        return lambda: self.request('POST', '/generate-flashcards', json={
+            'user_id': USER_ID, 'n': 5, 'topic': 'Cached topic'})
+
+    def case_generate_flashcards_stream(self):
+        return lambda: self.request('POST', '/generate-flashcards?stream=1', json={
+            'user_id': USER_ID, 'n': 5, 'topic': 'Photosynthesis', 'fresh': True})
+
+    def case_generate_flashcards_text(self):
+        return lambda: self.request('POST', '/generate-flashcards', json={
+            'user_id': USER_ID, 'n': 10, 'text': SOURCE_TEXT, 'fresh': True})
+
+    def case_submit_generation_job(self):
+        return lambda: self.request('POST', '/submit-generation-job', json={
+            'user_id': USER_ID, 'n': 5, 'topic': 'Photosynthesis', 'fresh': True})
+
+    def case_get_job(self):
+        job = self.app.generation_queue.submit(USER_ID, 'bench', lambda: [])
+        self.app.generation_queue.wait(job.id, 5)
+        return lambda: self.request('GET', f'/get-job?user_id={USER_ID}&job_id={job.id}')
+
+    def case_cancel_job(self):
+        # a job running in another worker, so no job here writes its record mid-request
+        job = self.app.Job(USER_ID, 'bench')
+        job.status = self.app.Job.RUNNING
+        self.app.ref(f'generation_jobs/{job.id}').set(job.to_record())
+        return lambda: self.request('POST', '/cancel-job', json={
+            'user_id': USER_ID, 'job_id': job.id})
+
+    def case_cache_stats(self):
+        return lambda: self.request('GET', '/cache-stats')
+
+    def case_metrics(self):
+        # /metrics renders every series recorded so far; start from the series of a fixed
+        # set of requests rather than from whatever the cases run before left behind
+        self.app.REGISTRY.restore(self.initial_metrics)
+        self.client.post('/hello')
+        for path in (f'/get-decks?user_id={USER_ID}', '/cache-stats'):
+            self.client.get(path)
+        return lambda: self.request('GET', '/metrics')
+
+
+# (case, iterations, depends on deck size)
+CASES = [
+    ('hello', 20, False),
+    ('add_user', 20, False),
+    ('delete_user', 20, False),
+    ('create_deck', 20, False),
+    ('delete_deck', 20, True),
+    ('get_deletion_job', 20, True),
+    ('modify_deck', 20, True),
+    ('add_deck_to_user', 20, True),
+    ('remove_deck_from_user', 20, True),
+    ('get_decks', 20, True),
+    ('get_flashcards', 20, True),
+    ('get_flashcards_page', 20, True),
+    ('get_flashcards_gzip', 20, True),
+    ('get_flashcards_msgpack', 20, True),
+    ('get_flashcards_not_modified', 20, True),
+    ('sync_deck', 20, True),
+    ('add_flashcard', 20, True),
+    ('add_flashcards', 20, True),
+    ('edit_flashcard', 20, True),
+    ('edit_flashcard_buffered', 20, True),
+    ('delete_flashcard', 20, True),
+    ('review', 20, True),
+    ('due_flashcards', 20, True),
+    ('search', 20, True),
+    ('import_flashcards', 10, True),
+    ('export_deck', 10, True),
+    ('generate_flashcards', 5, False),
+    ('generate_flashcards_repair', 5, False),
+    ('generate_flashcards_deck', 5, True),
+    ('generate_flashcards_cached', 20, False),
+    ('generate_flashcards_stream', 5, False),
+    ('generate_flashcards_text', 3, False),
+    ('submit_generation_job', 20, False),
+    ('get_job', 20, False),
+    ('cancel_job', 20, False),
+    ('cache_stats', 20, False),
+    ('metrics', 20, False),
+]
+
+
+def run_case(bench, name, iterations):
+    latencies = []
+    reads = writes = moved = 0
+    make_request = getattr(bench, f'case_{name}')
+    for _ in range(iterations):
+        perform = make_request()
+        bench.database.reset_stats()
+        start = time.perf_counter()
+        response, body = perform()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned {response.status_code}: {body[:200]!r}")
+        stats = bench.database.stats
+        reads += stats['reads']
+        writes += stats['writes']
+        moved += stats['bytes_read'] + stats['bytes_written'] + len(body)
+    return {
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'reads': round(reads / iterations, 2),
+        'writes': round(writes / iterations, 2),
+        'bytes': int(moved / iterations),
+    }
+
+
+def run_sized_case(bench, args, name, iterations, size_name):
+    size = SIZES[size_name]
+    # every case starts from a freshly seeded tree, so cases that add decks or cards do
+    # not change the size seen by the ones after them
+    bench.database.latency = 0
+    bench.database.jitter = 0
+    bench.seed(size['decks'], size['cards'])
+    bench.database.latency = args.latency_ms / 1000.0
+    bench.database.jitter = args.jitter_ms / 1000.0
+    return run_case(bench, name, max(1, int(iterations * args.scale)))
+
+
+def run(bench, args):
+    """
+    Returns {key: result} and {key: (case, iterations, size)} for the cases selected.
+    """
+    results = {}
+    cases = {}
+    for size_name in args.sizes:
+        for name, iterations, sized in CASES:
+            if not sized and size_name != args.sizes[0]:
+                continue
+            if args.only and name not in args.only:
+                continue
+            key = f"{name}[{size_name}]" if sized else name
+            cases[key] = (name, iterations, size_name)
+            results[key] = run_sized_case(bench, args, name, iterations, size_name)
+    return results, cases
+
+
+def is_slower(result, expected, tolerance, min_delta_ms):
+    allowed = max(expected['p50_ms'] * (1 + tolerance), expected['p99_ms'],
+                  expected['p50_ms'] + min_delta_ms)
+    return result['p50_ms'] > allowed
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    Returns (regressions, slowdowns): Firebase round trips above the baseline, and the
+    keys whose p50 is above the tolerance, the baseline's p99, its spread between runs,
+    and min_delta_ms over the baseline's p50.
+    """
+    regressions = []
+    slowdowns = []
+    for key, result in results.items():
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for counter in ('reads', 'writes'):
+            if result[counter] > expected[counter] + 0.01:
+                regressions.append(
+                    f"{key}: {counter} per request {expected[counter]} -> {result[counter]}")
+        if is_slower(result, expected, tolerance, min_delta_ms):
+            slowdowns.append(key)
+    return regressions, slowdowns
+
+
+def rerun_median(bench, args, cases, results, keys):
+    """
+    Runs the cases of keys until each has args.repeats runs and keeps the median p50, so
+    one run slowed by the machine does not fail the comparison.
+    """
+    for key in keys:
+        p50s = [results[key]['p50_ms']]
+        for _ in range(args.repeats - 1):
+            p50s.append(run_sized_case(bench, args, *cases[key])['p50_ms'])
+        results[key]['p50_ms'] = sorted(p50s)[len(p50s) // 2]
+
+
+def print_table(results, baseline):
+    header = f"{'endpoint':44} {'p50 ms':>9} {'p99 ms':>9} {'reads':>7} {'writes':>7} {'bytes':>10}"
+    print(header)
+    print('-' * len(header))
+    for key, result in results.items():
+        marker = '' if key in baseline else '  (new)'
+        print(f"{key:44} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} "
+              f"{result['reads']:7.2f} {result['writes']:7.2f} {result['bytes']:10d}{marker}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=list(SIZES), choices=list(SIZES))
+    parser.add_argument('--only', nargs='+', help="run only these cases")
+    parser.add_argument('--latency-ms', type=float, default=5.0,
+                        help="injected Firebase round-trip latency")
+    parser.add_argument('--jitter-ms', type=float, default=2.0)
+    parser.add_argument('--openai-ms', type=float, default=300.0,
+                        help="median OpenAI time to first token")
+    parser.add_argument('--openai-card-ms', type=float, default=60.0,
+                        help="OpenAI generation time per flashcard")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="multiplier for the number of iterations per case")
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help="allowed relative p50 latency regression")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help="p50 latency regressions up to this many ms are allowed")
+    parser.add_argument('--repeats', type=int, default=3,
+                        help="runs of a slower case whose median p50 is compared")
+    parser.add_argument('--ignore-latency', action='store_true',
+                        help="only fail the run on Firebase round trips")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    database = FakeDatabase()
+    openai_fake = FakeOpenAI(first_token_ms=args.openai_ms, per_card_ms=args.openai_card_ms)
+    bench = Bench(*load_app(database, openai_fake))
+    results, cases = run(bench, args)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        print_table(results, baseline)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    regressions, slowdowns = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if slowdowns and not args.ignore_latency:
+        rerun_median(bench, args, cases, results, slowdowns)
+        regressions, slowdowns = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    print_table(results, baseline)
+    slowdowns = [f"{key}: p50 {baseline[key]['p50_ms']}ms -> {results[key]['p50_ms']}ms"
+                 for key in slowdowns]
+    if args.ignore_latency:
+        if slowdowns:
+            print("\nSlower than the baseline:")
+            for slowdown in slowdowns:
+                print(f"  {slowdown}")
+    else:
+        regressions += slowdowns
+    if regressions:
+        print("\nRegressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
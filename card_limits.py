@@ -0,0 +1,33 @@
+TITLE_LENGTH_LIMIT = 50
+FRONT_TEXT_LIMIT = 200
+BACK_TEXT_LIMIT = 200
+# a side with an image leaves less room for text
+FRONT_IMAGE_TEXT_LIMIT = 100
+BACK_IMAGE_TEXT_LIMIT = 100
+
+
+def front_limit(front_image_url):
+    return FRONT_IMAGE_TEXT_LIMIT if front_image_url else FRONT_TEXT_LIMIT
+
+
+def back_limit(back_image_url):
+    return BACK_IMAGE_TEXT_LIMIT if back_image_url else BACK_TEXT_LIMIT
+
+
+def problems(flashcard):
+    """
+    Returns what is wrong with a flashcard dict, e.g. ["front is 243 characters, over
+    the limit of 200"], or [] if it is fit to store without being cut off.
+    """
+    found = []
+    for field in ('front', 'back'):
+        if not (flashcard.get(field) or '').strip():
+            found.append(f"{field} is empty")
+    limits = (('title', TITLE_LENGTH_LIMIT),
+              ('front', front_limit(flashcard.get('front_image_url'))),
+              ('back', back_limit(flashcard.get('back_image_url'))))
+    for field, limit in limits:
+        length = len(flashcard.get(field) or '')
+        if length > limit:
+            found.append(f"{field} is {length} characters, over the limit of {limit}")
+    return found
@@ -0,0 +1,86 @@
+from scheduler import deck_key_range
+from search import index_updates
+
+# job states, as stored at deletion_jobs/{job}/status
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+def deck_steps(deck_id):
+    """
+    Steps that remove a deck's own nodes: its flashcards and change log in batches, then
+    what is left of the deck.
+    """
+    return [
+        {'drain': f'decks/{deck_id}/flashcards'},
+        {'drain': f'deck_changes/{deck_id}'},
+        {'remove': [f'decks/{deck_id}', f'deck_meta/{deck_id}', f'deck_changes/{deck_id}']},
+    ]
+
+
+def deck_index_steps(user_id, deck_id):
+    """
+    Steps that remove one deck's entries from its owner's review state, due index and
+    search index, which are keyed by user and found with a key range query.
+    """
+    start, end = deck_key_range(deck_id)
+    return [
+        {'drain': f'due_index/{user_id}', 'start': start, 'end': end},
+        {'drain': f'reviews/{user_id}', 'start': start, 'end': end},
+        {'drain': f'search_docs/{user_id}', 'start': start, 'end': end, 'postings': user_id},
+    ]
+
+
+def user_index_steps(user_id):
+    return [
+        {'drain': f'due_index/{user_id}'},
+        {'drain': f'reviews/{user_id}'},
+        {'drain': f'search_docs/{user_id}', 'postings': user_id},
+        {'remove': [f'search_index/{user_id}', f'search_docs/{user_id}', f'reviews/{user_id}',
+                    f'due_index/{user_id}']},
+    ]
+
+
+def plan(job):
+    """
+    Returns the steps of a deletion job record. The plan depends only on the record, so
+    a job interrupted at step i is resumed by running plan(job)[i:] again.
+    """
+    if job['kind'] == 'deck':
+        return deck_index_steps(job['user_id'], job['deck_id']) + deck_steps(job['deck_id'])
+    steps = []
+    for deck_id in job.get('decks') or []:
+        steps.extend(deck_steps(deck_id))
+    return steps + user_index_steps(job['user_id'])
+
+
+def entries(value):
+    """
+    Returns {key: child} for a node read from Firebase, which returns nodes whose keys are
+    all small integers as lists with None in the gaps.
+    """
+    if isinstance(value, list):
+        return {str(key): child for key, child in enumerate(value) if child is not None}
+    return dict(value or {})
+
+
+def batch_updates(step, batch, max_paths):
+    """
+    Returns (updates, deleted): the multi-path update that deletes the entries of batch,
+    read from a drain step, and how many entries it covers. Search documents are deleted
+    together with their postings; entries are taken in order until the update would hold
+    more than max_paths paths, but always at least one.
+    """
+    updates = {}
+    deleted = 0
+    for key, value in batch.items():
+        paths = {f"{step['drain']}/{key}": None}
+        if step.get('postings') and isinstance(value, dict):
+            paths.update(index_updates(step['postings'], key, value, {}))
+        if deleted and len(updates) + len(paths) > max_paths:
+            break
+        updates.update(paths)
+        deleted += 1
+    return updates, deleted
@@ -0,0 +1,109 @@
+REVISION_KEY_WIDTH = 12
+
+
+def revision_key(revision):
+    """
+    Key of a revision in a deck's change log. Keys are zero-padded so that key order is
+    revision order and Firebase never returns the log as an array.
+    """
+    return f'{revision:0{REVISION_KEY_WIDTH}d}'
+
+
+def _items(value):
+    if isinstance(value, list):
+        return [(str(key), item) for key, item in enumerate(value) if item is not None]
+    return [(str(key), item) for key, item in (value or {}).items() if item is not None]
+
+
+def entry_updates(deck_id, revision, upserts=None, deletes=(), deck=None, max_cards=200,
+                  log_size=500, compact_every=50):
+    """
+    Returns the multi-path update that records revision of the deck at
+    deck_changes/{deck}/{revision}: the new values of upserted flashcards by ID,
+    tombstones for deleted ones and changed deck fields. A write touching more than
+    max_cards flashcards is recorded as a reset instead, which sends clients syncing
+    across it to a full snapshot.
+
+    Every compact_every revisions the update also drops the entries that have fallen
+    more than log_size revisions behind, so compaction needs no reads.
+    """
+    upserts = upserts or {}
+    entry = {'at': {'.sv': 'timestamp'}}
+    if len(upserts) + len(deletes) > max_cards:
+        entry['reset'] = True
+    else:
+        if upserts:
+            entry['upserts'] = {str(key): card for key, card in upserts.items()}
+        if deletes:
+            entry['deletes'] = {str(key): True for key in deletes}
+    if deck:
+        entry['deck'] = deck
+    updates = {f'deck_changes/{deck_id}/{revision_key(revision)}': entry}
+    if revision % compact_every == 0:
+        for old in range(max(1, revision - log_size - compact_every + 1),
+                         revision - log_size + 1):
+            updates[f'deck_changes/{deck_id}/{revision_key(old)}'] = None
+    return updates
+
+
+def merge(entries, since, now, settle_ms, max_cards=200):
+    """
+    Folds the change log entries from revision since on, given as (key, entry) pairs in
+    key order, into the delta after since: {'revision', 'upserts', 'deletes', 'deck'}.
+    Returns None when the client needs a full snapshot instead: the log was compacted
+    past since, a reset is crossed or more than max_cards cards changed.
+
+    Revisions are reserved before their entry is written, so a missing revision is either
+    a write still in flight or one that failed. The delta stops before it unless the
+    entry after it is older than settle_ms, in which case it is skipped. A missing
+    revision right after since only counts as such when the entry of since itself is
+    still logged; otherwise the log may have been compacted past since.
+    """
+    revision = since
+    anchored = False
+    upserts = {}
+    deletes = set()
+    deck = {}
+    for key, entry in entries:
+        entry_revision = int(key)
+        if entry_revision <= revision:
+            anchored = anchored or entry_revision == since
+            continue
+        if entry_revision != revision + 1:
+            if revision == since and not anchored:
+                return None
+            if now - entry.get('at', 0) < settle_ms:
+                break
+        if entry.get('reset'):
+            return None
+        for card_id, card in _items(entry.get('upserts')):
+            upserts[card_id] = card
+            deletes.discard(card_id)
+        for card_id, _ in _items(entry.get('deletes')):
+            upserts.pop(card_id, None)
+            deletes.add(card_id)
+        deck.update(entry.get('deck') or {})
+        if len(upserts) + len(deletes) > max_cards:
+            return None
+        revision = entry_revision
+    return {'revision': revision, 'upserts': upserts, 'deletes': sorted(deletes, key=_id_order),
+            'deck': deck}
+
+
+def head(entries, now, settle_ms):
+    """
+    Returns the last revision of a tail of the change log up to which every write has
+    landed, or None for an empty log.
+    """
+    revision = None
+    for key, entry in entries:
+        entry_revision = int(key)
+        if (revision is not None and entry_revision != revision + 1
+                and now - entry.get('at', 0) < settle_ms):
+            break
+        revision = entry_revision
+    return revision
+
+
+def _id_order(card_id):
+    return (0, int(card_id), '') if card_id.isdigit() else (1, 0, card_id)
@@ -0,0 +1,170 @@
+import csv
+import html
+import io
+import json
+import re
+
+FORMATS = ('csv', 'ndjson', 'anki')
+FLASHCARD_FIELDS = ('title', 'front', 'back', 'front_image_url', 'back_image_url')
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_ANKI_SEPARATORS = {'tab': '\t', 'comma': ',', 'semicolon': ';', 'pipe': '|', 'space': ' ',
+                    'colon': ':'}
+
+
+class RowError(Exception):
+    pass
+
+
+def guess_format(filename=None, mimetype=None):
+    filename = (filename or '').lower()
+    mimetype = (mimetype or '').lower()
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in mimetype or 'jsonl' in mimetype:
+        return 'ndjson'
+    if filename.endswith('.csv') or mimetype == 'text/csv':
+        return 'csv'
+    if filename.endswith(('.txt', '.tsv')):
+        return 'anki'
+    return None
+
+
+def iter_csv(lines):
+    """
+    Yields (row_number, row) from CSV text. A header naming the flashcard fields is used
+    if present; otherwise the columns are taken as front, back and an optional title.
+    """
+    reader = csv.reader(lines)
+    header = None
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if header is None and reader.line_num == 1:
+            names = [cell.strip().lower() for cell in row]
+            if 'front' in names and 'back' in names:
+                header = names
+                continue
+        if header:
+            yield reader.line_num, dict(zip(header, row))
+        else:
+            yield reader.line_num, dict(zip(('front', 'back', 'title'), row))
+
+
+def iter_ndjson(lines):
+    """
+    Yields (line_number, row) for each JSON object line, or (line_number, RowError).
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, RowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, RowError("Expected a JSON object.")
+            continue
+        yield line_number, row
+
+
+def iter_anki(lines):
+    """
+    Yields (line_number, row) from an Anki "Notes in Plain Text" export: one note per line
+    with front and back separated by tabs, and optional #key:value header lines.
+    """
+    separator = '\t'
+    strip_html = False
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip('\r\n')
+        if line.startswith('#'):
+            key, _, value = line[1:].partition(':')
+            if key == 'separator':
+                separator = _ANKI_SEPARATORS.get(value.strip().lower(), value.strip() or separator)
+            elif key == 'html':
+                strip_html = value.strip().lower() == 'true'
+            continue
+        if not line.strip():
+            continue
+        fields = line.split(separator)
+        if strip_html:
+            fields = [' '.join(html.unescape(_HTML_TAG.sub(' ', field)).split())
+                      for field in fields]
+        yield line_number, dict(zip(('front', 'back'), fields))
+
+
+READERS = {'csv': iter_csv, 'ndjson': iter_ndjson, 'anki': iter_anki}
+
+
+def iter_rows(lines, fmt):
+    """
+    Yields (row_number, card_dict_or_RowError) for every card in an uploaded deck file.
+    Rows are parsed one at a time, so memory use does not depend on the file size.
+    """
+    for row_number, row in READERS[fmt](lines):
+        if isinstance(row, RowError):
+            yield row_number, row
+            continue
+        card = {}
+        for field in FLASHCARD_FIELDS:
+            value = row.get(field)
+            if value is not None and not isinstance(value, str):
+                value = str(value)
+            card[field] = value.strip() if value else None
+        if not card['front'] or not card['back']:
+            yield row_number, RowError("A flashcard needs both a front and a back.")
+            continue
+        yield row_number, card
+
+
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'anki': 'txt'}
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'anki': 'text/plain'}
+
+
+def _csv_text(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _csv_page(items):
+    return _csv_text([flashcard_id] + [flashcard.get(field) or '' for field in FLASHCARD_FIELDS]
+                     for flashcard_id, flashcard in items)
+
+
+def _ndjson_line(flashcard_id, flashcard):
+    row = {'id': flashcard_id}
+    row.update({field: flashcard.get(field) or '' for field in FLASHCARD_FIELDS})
+    return json.dumps(row) + '\n'
+
+
+def _ndjson_page(items):
+    return ''.join(_ndjson_line(flashcard_id, flashcard) for flashcard_id, flashcard in items)
+
+
+def _anki_field(value):
+    return ' '.join((value or '').split())
+
+
+def _anki_page(items):
+    return ''.join(f"{_anki_field(flashcard.get('front'))}\t{_anki_field(flashcard.get('back'))}\n"
+                   for _flashcard_id, flashcard in items)
+
+
+HEADERS = {'csv': _csv_text([('id',) + FLASHCARD_FIELDS]), 'ndjson': '',
+           'anki': '#separator:tab\n#html:false\n'}
+WRITERS = {'csv': _csv_page, 'ndjson': _ndjson_page, 'anki': _anki_page}
+
+
+def iter_export(pages, fmt):
+    """
+    Serializes pages of (flashcard_id, flashcard) pairs in the given format. The header is
+    yielded before the first page is read, then each page's text as soon as it is read,
+    so a download starts and keeps moving while the deck is still being read.
+    """
+    if HEADERS[fmt]:
+        yield HEADERS[fmt]
+    for page in pages:
+        text = WRITERS[fmt](page)
+        if text:
+            yield text
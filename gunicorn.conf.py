@@ -0,0 +1,38 @@
+"""
+gunicorn settings, used as: gunicorn -c gunicorn.conf.py 'app:create_app()'
+
+The app is imported once in the master and the workers are forked from it. Firebase and
+OpenAI clients are created inside each worker on first use, so nothing that holds a
+socket or a thread crosses the fork.
+"""
+import os
+
+bind = f":{os.getenv('PORT', '8080')}"
+# one process by default: request coalescing, write-behind edits and generation caches
+# are per process, so extra workers only share them through Firebase. Concurrency comes
+# from threads (gunicorn's gthread worker); the uvicorn worker ignores them
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master before any worker is forked. Importing the client libraries here
+    # lengthens startup once but saves every worker from importing them on its first
+    # request; worthwhile with several workers, so it is opt-in.
+    if os.getenv("PRELOAD_CLIENT_LIBRARIES") == "1":
+        import app
+        app.warm_imports()
+
+
+def worker_exit(server, worker):
+    # Writes edits still held by the write-behind buffer before the worker goes away.
+    import app
+    app.edit_buffer.close()
+
+
+def post_worker_init(worker):
+    # Picks up deletion jobs left unfinished by a worker that went away, on the deletion
+    # worker thread so the new worker starts serving straight away.
+    import app
+    app.deletion_executor.submit(app.resume_deletion_jobs)
@@ -0,0 +1,283 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens.
+    The level may go negative when a caller reports more usage than it reserved, which
+    delays later callers until the debt is repaid.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount):
+        """
+        Takes amount tokens if they are available and returns 0, otherwise returns the
+        number of seconds until they will be.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._level >= amount:
+                self._level -= amount
+                return 0
+            return (amount - self._level) / self.rate
+
+    def adjust(self, amount):
+        with self._lock:
+            self._refill()
+            self._level -= amount
+
+
+class OpenAIRateLimiter:
+    """
+    Keeps OpenAI calls under a requests-per-minute and a tokens-per-minute budget.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_wait=30):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_wait = max_wait
+
+    def acquire(self, estimated_tokens):
+        """
+        Blocks until one request and estimated_tokens tokens are available, raising
+        RateLimitTimeout if that would take longer than max_wait seconds.
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._try_acquire(estimated_tokens, deadline)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens):
+        """
+        Like acquire, but waits on the event loop rather than blocking a thread.
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._try_acquire(estimated_tokens, deadline)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _try_acquire(self, estimated_tokens, deadline):
+        """
+        Takes one request and estimated_tokens tokens and returns 0, or takes nothing and
+        returns the seconds to wait before trying again.
+        """
+        wait = self.requests.try_acquire(1)
+        if not wait:
+            wait = self.tokens.try_acquire(estimated_tokens)
+            if not wait:
+                return 0
+            self.requests.adjust(-1)
+        if time.monotonic() + wait > deadline:
+            raise RateLimitTimeout(f"OpenAI rate limit would be exceeded for {wait:.1f}s.")
+        return wait
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, owner, kind):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.kind = kind
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (Job.SUCCEEDED, Job.FAILED, Job.CANCELLED)
+
+    def to_record(self):
+        """
+        The job's state as stored outside the process, with timestamps rather than
+        durations so it can be read back later.
+        """
+        return {
+            'owner': self.owner,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def to_dict(self):
+        return job_dict(self.id, self.to_record())
+
+
+def job_dict(job_id, record):
+    """
+    Returns the API view of a job record from Job.to_record.
+    """
+    now = time.time()
+    submitted_at = record['submitted_at']
+    started_at = record.get('started_at')
+    finished_at = record.get('finished_at')
+    queue_wait = (started_at or finished_at or now) - submitted_at
+    run_time = (finished_at or now) - started_at if started_at else None
+    return {
+        'job_id': job_id,
+        'kind': record['kind'],
+        'status': record['status'],
+        'result': record.get('result'),
+        'error': record.get('error'),
+        'queue_wait_seconds': round(queue_wait, 3),
+        'run_seconds': round(run_time, 3) if run_time is not None else None
+    }
+
+
+class JobQueue:
+    """
+    Runs jobs on a dedicated bounded thread pool. At most max_depth jobs may be waiting
+    to start; submit raises QueueFull beyond that. Finished jobs are kept for
+    retention seconds so their results can be collected.
+
+    on_update(job), if given, is called when a job is submitted, starts and finishes, so
+    its state can be kept where other processes see it. It may cancel the job through
+    the queue when it starts, e.g. because another process cancelled it; it then never
+    runs.
+    """
+
+    def __init__(self, max_workers, max_depth, retention=600, on_update=None):
+        self.max_depth = max_depth
+        self.retention = retention
+        self.on_update = on_update
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, owner, kind, fn, *args, **kwargs):
+        job = Job(owner, kind)
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_depth:
+                raise QueueFull(f"{self._pending} jobs are already waiting.")
+            self._pending += 1
+            self._jobs[job.id] = job
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception:
+                with self._lock:
+                    self._pending -= 1
+                    del self._jobs[job.id]
+                raise
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+            if job.status == Job.CANCELLED:
+                return
+            job.status = Job.RUNNING
+            job.started_at = time.time()
+        if self.on_update:
+            self._notify(job)
+            if job.status == Job.CANCELLED:
+                return
+        try:
+            result = fn(*args, **kwargs)
+            error = None
+        except Exception as e:
+            result = None
+            error = str(e) or e.__class__.__name__
+        with self._lock:
+            if job.status != Job.CANCELLED:
+                job.result = result
+                job.error = error
+                job.status = Job.FAILED if error else Job.SUCCEEDED
+            job.finished_at = time.time()
+        if self.on_update:
+            self._notify(job)
+        job.done.set()
+
+    def _notify(self, job):
+        try:
+            self.on_update(job)
+        except Exception:
+            # the job's own state is still right; only the shared copy lags
+            pass
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job never starts; a running job finishes in the background
+        but its result is discarded.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            if job.status == Job.QUEUED and job.future is not None and job.future.cancel():
+                self._pending -= 1
+            job.status = Job.CANCELLED
+            job.finished_at = time.time()
+        job.done.set()
+        return job
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {'pending': self._pending, 'max_depth': self.max_depth, 'jobs': statuses}
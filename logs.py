@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object: time, level, logger, event and the record's fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) +
+                    f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class StructuredLogger:
+    """
+    Logs an event name with keyword fields. The level check comes first, so a disabled
+    call costs no formatting, and records below WARNING are kept only for a sample_rate
+    fraction of calls.
+    """
+
+    def __init__(self, logger, sample_rate=1.0):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def _log(self, level, event, fields, exc_info=False):
+        if not self.logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self.logger.log(level, event, extra={'fields': fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name='flashsmart'):
+    """
+    Returns a StructuredLogger writing JSON lines to stderr, configured from LOG_LEVEL
+    (default INFO) and LOG_SAMPLE_RATE (default 1, the fraction of debug and info records kept).
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    return StructuredLogger(logger, sample_rate=float(os.getenv("LOG_SAMPLE_RATE", 1)))
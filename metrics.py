@@ -0,0 +1,178 @@
+import bisect
+import contextlib
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds; covers a cached lookup through a long OpenAI generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter with a fixed set of label names.
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def restore(self, values):
+        with self._lock:
+            self._values = dict(values)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            yield self.name + '_total', _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Cumulative histogram with a fixed set of label names, exposed as _bucket, _sum and _count.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return entry[2] if entry else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(entry[0]), entry[1], entry[2]]
+                    for key, entry in self._values.items()}
+
+    def restore(self, values):
+        with self._lock:
+            self._values = {key: [list(entry[0]), entry[1], entry[2]]
+                            for key, entry in values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(entry[0]), entry[1], entry[2]))
+                      for key, entry in self._values.items()]
+        for key, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield (self.name + '_bucket',
+                       _format_labels(self.labelnames, key, [('le', _format_value(bound))]),
+                       cumulative)
+            yield self.name + '_sum', _format_labels(self.labelnames, key), total
+            yield self.name + '_count', _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """
+    Collects metrics and renders them in the Prometheus text exposition format. Values are
+    kept per process, so every worker is scraped as its own target.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        """
+        Returns a copy of every metric's values, keyed by metric name, for restore.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def restore(self, snapshot):
+        """
+        Sets every metric back to its values in snapshot; metrics not in it are emptied.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            metric.restore(snapshot.get(metric.name, {}))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
@@ -1,3 +1,4 @@
 FLASHCARD_PROMPT_TOPIC = "Generate {n} flashcards on the topic of {topic}. Make sure the title is <=50 chars and the front and back are <=200 chars long. \n"
 FLASHCARD_PROMPT_REFERENCE = "Generate {n} additional flashcards based on the following reference: \n{reference}\nMake sure the title is <=50 chars and the front and back are <=200 chars long."
-FLASHCARD_PROMPT_FROM_TEXT = "Generate {n} flashcards to test the knowledge of the following materials: \n{text}\nMake sure the title is <=50 chars and the front and back are <=200 chars long."
\ No newline at end of file
+FLASHCARD_PROMPT_FROM_TEXT = "Generate {n} flashcards to test the knowledge of the following materials: \n{text}\nMake sure the title is <=50 chars and the front and back are <=200 chars long."
+FLASHCARD_PROMPT_REPAIR = "Rewrite {n} flashcards that break their limits. Keep each card's id and meaning and write complete sentences; do not cut text off. The title must be <={title} chars, the front <={front} and the back <={back} chars, or <={image} chars for a side with an image URL. Fix the problems listed for each card:\n{flashcards}"
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class UserRateLimiter:
+    """
+    Token buckets per (route class, user). limits maps each route class to
+    (per_minute, burst): a bucket holds up to burst requests and refills continuously at
+    per_minute. Route classes without a limit are not limited.
+
+    With a path the buckets live in a local SQLite file, so every worker process on the
+    machine draws from the same buckets; without one each process keeps its own. A check
+    that fails on the database is let through and counted in errors. Every prune_every
+    checks, buckets idle long enough to be full again are dropped, as a missing bucket
+    counts as full.
+    """
+    prune_every = 1000
+
+    def __init__(self, limits, path=None, timeout=0.5):
+        self.limits = limits
+        self.path = path
+        self.timeout = timeout
+        self.errors = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._checks = 0
+        # any bucket is full again after this long, so idle rows can be dropped
+        self._idle_after = max((burst / (per_minute / 60.0)
+                                for per_minute, burst in limits.values()), default=0)
+        if path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # a connection must not be shared with a forked child, e.g. under gunicorn --preload
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError:
+                # another process is switching the file to WAL, which then persists
+                pass
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def check(self, user_id, route_class, cost=1):
+        """
+        Takes cost requests from the user's bucket for route_class and returns 0, or, if
+        the bucket does not hold that many, takes nothing and returns the number of
+        seconds until it will.
+        """
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return 0
+        key = f'{route_class}:{user_id}'
+        if not self.path:
+            with self._lock:
+                now = time.time()
+                level, wait = self._take(self._buckets.get(key), limit, cost, now)
+                if not wait:
+                    self._buckets[key] = (level, now)
+                    self._checks += 1
+                    if self._checks % self.prune_every == 0:
+                        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                                         if now - bucket[1] < self._idle_after}
+            return wait
+        try:
+            return self._check_sqlite(key, limit, cost)
+        except sqlite3.Error:
+            self.errors += 1
+            return 0
+
+    def _check_sqlite(self, key, limit, cost):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = connection.execute(
+                "SELECT level, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            level, wait = self._take(row, limit, cost, now)
+            if not wait:
+                connection.execute(
+                    "INSERT OR REPLACE INTO buckets (key, level, updated) VALUES (?, ?, ?)",
+                    (key, level, now))
+                self._checks += 1
+                if self._checks % self.prune_every == 0:
+                    connection.execute("DELETE FROM buckets WHERE updated < ?",
+                                       (now - self._idle_after,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+    @staticmethod
+    def _take(bucket, limit, cost, now):
+        per_minute, burst = limit
+        rate = per_minute / 60.0
+        cost = min(cost, burst)
+        if bucket is None:
+            level = burst
+        else:
+            level = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        if level >= cost:
+            return level - cost, 0
+        return level, (cost - level) / rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+        if self.path:
+            self._connection().execute("DELETE FROM buckets")
+
+
+def client_address(forwarded_for, remote_addr, proxy_hops):
+    """
+    Returns the address of the client of a request that passed through proxy_hops
+    proxies, each of which appends to X-Forwarded-For. Entries further left were sent by
+    the client and cannot be trusted. Falls back to remote_addr when the header has fewer
+    entries than that.
+    """
+    hops = [hop.strip() for hop in (forwarded_for or '').split(',') if hop.strip()]
+    if proxy_hops <= 0 or len(hops) < proxy_hops:
+        return remote_addr
+    return hops[-proxy_hops]
@@ -0,0 +1,111 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_ALIASES = (MSGPACK_MIMETYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+
+GZIP_LEVEL = 6
+# brotli quality 5 compresses better than gzip at a similar speed; higher levels are too
+# slow for responses encoded per request
+BROTLI_QUALITY = 5
+
+
+def parse_accept(header):
+    """
+    Returns {value: q} for an Accept or Accept-Encoding header, dropping q=0 entries.
+    """
+    accepted = {}
+    for item in (header or '').split(','):
+        value, _, params = item.strip().partition(';')
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, number = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted[value] = q
+    return accepted
+
+
+def compact(value):
+    """
+    Drops empty strings and None values from dicts, recursively, and makes dict keys
+    strings as JSON would.
+    """
+    if isinstance(value, dict):
+        return {str(key): compact(item) for key, item in value.items()
+                if item is not None and item != ''}
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+def choose_mimetype(accept):
+    """
+    MessagePack when the client asks for it over JSON and msgpack is installed, else JSON.
+    """
+    accepted = parse_accept(accept)
+    msgpack_q = max((accepted.get(alias, 0) for alias in MSGPACK_ALIASES), default=0)
+    if msgpack is None or not msgpack_q:
+        return JSON_MIMETYPE
+    json_q = accepted.get(JSON_MIMETYPE, 0)
+    return MSGPACK_MIMETYPE if msgpack_q >= json_q else JSON_MIMETYPE
+
+
+def choose_encoding(accept_encoding):
+    accepted = parse_accept(accept_encoding)
+    candidates = []
+    if brotli is not None and 'br' in accepted:
+        candidates.append((accepted['br'], 1, 'br'))
+    if 'gzip' in accepted:
+        candidates.append((accepted['gzip'], 0, 'gzip'))
+    return max(candidates)[2] if candidates else None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def serialize(payload, mimetype):
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(compact(payload), use_bin_type=True)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def encode_payload(payload, accept=None, accept_encoding=None, min_size=1024):
+    """
+    Serializes payload for the given Accept and Accept-Encoding headers. Returns
+    (body, mimetype, content_encoding); content_encoding is None when the body is sent
+    uncompressed, which is always the case below min_size bytes.
+
+    MessagePack bodies leave out empty fields, such as the image URLs of cards without
+    images; clients should treat a missing field as empty.
+    """
+    mimetype = choose_mimetype(accept)
+    body = serialize(payload, mimetype)
+    encoding = choose_encoding(accept_encoding) if len(body) >= min_size else None
+    return compress(body, encoding), mimetype, encoding
@@ -0,0 +1,68 @@
+DAY_MS = 24 * 60 * 60 * 1000
+
+INITIAL_EASE = 2.5
+MINIMUM_EASE = 1.3
+PASSING_GRADE = 3
+MAX_GRADE = 5
+
+
+def review_key(deck_id, flashcard_id):
+    """
+    Key of a card in a user's review state and due index. Keys of one deck share the
+    "{deck_id}:" prefix, so a deck's entries can be found with a key range query.
+    """
+    return f'{deck_id}:{flashcard_id}'
+
+
+def parse_review_key(key):
+    deck_id, _, flashcard_id = key.partition(':')
+    return (int(deck_id) if deck_id.isdigit() else deck_id,
+            int(flashcard_id) if flashcard_id.isdigit() else flashcard_id)
+
+
+def deck_key_range(deck_id):
+    """
+    Returns the (start_at, end_at) bounds of an order_by_key query over one deck's keys.
+    """
+    return f'{deck_id}:', f'{deck_id}:\uf8ff'
+
+
+def schedule(state, grade, now):
+    """
+    Applies one SM-2 review with grade 0-5 at time now (ms since the epoch) to the card's
+    review state (None for a new card) and returns the new state.
+
+    A grade below 3 is a lapse: the card restarts at a one-day interval and its ease is
+    kept. Otherwise the interval goes 1 day, 6 days, then grows by the ease factor, and
+    the ease is adjusted by how easy the recall was.
+    """
+    state = state or {}
+    ease = state.get('ease', INITIAL_EASE)
+    interval = state.get('interval', 0)
+    repetitions = state.get('repetitions', 0)
+    lapses = state.get('lapses', 0)
+
+    if grade < PASSING_GRADE:
+        repetitions = 0
+        interval = 1
+        lapses += 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = max(1, round(interval * ease))
+        miss = MAX_GRADE - grade
+        ease = max(MINIMUM_EASE, ease + 0.1 - miss * (0.08 + miss * 0.02))
+
+    return {
+        'ease': round(ease, 4),
+        'interval': interval,
+        'repetitions': repetitions,
+        'lapses': lapses,
+        'last_grade': grade,
+        'last_reviewed': now,
+        'due': now + interval * DAY_MS
+    }
@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+
+from card_limits import (BACK_IMAGE_TEXT_LIMIT, BACK_TEXT_LIMIT, FRONT_IMAGE_TEXT_LIMIT,
+                         FRONT_TEXT_LIMIT, TITLE_LENGTH_LIMIT)
+
+
+# Structured outputs do not accept maxLength, so the limits are stated in the field
+# descriptions the model sees and enforced on the result with card_limits.problems.
+class FlashcardSchema(BaseModel):
+    id: int
+    title: str = Field(description=f"Short title, at most {TITLE_LENGTH_LIMIT} characters.")
+    front: str = Field(description=(
+        f"Question side, at most {FRONT_TEXT_LIMIT} characters, or "
+        f"{FRONT_IMAGE_TEXT_LIMIT} when front_image_url is set. Never cut off mid-sentence."))
+    back: str = Field(description=(
+        f"Answer side, at most {BACK_TEXT_LIMIT} characters, or "
+        f"{BACK_IMAGE_TEXT_LIMIT} when back_image_url is set. Never cut off mid-sentence."))
+    front_image_url: str = Field(description="Image for the front, or an empty string.")
+    back_image_url: str = Field(description="Image for the back, or an empty string.")
+
+
+class FlashcardCollection(BaseModel):
+    flashcards: list[FlashcardSchema]
@@ -0,0 +1,81 @@
+import math
+import re
+
+# field weights: a match in the title counts for more than one in the back
+FIELD_WEIGHTS = (('title', 3), ('front', 2), ('back', 1))
+MAX_QUERY_TERMS = 8
+MAX_TERM_LENGTH = 40
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'which', 'with'))
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens of text without stopwords and one-letter words. Tokens are
+    valid Realtime Database keys.
+    """
+    tokens = []
+    for word in _WORD.findall((text or '').lower()):
+        word = word.strip('_')[:MAX_TERM_LENGTH]
+        if len(word) > 1 and word not in STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+def term_weights(flashcard):
+    """
+    Returns {term: weight} for a flashcard dict, summing the field weight of every occurrence.
+    """
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(flashcard.get(field)):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def query_terms(query):
+    terms = []
+    for term in tokenize(query):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def index_updates(user_id, key, old_weights, new_weights):
+    """
+    Returns the multi-path update that moves the document key of the user's index from
+    old_weights to new_weights. Postings live at search_index/{user}/{term}/{key} and the
+    document's own terms at search_docs/{user}/{key}, so a document can be unindexed
+    without reading the flashcard.
+    """
+    updates = {}
+    for term in old_weights:
+        if term not in new_weights:
+            updates[f'search_index/{user_id}/{term}/{key}'] = None
+    for term, weight in new_weights.items():
+        if old_weights.get(term) != weight:
+            updates[f'search_index/{user_id}/{term}/{key}'] = weight
+    updates[f'search_docs/{user_id}/{key}'] = new_weights or None
+    return updates
+
+
+def rank(postings):
+    """
+    Ranks documents from {term: {key: weight}}. Documents matching more query terms come
+    first; ties are broken by the summed weights, each term scaled down by the number of
+    postings read for it. Returns [(key, score)].
+    """
+    scores = {}
+    matched = {}
+    for term, term_postings in postings.items():
+        if not term_postings:
+            continue
+        scale = 1 / math.log2(1 + len(term_postings))
+        for key, weight in term_postings.items():
+            scores[key] = scores.get(key, 0) + weight * scale
+            matched[key] = matched.get(key, 0) + 1
+    ordered = sorted(scores, key=lambda key: (-matched[key], -scores[key], key))
+    return [(key, round(scores[key], 4)) for key in ordered]
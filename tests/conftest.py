@@ -0,0 +1,44 @@
+import pytest
+
+from bench.fake_firebase import FakeDatabase
+from bench.harness import flask_app, load_app
+
+USER_ID = 'test-user'
+
+
+@pytest.fixture()
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture()
+def app(database):
+    """
+    The app module over an empty in-memory database holding only the user user_id, with
+    nothing cached from earlier tests.
+    """
+    app, _, _ = load_app(database)
+    app.auth_cache.clear()
+    app.reference_cache.clear()
+    app.add_user(USER_ID, 'U')
+    return app
+
+
+@pytest.fixture()
+def user_id():
+    return USER_ID
+
+
+@pytest.fixture()
+def client(app):
+    return flask_app(app).test_client()
+
+
+@pytest.fixture()
+def deck_id(app):
+    """
+    An empty deck owned by user_id and in their list.
+    """
+    deck_id = app.create_deck(USER_ID, 'Deck')
+    app.add_deck_to_user(USER_ID, deck_id)
+    return deck_id
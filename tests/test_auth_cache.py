@@ -0,0 +1,6 @@
+def test_owner_cache_is_shared_by_string_and_int_deck_ids(app, database, user_id, deck_id):
+    database.reset_stats()
+    assert app.get_deck_owner(str(deck_id)) == user_id
+    assert database.stats['reads'] == 0
+    app.delete_deck(deck_id)
+    assert app.auth_cache.get(('owner', str(deck_id))) is None
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+
+@pytest.fixture()
+def deck(app, database, deck_id, monkeypatch):
+    monkeypatch.setattr(app.edit_buffer, 'window', 60)
+    app.add_flashcard(deck_id, {'title': 't', 'front': 'f', 'back': 'b'})
+    return app, database, deck_id
+
+
+def settle(app):
+    app.deletion_executor.submit(lambda: None).result()
+
+
+def test_deleting_a_deck_drops_its_buffered_edits(deck):
+    app, database, deck_id = deck
+    edit = json.dumps({'title': 't', 'front': 'edited', 'back': 'b'})
+    app.buffer_flashcard_edit(deck_id, 0, edit)
+    app.delete_deck(deck_id)
+    settle(app)
+    assert app.edit_buffer.pending(str(deck_id)) == {}
+    app.edit_buffer.flush()
+    assert database.root.get('decks') is None
+    assert database.root.get('deck_changes') is None
+
+
+def test_edits_flushed_after_the_deck_is_gone_are_dropped(deck):
+    app, database, deck_id = deck
+    app.delete_deck(deck_id)
+    settle(app)
+    # e.g. buffered by another worker, which cannot be told to drop them
+    app.edit_buffer.put(str(deck_id), '0', {'title': 't', 'front': 'edited', 'back': 'b'})
+    app.edit_buffer.flush()
+    assert database.root.get('decks') is None
+    assert database.root.get('deck_changes') is None
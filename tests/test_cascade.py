@@ -0,0 +1,44 @@
+import cascade
+
+
+def test_deck_plan_clears_the_indexes_before_the_deck():
+    steps = cascade.plan({'kind': 'deck', 'user_id': 'u', 'deck_id': 7})
+    drained = [step.get('drain') for step in steps]
+    assert drained[:3] == ['due_index/u', 'reviews/u', 'search_docs/u']
+    assert all(step['start'] == '7:' for step in steps[:3])
+    assert steps[-1] == {'remove': ['decks/7', 'deck_meta/7', 'deck_changes/7']}
+
+
+def test_user_plan_covers_every_deck_then_the_user_indexes():
+    steps = cascade.plan({'kind': 'user', 'user_id': 'u', 'decks': [1, 2]})
+    removed = [path for step in steps for path in step.get('remove', [])]
+    assert 'decks/1' in removed and 'decks/2' in removed and 'search_index/u' in removed
+    assert 'start' not in steps[-2]
+
+
+def test_entries_reads_firebase_lists():
+    assert cascade.entries([None, {'a': 1}, None, {'b': 2}]) == {'1': {'a': 1}, '3': {'b': 2}}
+    assert cascade.entries(None) == {}
+    assert cascade.entries({'x': 1}) == {'x': 1}
+
+
+def test_batch_updates_deletes_documents_with_their_postings():
+    step = {'drain': 'search_docs/u', 'postings': 'u'}
+    updates, deleted = cascade.batch_updates(step, {'1:0': {'cell': 3, 'wall': 1}}, 100)
+    assert deleted == 1
+    assert updates == {'search_docs/u/1:0': None, 'search_index/u/cell/1:0': None,
+                       'search_index/u/wall/1:0': None}
+
+
+def test_batch_updates_stops_before_max_paths():
+    step = {'drain': 'search_docs/u', 'postings': 'u'}
+    batch = {f'1:{i}': {'a': 1, 'b': 1} for i in range(5)}
+    updates, deleted = cascade.batch_updates(step, batch, 7)
+    assert deleted == 2 and len(updates) == 6
+
+
+def test_batch_updates_always_takes_one_entry():
+    step = {'drain': 'search_docs/u', 'postings': 'u'}
+    batch = {'1:0': {term: 1 for term in 'abcdefgh'}}
+    updates, deleted = cascade.batch_updates(step, batch, 3)
+    assert deleted == 1 and len(updates) == 9
@@ -0,0 +1,130 @@
+import change_log
+from change_log import revision_key
+
+NOW = 1_000_000
+SETTLE = 60_000
+
+
+def entry(at=NOW, upserts=None, deletes=(), deck=None, reset=False):
+    logged = {'at': at}
+    if upserts:
+        logged['upserts'] = upserts
+    if deletes:
+        logged['deletes'] = {card_id: True for card_id in deletes}
+    if deck:
+        logged['deck'] = deck
+    if reset:
+        logged['reset'] = True
+    return logged
+
+
+def log(*revisions):
+    return [(revision_key(revision), logged) for revision, logged in revisions]
+
+
+def test_revision_keys_sort_in_revision_order():
+    keys = [revision_key(revision) for revision in (1, 9, 10, 100, 12345)]
+    assert keys == sorted(keys)
+    assert revision_key(7) == '000000000007'
+
+
+def test_entry_updates_records_upserts_deletes_and_deck_fields():
+    updates = change_log.entry_updates(3, 4, upserts={1: {'front': 'f'}}, deletes=[2],
+                                       deck={'name': 'n'})
+    assert updates == {'deck_changes/3/000000000004': {
+        'at': {'.sv': 'timestamp'}, 'upserts': {'1': {'front': 'f'}},
+        'deletes': {'2': True}, 'deck': {'name': 'n'}}}
+
+
+def test_entry_updates_records_large_writes_as_a_reset():
+    updates = change_log.entry_updates(3, 4, upserts={i: {} for i in range(5)}, max_cards=4)
+    assert updates['deck_changes/3/000000000004'] == {'at': {'.sv': 'timestamp'}, 'reset': True}
+
+
+def test_entry_updates_compacts_every_compact_every_revisions():
+    updates = change_log.entry_updates(3, 20, log_size=10, compact_every=5)
+    dropped = sorted(path for path, value in updates.items() if value is None)
+    assert dropped == [f'deck_changes/3/{revision_key(old)}' for old in range(6, 11)]
+    assert all(value is not None for value in change_log.entry_updates(3, 21).values())
+
+
+def test_merge_folds_contiguous_entries():
+    entries = log((5, entry()),
+                  (6, entry(upserts={'1': {'front': 'a'}, '2': {'front': 'b'}})),
+                  (7, entry(deletes=['1'], deck={'name': 'n'})),
+                  (8, entry(upserts={'3': {'front': 'c'}}, deletes=['2'])))
+    delta = change_log.merge(entries, 5, NOW, SETTLE)
+    assert delta == {'revision': 8, 'upserts': {'3': {'front': 'c'}},
+                     'deletes': ['1', '2'], 'deck': {'name': 'n'}}
+
+
+def test_merge_upsert_after_delete_wins():
+    entries = log((5, entry()), (6, entry(deletes=['1'])), (7, entry(upserts={'1': {}})))
+    delta = change_log.merge(entries, 5, NOW, SETTLE)
+    assert delta['upserts'] == {'1': {}} and delta['deletes'] == []
+
+
+def test_merge_orders_deletes_numerically():
+    entries = log((5, entry()), (6, entry(deletes=['10', '9', 'x'])))
+    assert change_log.merge(entries, 5, NOW, SETTLE)['deletes'] == ['9', '10', 'x']
+
+
+def test_merge_without_since_entry_and_a_gap_needs_a_snapshot():
+    # the log was compacted past since: revision 6 may be gone for good
+    entries = log((7, entry()), (8, entry()))
+    assert change_log.merge(entries, 5, NOW, SETTLE) is None
+
+
+def test_merge_without_since_entry_continues_from_the_next_revision():
+    entries = log((6, entry(upserts={'1': {}})))
+    assert change_log.merge(entries, 5, NOW, SETTLE)['revision'] == 6
+
+
+def test_merge_stops_before_a_recent_gap():
+    entries = log((5, entry()), (6, entry(upserts={'1': {}})), (8, entry(upserts={'2': {}})))
+    delta = change_log.merge(entries, 5, NOW, SETTLE)
+    assert delta['revision'] == 6 and delta['upserts'] == {'1': {}}
+
+
+def test_merge_stops_at_a_recent_gap_right_after_since():
+    entries = log((5, entry()), (7, entry(upserts={'1': {}})))
+    delta = change_log.merge(entries, 5, NOW, SETTLE)
+    assert delta == {'revision': 5, 'upserts': {}, 'deletes': [], 'deck': {}}
+
+
+def test_merge_skips_a_settled_gap():
+    entries = log((5, entry()), (7, entry(at=NOW - SETTLE, upserts={'1': {}})))
+    assert change_log.merge(entries, 5, NOW, SETTLE)['revision'] == 7
+
+
+def test_merge_across_a_reset_needs_a_snapshot():
+    entries = log((5, entry()), (6, entry(reset=True)))
+    assert change_log.merge(entries, 5, NOW, SETTLE) is None
+
+
+def test_merge_with_too_many_changes_needs_a_snapshot():
+    entries = log((5, entry()), (6, entry(upserts={'1': {}, '2': {}})),
+                  (7, entry(upserts={'3': {}})))
+    assert change_log.merge(entries, 5, NOW, SETTLE, max_cards=2) is None
+
+
+def test_merge_ignores_entries_up_to_since():
+    entries = log((3, entry(upserts={'1': {}})), (5, entry()), (6, entry(upserts={'2': {}})))
+    assert change_log.merge(entries, 5, NOW, SETTLE)['upserts'] == {'2': {}}
+
+
+def test_head_of_an_empty_log_is_none():
+    assert change_log.head([], NOW, SETTLE) is None
+
+
+def test_head_is_the_last_contiguous_revision():
+    assert change_log.head(log((4, entry()), (5, entry())), NOW, SETTLE) == 5
+
+
+def test_head_stops_before_a_recent_gap():
+    assert change_log.head(log((4, entry()), (6, entry())), NOW, SETTLE) == 4
+
+
+def test_head_passes_a_settled_gap():
+    entries = log((4, entry()), (6, entry(at=NOW - SETTLE)), (7, entry()))
+    assert change_log.head(entries, NOW, SETTLE) == 7
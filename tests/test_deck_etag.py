@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture()
+def deck(app, client, deck_id):
+    app.add_flashcard(deck_id, {'title': 't', 'front': 'old', 'back': 'b'})
+    return app, client, deck_id
+
+
+def test_tag_seen_before_a_write_lands_does_not_match_after_it(deck):
+    app, client, deck_id = deck
+    # the revision is reserved, a read runs, then the write it belongs to lands
+    revision = app.reserve_revision(deck_id)
+    tag = client.get(f'/get-flashcards?deck_id={deck_id}').headers['ETag']
+    updates = app.deck_change_updates(deck_id, revision, upserts={0: {'front': 'new'}})
+    updates[f'decks/{deck_id}/flashcards/0/front'] = 'new'
+    app.ref().update(updates)
+
+    response = client.get(f'/get-flashcards?deck_id={deck_id}', headers={'If-None-Match': tag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != tag
+
+
+def test_unchanged_deck_is_not_modified(deck):
+    app, client, deck_id = deck
+    tag = client.get(f'/get-flashcards?deck_id={deck_id}').headers['ETag']
+    response = client.get(f'/get-flashcards?deck_id={deck_id}', headers={'If-None-Match': tag})
+    assert response.status_code == 304
@@ -0,0 +1,76 @@
+from deck_formats import RowError, guess_format, iter_export, iter_rows
+
+
+def rows(text, fmt):
+    return list(iter_rows(text.splitlines(keepends=True), fmt))
+
+
+def test_guess_format_from_name_or_mimetype():
+    assert guess_format('deck.JSONL') == 'ndjson'
+    assert guess_format(mimetype='text/csv') == 'csv'
+    assert guess_format('notes.txt') == 'anki'
+    assert guess_format('deck.pdf', 'application/pdf') is None
+
+
+def test_csv_with_a_header():
+    parsed = rows('title,front,back\nT,Q,A\n', 'csv')
+    assert parsed == [(2, {'title': 'T', 'front': 'Q', 'back': 'A',
+                           'front_image_url': None, 'back_image_url': None})]
+
+
+def test_csv_without_a_header_is_front_back_title():
+    (row_number, card), = rows('Q, A ,T\n', 'csv')
+    assert row_number == 1 and (card['front'], card['back'], card['title']) == ('Q', 'A', 'T')
+
+
+def test_csv_rows_missing_a_side_are_errors():
+    parsed = rows('front,back\nQ,\n\nQ2,A2\n', 'csv')
+    assert [row_number for row_number, _ in parsed] == [2, 4]
+    assert isinstance(parsed[0][1], RowError) and parsed[1][1]['front'] == 'Q2'
+
+
+def test_ndjson_error_rows_keep_their_line_numbers():
+    parsed = rows('{"front": "Q", "back": "A"}\nnot json\n[1, 2]\n\n{"front": "Q"}\n', 'ndjson')
+    assert [row_number for row_number, _ in parsed] == [1, 2, 3, 5]
+    assert parsed[0][1]['back'] == 'A'
+    assert str(parsed[1][1]).startswith('Invalid JSON')
+    assert str(parsed[2][1]) == 'Expected a JSON object.'
+    assert isinstance(parsed[3][1], RowError)
+
+
+def test_ndjson_values_are_strings():
+    (_, card), = rows('{"front": 12, "back": true}\n', 'ndjson')
+    assert (card['front'], card['back']) == ('12', 'True')
+
+
+def test_anki_headers_set_the_separator_and_strip_html():
+    parsed = rows('#separator:pipe\n#html:true\n<b>Q</b>|A&amp;B<br>C\n', 'anki')
+    assert parsed == [(3, {'title': None, 'front': 'Q', 'back': 'A&B C',
+                           'front_image_url': None, 'back_image_url': None})]
+
+
+def test_anki_line_without_a_back_is_an_error():
+    (row_number, error), = rows('only a front\n', 'anki')
+    assert row_number == 1 and isinstance(error, RowError)
+
+
+def test_export_yields_the_header_before_reading_a_page():
+    read = []
+
+    def pages():
+        for page in ([(0, {'front': 'Q0', 'back': 'A0'})], [(1, {'front': 'Q1', 'back': 'A1'})]):
+            read.append(page)
+            yield page
+
+    chunks = iter_export(pages(), 'csv')
+    assert next(chunks).startswith('id,title,front,back') and read == []
+    assert next(chunks).startswith('0,,Q0,A0') and len(read) == 1
+    assert next(chunks).startswith('1,,Q1,A1') and len(read) == 2
+
+
+def test_export_reads_back_as_the_same_cards():
+    pages = [[(i, {'title': f'T{i}', 'front': f'Q, "{i}"', 'back': f'A{i}'})] for i in range(3)]
+    for fmt in ('csv', 'ndjson'):
+        text = ''.join(iter_export(pages, fmt))
+        cards = [card for _, card in rows(text, fmt)]
+        assert [card['front'] for card in cards] == ['Q, "0"', 'Q, "1"', 'Q, "2"']
@@ -0,0 +1,15 @@
+def test_reference_built_before_a_write_lands_is_not_reused_after_it(app, deck_id):
+    app.add_flashcard(deck_id, {'title': 't', 'front': 'old front', 'back': 'b'})
+
+    # the revision is reserved, a reference is built, then the write it belongs to lands
+    revision = app.reserve_revision(deck_id)
+    assert 'old front' in app.build_deck_reference(deck_id)
+    updates = app.deck_change_updates(deck_id, revision, upserts={0: {'front': 'new front'}})
+    updates[f'decks/{deck_id}/flashcards/0/front'] = 'new front'
+    app.ref().update(updates)
+
+    assert 'new front' in app.build_deck_reference(deck_id)
+
+
+def test_missing_deck_has_no_reference(app):
+    assert app.build_deck_reference(987654) is None
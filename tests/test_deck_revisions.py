@@ -0,0 +1,23 @@
+def test_deleting_from_a_missing_deck_leaves_no_deck_behind(app, client):
+    assert app.delete_flashcard(777, 0) is None
+    assert app.ref('decks/777').get() is None
+    assert client.get('/get-flashcards?deck_id=777').status_code == 404
+    assert app.get_deck_meta(777) is None
+    assert app.ref('deck_meta/777').get() is None
+
+
+def test_editing_a_missing_deck_leaves_no_deck_behind(app):
+    assert app.write_flashcard_edits(777, {'0': {'front': 'f'}}) == []
+    assert app.ref('decks/777').get() is None
+    assert app.ref('deck_changes/777').get() is None
+
+
+def test_a_write_that_does_not_happen_keeps_the_deck_version(app, deck_id):
+    app.add_flashcard(deck_id, {'title': 't', 'front': 'f', 'back': 'b'})
+    version = app.ref(f'decks/{deck_id}/version').get()
+
+    assert app.delete_flashcard(deck_id, 99) is None
+    assert app.write_flashcard_edits(deck_id, {'99': {'front': 'f'}}) == []
+    assert app.ref(f'decks/{deck_id}/version').get() == version
+    # the released revisions are still logged, so syncing clients do not wait on them
+    assert len(app.ref(f'deck_changes/{deck_id}').get()) == 3
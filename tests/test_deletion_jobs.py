@@ -0,0 +1,56 @@
+import pytest
+
+DAY_MS = 24 * 3600 * 1000
+
+
+@pytest.fixture()
+def app(app, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(app.deletion_executor, 'submit',
+                        lambda fn, *args: submitted.append(args))
+    app.submitted = submitted
+    return app
+
+
+def job(status, updated_at, finished_at=None):
+    record = {'kind': 'user', 'user_id': 'u', 'status': status, 'step': 0, 'steps': 1,
+              'attempts': 1, 'created_at': updated_at, 'updated_at': updated_at}
+    if finished_at is not None:
+        record['finished_at'] = finished_at
+    return record
+
+
+def test_resume_takes_over_stale_jobs_only(app):
+    now = app.now_ms()
+    app.ref('deletion_jobs').set({
+        'stale': job('running', now - DAY_MS),
+        'queued': job('queued', now - DAY_MS),
+        'active': job('running', now),
+        'done': job('succeeded', now - DAY_MS, now - DAY_MS),
+    })
+    app.resume_deletion_jobs()
+    assert sorted(job_id for job_id, in app.submitted) == ['queued', 'stale']
+
+
+def test_resume_drops_a_batch_of_expired_jobs(app, monkeypatch):
+    monkeypatch.setattr(app, 'DELETION_RESUME_BATCH', 2)
+    now = app.now_ms()
+    old = now - 30 * DAY_MS
+    app.ref('deletion_jobs').set({
+        'old1': job('succeeded', old, old),
+        'old2': job('failed', old, old + 1),
+        'old3': job('succeeded', old, old + 2),
+        'recent': job('succeeded', now, now),
+    })
+    app.resume_deletion_jobs()
+    assert sorted(app.ref('deletion_jobs').get()) == ['old3', 'recent']
+
+
+def test_deleting_a_user_covers_decks_removed_from_their_list(app, user_id):
+    listed = app.create_deck(user_id, 'Listed')
+    app.add_deck_to_user(user_id, listed)
+    unlisted = app.create_deck(user_id, 'Unlisted')
+    shared = app.create_deck('other', 'Shared')
+    app.add_deck_to_user(user_id, shared)
+    job_id = app.delete_user(user_id)
+    assert app.ref(f'deletion_jobs/{job_id}/decks').get() == sorted([listed, unlisted])
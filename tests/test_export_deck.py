@@ -0,0 +1,12 @@
+import gzip
+
+
+def test_gzip_export_is_flushed_per_page(app, client, user_id, deck_id, monkeypatch):
+    monkeypatch.setattr(app, 'EXPORT_PAGE_SIZE', 2)
+    app.add_flashcards(deck_id, [{'title': 't', 'front': f'Q{i}', 'back': 'A'} for i in range(5)])
+    response = client.get(
+        f'/export-deck?user_id={user_id}&deck_id={deck_id}&format=ndjson&gzip=1', buffered=False)
+    chunks = list(response.response)
+    # one chunk per page, then the end of the gzip stream
+    assert len([chunk for chunk in chunks if chunk]) == 4
+    assert gzip.decompress(b''.join(chunks)).count(b'\n') == 5
@@ -0,0 +1,33 @@
+import threading
+
+
+def test_job_started_elsewhere_is_reported_from_its_record(app, client, user_id):
+    job = app.generation_queue.submit(user_id, 'bench', lambda: [{'front': 'f'}])
+    job.done.wait(5)
+    # as seen by a worker that did not run the job
+    app.generation_queue._jobs.clear()
+
+    body = client.get(f'/get-job?user_id={user_id}&job_id={job.id}').get_json()
+    assert body['status'] == 'succeeded' and body['result'] == [{'front': 'f'}]
+    assert client.get(f'/get-job?user_id=other&job_id={job.id}').status_code == 404
+
+
+def test_job_cancelled_elsewhere_stays_cancelled(app, user_id):
+    release = threading.Event()
+    job = app.generation_queue.submit(user_id, 'bench', lambda: release.wait(5) and [])
+    record = app.ref(f'generation_jobs/{job.id}')
+    record.update({'status': 'cancelled'})
+    release.set()
+    job.done.wait(5)
+
+    assert record.get()['status'] == 'cancelled'
+    assert job.status == 'cancelled'
+
+
+def test_long_poll_is_capped(app, client, user_id, monkeypatch):
+    monkeypatch.setattr(app, 'GENERATION_JOB_WAIT_LIMIT', 0.05)
+    release = threading.Event()
+    job = app.generation_queue.submit(user_id, 'bench', lambda: release.wait(5) and [])
+    body = client.get(f'/get-job?user_id={user_id}&job_id={job.id}&wait=30').get_json()
+    release.set()
+    assert body['status'] in ('queued', 'running')
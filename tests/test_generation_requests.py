@@ -0,0 +1,46 @@
+import pytest
+
+
+@pytest.mark.parametrize('n', [None, 'five', 0, -2, 1.5, True])
+@pytest.mark.parametrize('route', ['/generate-flashcards', '/submit-generation-job'])
+def test_count_must_be_a_positive_integer(client, user_id, route, n):
+    body = {'user_id': user_id, 'topic': 'Topic'}
+    if n is not None:
+        body['n'] = n
+    response = client.post(route, json=body)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('route', ['/generate-flashcards', '/submit-generation-job'])
+def test_count_is_capped(app, client, user_id, route, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_GENERATED_FLASHCARDS', 3)
+    response = client.post(route, json={'user_id': user_id, 'topic': 'Topic', 'n': 4})
+    assert response.status_code == 400 and '3' in response.get_json()['error']
+
+
+def test_count_is_capped_on_the_asgi_route(app, user_id, monkeypatch):
+    asgi = pytest.importorskip('asgi')
+    testclient = pytest.importorskip('starlette.testclient')
+
+    async def user_exists(requested):
+        return True
+
+    monkeypatch.setattr(asgi, 'verify_user_exists', user_exists)
+    monkeypatch.setattr(app, 'MAX_GENERATED_FLASHCARDS', 3)
+    response = testclient.TestClient(asgi.app).post(
+        '/generate-flashcards', json={'user_id': user_id, 'topic': 'Topic', 'n': 4})
+    assert response.status_code == 400
+
+
+def test_numeric_string_count_is_accepted(client, user_id):
+    response = client.post('/generate-flashcards', json={
+        'user_id': user_id, 'topic': 'Topic', 'n': '2', 'fresh': True})
+    assert response.status_code == 200 and len(response.get_json()['flashcards']) == 2
+
+
+def test_stream_flag_must_be_set_to_stream(client, user_id):
+    body = {'user_id': user_id, 'topic': 'Topic', 'n': 1, 'fresh': True}
+    response = client.post('/generate-flashcards?stream=0', json=body)
+    assert response.mimetype == 'application/json' and 'flashcards' in response.get_json()
+    response = client.post('/generate-flashcards?stream=true', json=body)
+    assert response.mimetype == 'application/x-ndjson'
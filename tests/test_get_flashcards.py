@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture()
+def deck(app, client, deck_id, monkeypatch):
+    app.add_flashcards(deck_id, [{'title': 't', 'front': str(i), 'back': 'b'} for i in range(5)])
+    monkeypatch.setattr(app, 'FLASHCARDS_PAGE_LIMIT', 3)
+    return client, deck_id
+
+
+@pytest.mark.parametrize('limit', ['-3', '0', 'ten', ''])
+def test_invalid_limit_is_rejected(deck, limit):
+    client, deck_id = deck
+    assert client.get(f'/get-flashcards?deck_id={deck_id}&limit={limit}').status_code == 400
+
+
+def test_limit_is_capped(deck):
+    client, deck_id = deck
+    body = client.get(f'/get-flashcards?deck_id={deck_id}&limit=1000000').get_json()
+    assert len(body['flashcards']) == 3 and body['next_after'] is not None
@@ -0,0 +1,57 @@
+import threading
+
+from id_allocator import BlockAllocator
+
+
+class Counter:
+
+    def __init__(self):
+        self.value = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def reserve(self, count):
+        with self.lock:
+            self.calls += 1
+            first = self.value
+            self.value += count
+            return first
+
+
+def test_ids_come_from_one_reservation_per_block():
+    counter = Counter()
+    allocator = BlockAllocator(counter.reserve, block_size=4)
+    assert [allocator.next_id() for _ in range(10)] == list(range(10))
+    assert counter.calls == allocator.reservations == 3
+
+
+def test_allocators_sharing_a_counter_never_hand_out_the_same_id():
+    counter = Counter()
+    allocators = [BlockAllocator(counter.reserve, block_size=3) for _ in range(2)]
+    ids = [allocators[i % 2].next_id() for i in range(20)]
+    assert len(set(ids)) == 20
+
+
+def test_concurrent_callers_get_unique_ids():
+    allocator = BlockAllocator(Counter().reserve, block_size=5)
+    ids = []
+
+    def take():
+        for _ in range(100):
+            ids.append(allocator.next_id())
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == list(range(400))
+
+
+def test_reset_drops_the_rest_of_the_block():
+    counter = Counter()
+    allocator = BlockAllocator(counter.reserve, block_size=10)
+    allocator.next_id()
+    counter.value = 100
+    allocator.reset()
+    assert allocator.next_id() == 100
@@ -0,0 +1,40 @@
+from metrics import Registry
+
+
+def test_restore_returns_every_metric_to_the_snapshot():
+    registry = Registry()
+    requests = registry.counter('requests', 'Requests.', ['route'])
+    duration = registry.histogram('duration', 'Duration.', buckets=(1, 2))
+    requests.inc(route='/a')
+    duration.observe(0.5)
+    snapshot = registry.snapshot()
+    rendered = registry.render()
+
+    requests.inc(route='/a')
+    requests.inc(route='/b')
+    duration.observe(1.5)
+    registry.restore(snapshot)
+    assert registry.render() == rendered
+    assert requests.value(route='/a') == 1 and duration.count() == 1
+
+
+def test_snapshots_are_copies():
+    registry = Registry()
+    duration = registry.histogram('duration', 'Duration.', buckets=(1,))
+    duration.observe(0.5)
+    snapshot = registry.snapshot()
+    duration.observe(0.5)
+    registry.restore(snapshot)
+    duration.observe(0.5)
+    assert registry.snapshot() != snapshot
+    registry.restore(snapshot)
+    assert duration.count() == 1
+
+
+def test_metrics_missing_from_the_snapshot_are_emptied():
+    registry = Registry()
+    snapshot = registry.snapshot()
+    requests = registry.counter('requests', 'Requests.')
+    requests.inc()
+    registry.restore(snapshot)
+    assert requests.value() == 0
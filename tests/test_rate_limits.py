@@ -0,0 +1,94 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+from jobs import OpenAIRateLimiter, RateLimitTimeout
+from rate_limits import UserRateLimiter, client_address
+
+
+def test_client_address_is_read_behind_the_trusted_proxies():
+    forwarded_for = '6.6.6.6, 1.2.3.4, 35.0.0.1'
+    assert client_address(forwarded_for, '10.0.0.1', 2) == '1.2.3.4'
+    assert client_address(forwarded_for, '10.0.0.1', 1) == '35.0.0.1'
+
+
+def test_client_address_falls_back_to_the_peer():
+    assert client_address(None, '10.0.0.1', 2) == '10.0.0.1'
+    assert client_address('1.2.3.4', '10.0.0.1', 2) == '10.0.0.1'
+    assert client_address('1.2.3.4, 35.0.0.1', '10.0.0.1', 0) == '10.0.0.1'
+
+
+def drained_limiter(max_wait):
+    limiter = OpenAIRateLimiter(requests_per_minute=600, tokens_per_minute=100000,
+                                max_wait=max_wait)
+    limiter.requests.adjust(limiter.requests.capacity)
+    return limiter
+
+
+def test_acquire_async_waits_without_blocking_the_loop():
+    limiter = drained_limiter(max_wait=5)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        ticker = asyncio.ensure_future(tick())
+        await limiter.acquire_async(10)
+        ticker.cancel()
+
+    asyncio.run(main())
+    assert len(ticks) > 2
+
+
+def test_acquire_async_gives_up_after_max_wait():
+    limiter = drained_limiter(max_wait=0.01)
+    with pytest.raises(RateLimitTimeout):
+        asyncio.run(limiter.acquire_async(10))
+
+
+def test_take_refills_at_the_rate_up_to_the_burst():
+    limit = (60, 5)
+    assert UserRateLimiter._take(None, limit, 1, 100.0) == (4, 0)
+    assert UserRateLimiter._take((0, 98.0), limit, 1, 100.0) == (1, 0)
+    assert UserRateLimiter._take((4, 0.0), limit, 1, 100.0) == (4, 0)
+    assert UserRateLimiter._take((0.5, 100.0), limit, 1, 100.0) == (0.5, 0.5)
+    # a cost above the burst could never be met, so it takes the whole bucket
+    assert UserRateLimiter._take(None, limit, 9, 100.0) == (0, 0)
+
+
+def test_in_memory_buckets_throttle_per_user():
+    limiter = UserRateLimiter({'write': (60, 2)})
+    assert [limiter.check('a', 'write') for _ in range(2)] == [0, 0]
+    assert limiter.check('a', 'write') > 0
+    assert limiter.check('b', 'write') == 0
+    assert limiter.check('a', 'read') == 0
+
+
+def test_idle_in_memory_buckets_are_dropped():
+    limiter = UserRateLimiter({'write': (60000, 1)})
+    limiter.prune_every = 2
+    limiter.check('a', 'write')
+    time.sleep(0.01)
+    limiter.check('b', 'write')
+    assert list(limiter._buckets) == ['write:b']
+
+
+def take_all(path):
+    limiter = UserRateLimiter({'generation': (1, 3)}, path=path, timeout=5)
+    return sum(1 for _ in range(3) if limiter.check('u', 'generation') == 0)
+
+
+def test_sqlite_buckets_are_shared_between_processes(tmp_path):
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip('needs fork')
+    path = str(tmp_path / 'limits.db')
+    UserRateLimiter({}, path=path)
+    with multiprocessing.get_context('fork').Pool(2) as pool:
+        allowed = pool.map(take_all, [path, path])
+    assert sum(allowed) == 3
+    assert take_all(path) == 0
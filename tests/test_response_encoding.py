@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+
+import response_encoding
+from response_encoding import JSON_MIMETYPE, MSGPACK_MIMETYPE, choose_encoding, \
+    choose_mimetype, compact, encode_payload, parse_accept
+
+
+def test_parse_accept_reads_quality_values():
+    assert parse_accept('application/json;q=0.5, application/msgpack, text/html;q=0') == {
+        'application/json': 0.5, 'application/msgpack': 1.0}
+    assert parse_accept('gzip;q=oops') == {}
+    assert parse_accept(None) == {}
+
+
+def test_compact_drops_empty_fields_and_stringifies_keys():
+    assert compact({1: {'front': 'f', 'front_image_url': '', 'back': None}, 'l': [{'a': ''}]}) \
+        == {'1': {'front': 'f'}, 'l': [{}]}
+
+
+def test_choose_mimetype_prefers_the_higher_quality(monkeypatch):
+    monkeypatch.setattr(response_encoding, 'msgpack', object())
+    assert choose_mimetype('application/x-msgpack') == MSGPACK_MIMETYPE
+    assert choose_mimetype('application/json, application/msgpack;q=0.9') == JSON_MIMETYPE
+    assert choose_mimetype('*/*') == JSON_MIMETYPE
+    assert choose_mimetype(None) == JSON_MIMETYPE
+
+
+def test_choose_mimetype_without_msgpack_is_json(monkeypatch):
+    monkeypatch.setattr(response_encoding, 'msgpack', None)
+    assert choose_mimetype('application/msgpack') == JSON_MIMETYPE
+
+
+def test_choose_encoding_prefers_brotli_when_available(monkeypatch):
+    monkeypatch.setattr(response_encoding, 'brotli', object())
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('gzip, br;q=0.5') == 'gzip'
+    monkeypatch.setattr(response_encoding, 'brotli', None)
+    assert choose_encoding('br') is None
+    assert choose_encoding('gzip, br') == 'gzip'
+
+
+def test_small_bodies_are_not_compressed():
+    body, mimetype, encoding = encode_payload({'a': 1}, None, 'gzip', min_size=1024)
+    assert (json.loads(body), mimetype, encoding) == ({'a': 1}, JSON_MIMETYPE, None)
+
+
+def test_large_bodies_are_compressed():
+    payload = {'flashcards': ['card'] * 1000}
+    body, _, encoding = encode_payload(payload, None, 'gzip', min_size=1024)
+    assert encoding == 'gzip' and json.loads(gzip.decompress(body)) == payload
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip('msgpack')
+    body, mimetype, _ = encode_payload({'flashcards': {0: {'front': 'f', 'back_image_url': ''}}},
+                                       'application/msgpack')
+    assert mimetype == MSGPACK_MIMETYPE
+    assert msgpack.unpackb(body) == {'flashcards': {'0': {'front': 'f'}}}
@@ -0,0 +1,49 @@
+import pytest
+
+from scheduler import DAY_MS, INITIAL_EASE, MINIMUM_EASE, deck_key_range, parse_review_key, \
+    review_key, schedule
+
+NOW = 1_700_000_000_000
+
+
+def test_new_card_passing_review_is_due_in_a_day():
+    state = schedule(None, 4, NOW)
+    assert state['interval'] == 1 and state['repetitions'] == 1
+    assert state['due'] == NOW + DAY_MS
+    assert state['ease'] == INITIAL_EASE
+
+
+def test_intervals_go_one_day_six_days_then_grow_by_the_ease():
+    state = schedule(None, 5, NOW)
+    state = schedule(state, 5, NOW)
+    assert state['interval'] == 6
+    ease = state['ease']
+    state = schedule(state, 5, NOW)
+    assert state['interval'] == round(6 * ease)
+
+
+@pytest.mark.parametrize('grade, change', [(5, 0.1), (4, 0.0), (3, -0.14)])
+def test_ease_follows_the_grade(grade, change):
+    assert schedule(None, grade, NOW)['ease'] == pytest.approx(INITIAL_EASE + change)
+
+
+def test_lapse_restarts_the_card_and_keeps_the_ease():
+    state = schedule(schedule(schedule(None, 5, NOW), 5, NOW), 5, NOW)
+    lapsed = schedule(state, 1, NOW)
+    assert lapsed['interval'] == 1 and lapsed['repetitions'] == 0
+    assert lapsed['lapses'] == 1 and lapsed['ease'] == state['ease']
+
+
+def test_ease_never_drops_below_the_minimum():
+    state = None
+    for _ in range(20):
+        state = schedule(state, 3, NOW)
+    assert state['ease'] == MINIMUM_EASE
+
+
+def test_review_keys_round_trip_and_fall_in_their_deck_range():
+    key = review_key(12, 7)
+    assert parse_review_key(key) == (12, 7)
+    start, end = deck_key_range(12)
+    assert start <= key <= end
+    assert not start <= review_key(123, 0) <= end
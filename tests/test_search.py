@@ -0,0 +1,42 @@
+from search import MAX_QUERY_TERMS, index_updates, query_terms, rank, term_weights, tokenize
+
+
+def test_tokenize_drops_stopwords_and_one_letter_words():
+    assert tokenize('What is the Krebs cycle? A _cycle_ of x') == ['krebs', 'cycle', 'cycle']
+    assert tokenize(None) == []
+
+
+def test_term_weights_sum_field_weights():
+    weights = term_weights({'title': 'Cell', 'front': 'cell wall', 'back': 'wall of a cell'})
+    assert weights == {'cell': 3 + 2 + 1, 'wall': 2 + 1}
+
+
+def test_query_terms_are_unique_and_capped():
+    assert query_terms('cell cell wall') == ['cell', 'wall']
+    words = ' '.join(f'term{i}' for i in range(MAX_QUERY_TERMS + 3))
+    assert len(query_terms(words)) == MAX_QUERY_TERMS
+
+
+def test_index_updates_write_only_changed_postings():
+    updates = index_updates('u', '1:2', {'cell': 3, 'wall': 1}, {'cell': 3, 'membrane': 2})
+    assert updates == {
+        'search_index/u/wall/1:2': None,
+        'search_index/u/membrane/1:2': 2,
+        'search_docs/u/1:2': {'cell': 3, 'membrane': 2},
+    }
+
+
+def test_index_updates_unindex_a_document():
+    updates = index_updates('u', '1:2', {'cell': 3}, {})
+    assert updates == {'search_index/u/cell/1:2': None, 'search_docs/u/1:2': None}
+
+
+def test_rank_prefers_documents_matching_more_terms():
+    ranked = rank({'cell': {'a': 6, 'b': 1}, 'wall': {'b': 1}})
+    assert [key for key, _ in ranked] == ['b', 'a']
+
+
+def test_rank_scales_down_common_terms():
+    ranked = dict(rank({'rare': {'a': 1}, 'common': {'b': 1, 'c': 1, 'd': 1}}))
+    assert ranked['a'] > ranked['b'] == ranked['c']
+    assert rank({'empty': {}}) == []
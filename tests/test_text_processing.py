@@ -0,0 +1,50 @@
+from text_processing import NearDuplicateFilter, allocate, count_tokens, split_text
+
+PARAGRAPHS = [' '.join(f'word{p}x{i}.' for i in range(30)) for p in range(6)]
+TEXT = '\n\n'.join(PARAGRAPHS)
+
+
+def test_split_text_keeps_every_chunk_within_the_budget():
+    chunks = split_text(TEXT, 80)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 80 for chunk in chunks)
+    assert ' '.join(chunks).split() == TEXT.split()
+
+
+def test_split_text_packs_whole_paragraphs_together():
+    assert split_text(TEXT, 10_000) == [TEXT]
+    chunks = split_text('one.\n\ntwo.\n\nthree.', 10_000)
+    assert chunks == ['one.\n\ntwo.\n\nthree.']
+
+
+def test_split_text_breaks_an_overlong_sentence_into_words():
+    sentence = ' '.join(['word'] * 200)
+    chunks = split_text(sentence, 20)
+    assert all(count_tokens(chunk) <= 20 for chunk in chunks)
+    assert ' '.join(chunks).split() == sentence.split()
+
+
+def test_split_text_of_blank_text_is_empty():
+    assert split_text('  \n\n ', 50) == []
+
+
+def test_allocate_is_proportional_to_the_weights():
+    assert allocate(10, [1, 1]) == [5, 5]
+    assert allocate(6, [1, 2]) == [2, 4]
+    assert sum(allocate(7, [3, 1, 5])) == 7
+
+
+def test_allocate_spaces_few_items_evenly():
+    assert allocate(2, [1, 1, 1, 1]) == [1, 0, 1, 0]
+
+
+def test_allocate_with_nothing_to_spread():
+    assert allocate(0, [1, 2]) == [0, 0]
+    assert allocate(3, [0, 0]) == [0, 0]
+
+
+def test_near_duplicate_filter_rejects_reworded_repeats():
+    seen = NearDuplicateFilter(threshold=0.8)
+    assert seen.add('What is the powerhouse of the cell?', 'The mitochondria')
+    assert not seen.add('what is the powerhouse of the cell', 'the mitochondria!')
+    assert seen.add('What is osmosis?', 'Diffusion of water across a membrane')
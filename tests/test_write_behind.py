@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from write_behind import WriteBehindBuffer
+
+
+class Store:
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    def flush(self, group, writes):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('write failed')
+        self.batches.append((group, dict(writes)))
+
+
+def test_writes_are_merged_per_key_with_the_last_winning():
+    store = Store()
+    buffer = WriteBehindBuffer(store.flush, window=60)
+    buffer.put('deck', 'a', 1)
+    buffer.put('deck', 'a', 2)
+    buffer.put('deck', 'b', 3)
+    buffer.put('other', 'a', 4)
+    assert buffer.pending('deck') == {'a': 2, 'b': 3}
+    buffer.flush()
+    assert sorted(store.batches) == [('deck', {'a': 2, 'b': 3}), ('other', {'a': 4})]
+    assert buffer.stats()['merged'] == 1 and buffer.stats()['pending'] == 0
+
+
+def test_a_full_group_is_flushed_by_the_writer():
+    store = Store()
+    buffer = WriteBehindBuffer(store.flush, window=60, max_pending=2)
+    buffer.put('deck', 'a', 1)
+    assert store.batches == []
+    buffer.put('deck', 'b', 2)
+    assert store.batches == [('deck', {'a': 1, 'b': 2})]
+
+
+def test_a_failed_batch_is_retried_under_newer_writes():
+    store = Store(failures=1)
+    buffer = WriteBehindBuffer(store.flush, window=60)
+    buffer.put('deck', 'a', 1)
+    buffer.put('deck', 'b', 1)
+    with pytest.raises(RuntimeError):
+        buffer.flush('deck')
+    buffer.put('deck', 'a', 2)
+    assert buffer.pending('deck') == {'a': 2, 'b': 1}
+    buffer.flush('deck')
+    assert store.batches == [('deck', {'a': 2, 'b': 1})]
+    assert buffer.stats()['failures'] == 1
+
+
+def test_a_batch_is_dropped_after_max_attempts():
+    store = Store(failures=3)
+    dropped = []
+    buffer = WriteBehindBuffer(store.flush, window=60, max_attempts=2,
+                               on_drop=lambda group, writes, error: dropped.append(writes))
+    buffer.put('deck', 'a', 1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            buffer.flush('deck')
+    assert dropped == [{'a': 1}] and buffer.pending('deck') == {}
+    assert buffer.stats()['dropped'] == 1
+    # a later write starts over with a full set of attempts
+    buffer.put('deck', 'b', 1)
+    with pytest.raises(RuntimeError):
+        buffer.flush('deck')
+    assert buffer.pending('deck') == {'b': 1}
+
+
+def test_retries_back_off():
+    attempts = []
+    gave_up = threading.Event()
+
+    def flush(group, writes):
+        attempts.append(time.monotonic())
+        raise RuntimeError('write failed')
+
+    buffer = WriteBehindBuffer(flush, window=0.05, max_attempts=3,
+                               on_drop=lambda group, writes, error: gave_up.set())
+    buffer.put('deck', 'a', 1)
+    assert gave_up.wait(5)
+    gaps = [later - earlier for earlier, later in zip(attempts, attempts[1:])]
+    assert len(attempts) == 3 and gaps[0] >= 0.1 and gaps[1] >= 0.2
+    buffer.close()
+
+
+def test_flushes_of_a_group_do_not_overlap():
+    started = threading.Event()
+    release = threading.Event()
+    batches = []
+
+    def flush(group, writes):
+        batches.append(dict(writes))
+        if len(batches) == 1:
+            started.set()
+            release.wait(5)
+
+    buffer = WriteBehindBuffer(flush, window=60)
+    buffer.put('deck', 'a', 1)
+    first = threading.Thread(target=buffer.flush, args=('deck',))
+    first.start()
+    assert started.wait(5)
+    buffer.put('deck', 'a', 2)
+    # the batch being written still shows under the newer write
+    assert buffer.pending('deck') == {'a': 2}
+    second = threading.Thread(target=buffer.flush, args=('deck',))
+    second.start()
+    time.sleep(0.05)
+    assert len(batches) == 1
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert batches == [{'a': 1}, {'a': 2}]
+
+
+def test_discard_drops_a_failing_batch_in_flight():
+    started = threading.Event()
+    release = threading.Event()
+
+    def flush(group, writes):
+        started.set()
+        release.wait(5)
+        raise RuntimeError('write failed')
+
+    buffer = WriteBehindBuffer(flush, window=60)
+    buffer.put('deck', 'a', 1)
+    errors = []
+
+    def flush_deck():
+        try:
+            buffer.flush('deck')
+        except RuntimeError as e:
+            errors.append(e)
+
+    flusher = threading.Thread(target=flush_deck)
+    flusher.start()
+    assert started.wait(5)
+    buffer.discard('deck')
+    release.set()
+    flusher.join(5)
+    assert errors and buffer.pending('deck') == {}
@@ -0,0 +1,173 @@
+import re
+
+_encoding = None
+_encoding_loaded = False
+
+# rough size of an English token when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+
+
+def _get_encoding():
+    """
+    Loads the tiktoken encoding on first use; loading it takes long enough to matter at startup.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _pieces(text, max_tokens):
+    """
+    Breaks text into paragraphs, then sentences, then words, until every piece fits in max_tokens.
+    """
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            words = []
+            words_tokens = 0
+            for word in sentence.split():
+                word_tokens = count_tokens(word) + 1
+                if words and words_tokens + word_tokens > max_tokens:
+                    yield ' '.join(words)
+                    words = []
+                    words_tokens = 0
+                words.append(word)
+                words_tokens += word_tokens
+            if words:
+                yield ' '.join(words)
+
+
+def split_text(text, max_tokens):
+    """
+    Splits text into chunks of at most max_tokens tokens, packing whole paragraphs
+    (or sentences, for very long paragraphs) together where they fit.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _pieces(text, max_tokens):
+        piece_tokens = count_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def allocate(n, weights):
+    """
+    Spreads n items across buckets in proportion to weights. Item k goes to the bucket
+    covering position (k + 0.5) / n of the total weight, so when there are fewer items
+    than buckets they are spaced evenly instead of piling into the first buckets.
+    """
+    counts = [0] * len(weights)
+    total = sum(weights)
+    if n <= 0 or total <= 0:
+        return counts
+    bucket = 0
+    boundary = weights[0]
+    for k in range(n):
+        position = (k + 0.5) / n * total
+        while position > boundary and bucket < len(weights) - 1:
+            bucket += 1
+            boundary += weights[bucket]
+        counts[bucket] += 1
+    return counts
+
+
+def spread(count, k):
+    """
+    Returns k positions spaced evenly over range(count), or all of them when count <= k.
+    """
+    if count <= k:
+        return list(range(count))
+    return [int((i + 0.5) * count / k) for i in range(k)]
+
+
+def deck_reference(name, description, flashcards, total, budget):
+    """
+    Describes a deck for a generation prompt: its name and description, then one line per
+    flashcard, "front => back". When the lines do not all fit in budget tokens, a subset
+    spread evenly over flashcards is kept, so the reference still covers the whole deck.
+    """
+    header = [f"Deck: {name or 'Untitled'}"]
+    if description:
+        header.append(f"Description: {description}")
+    lines = [f"- {flashcard.get('front', '')} => {flashcard.get('back', '')}"
+             for flashcard in flashcards]
+    costs = [count_tokens(line) + 1 for line in lines]
+    available = budget - count_tokens("\n".join(header)) - 16
+    kept = len(lines)
+    cost = sum(costs)
+    while kept and cost > available:
+        kept = min(kept - 1, kept * max(available, 0) // cost)
+        cost = sum(costs[i] for i in spread(len(lines), kept))
+    chosen = [lines[i] for i in spread(len(lines), kept)]
+    header.append(f"Example cards ({len(chosen)} of {max(total, len(chosen))}):")
+    return "\n".join(header + chosen)
+
+
+def _shingles(text):
+    return set(_WORD.findall(text.lower()))
+
+
+def is_near_duplicate(a, b, threshold=0.8):
+    """
+    Compares two sets of words by Jaccard similarity.
+    """
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= threshold
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the flashcards seen so far and rejects ones whose front and back
+    are nearly identical to an earlier card.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self._seen = []
+
+    def add(self, front, back):
+        """
+        Returns True and remembers the card if it is not a near-duplicate of a previous one.
+        """
+        words = _shingles(f"{front} {back}")
+        for seen in self._seen:
+            if is_near_duplicate(words, seen, self.threshold):
+                return False
+        self._seen.append(words)
+        return True
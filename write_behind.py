@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+
+
+class WriteBehindBuffer:
+    """
+    Holds writes in memory, merged per (group, key) with the last write winning, and
+    hands each group's pending writes to flush(group, {key: value}) in one call. A group
+    is flushed window seconds after its oldest pending write, or straight away by the
+    writer that brings it to max_pending writes.
+
+    Flushes of one group never overlap, so a later batch cannot be overtaken by an
+    earlier one. A batch whose flush raises is merged back under any newer writes and
+    retried after a backoff that doubles from window with each failure; after
+    max_attempts failures in a row it is dropped and handed to on_drop(group, writes,
+    error). The timer thread is started on first use, in the process that uses the
+    buffer, so a buffer created before a fork works in the child.
+    """
+
+    def __init__(self, flush, window=0.5, max_pending=50, max_attempts=5, on_drop=None):
+        self._flush = flush
+        self._on_drop = on_drop
+        self.window = window
+        self.max_pending = max(1, max_pending)
+        self.max_attempts = max(1, max_attempts)
+        self._pending = {}
+        # when each group with pending writes is flushed by the timer thread
+        self._due = {}
+        self._attempts = {}
+        self._flushing = {}
+        self._discarded = set()
+        self._group_locks = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.writes = 0
+        self.merged = 0
+        self.flushes = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def put(self, group, key, value):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write-behind buffer is closed.")
+            self._start_thread()
+            writes = self._pending.setdefault(group, {})
+            self.writes += 1
+            if key in writes:
+                self.merged += 1
+            writes[key] = value
+            self._due.setdefault(group, time.monotonic() + self.window)
+            full = len(writes) >= self.max_pending
+            self._wakeup.notify()
+        if full:
+            self.flush(group)
+
+    def pending(self, group):
+        """
+        Returns {key: value} of the group's writes that are not yet flushed, including a
+        batch being flushed right now, for overlaying on reads.
+        """
+        with self._lock:
+            return {**self._flushing.get(group, {}), **self._pending.get(group, {})}
+
+    def discard(self, group):
+        """
+        Drops the group's pending writes, e.g. because what they write to is being
+        deleted. A batch being flushed right now is not stopped, but is not retried.
+        """
+        with self._lock:
+            self._pending.pop(group, None)
+            self._due.pop(group, None)
+            self._attempts.pop(group, None)
+            if group in self._flushing:
+                self._discarded.add(group)
+
+    def flush(self, group=None):
+        """
+        Flushes one group now, or every group. Raises if a flush fails; its writes stay
+        pending unless that was their last attempt.
+        """
+        with self._lock:
+            groups = [group] if group is not None else list(self._pending)
+        for group in groups:
+            self._flush_group(group)
+
+    def close(self):
+        """
+        Stops the timer thread and flushes everything still pending, e.g. at shutdown.
+        """
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            groups = list(self._pending)
+        for group in groups:
+            try:
+                self._flush_group(group)
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'pending': sum(len(writes) for writes in self._pending.values()),
+                    'writes': self.writes, 'merged': self.merged, 'flushes': self.flushes,
+                    'failures': self.failures, 'dropped': self.dropped}
+
+    def _start_thread(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _flush_group(self, group):
+        with self._lock:
+            group_lock = self._group_locks.setdefault(group, threading.Lock())
+        with group_lock:
+            with self._lock:
+                writes = self._pending.pop(group, None)
+                self._due.pop(group, None)
+                if not writes:
+                    return
+                self._flushing[group] = writes
+            try:
+                self._flush(group, writes)
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                    attempts = self._attempts.get(group, 0) + 1
+                    drop = group not in self._discarded and attempts >= self.max_attempts
+                    if group in self._discarded or drop:
+                        self._attempts.pop(group, None)
+                    else:
+                        self._attempts[group] = attempts
+                        self._pending[group] = {**writes, **self._pending.get(group, {})}
+                        self._due[group] = time.monotonic() + self.window * 2 ** attempts
+                    if drop:
+                        self.dropped += len(writes)
+                if drop and self._on_drop is not None:
+                    self._on_drop(group, writes, e)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing.pop(group, None)
+                    self._discarded.discard(group)
+            with self._lock:
+                self.flushes += 1
+                self._attempts.pop(group, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [group for group, due_at in self._due.items() if now >= due_at]
+                    if due:
+                        break
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+            for group in due:
+                try:
+                    self._flush_group(group)
+                except Exception:
+                    pass